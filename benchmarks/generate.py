@@ -0,0 +1,125 @@
+"""Generate synthetic Sqitch projects for benchmarking pgxsq.
+
+Projects vary along several axes: the number of changes and tags, the number
+of changes reworked after each tag, the size of deploy scripts, and the
+density of EXTSCHEMA placeholders in deploy scripts.
+"""
+
+import os
+import typing as t
+
+import pgxsq
+
+
+class Spec(t.NamedTuple):
+    """Shape of a synthetic Sqitch project."""
+
+    changes: int = 100
+    tags: int = 10
+    reworks: int = 0
+    script_size: int = 1024
+    extschema_every: int = 0
+
+    @property
+    def name(self):
+        return (
+            f'c{self.changes}-t{self.tags}-r{self.reworks}'
+            f'-s{self.script_size}-e{self.extschema_every}'
+        )
+
+
+# Scenarios covered by the benchmark suite.
+SCENARIOS = {
+    'many_changes': Spec(changes=5000, tags=10),
+    'many_tags': Spec(changes=1000, tags=500),
+    'heavy_rework': Spec(changes=200, tags=100, reworks=50),
+    'large_scripts': Spec(changes=10, tags=2, script_size=4 << 20),
+    'extschema': Spec(changes=200, tags=10, script_size=64 << 10,
+                      extschema_every=2),
+}
+
+
+def generate(root, spec, extschema='extschema'):
+    """Write a Sqitch project of shape `spec` to directory `root`.
+
+    Return the plan as a pgxsq.Project.
+    """
+    plan = _plan(spec)
+    project = pgxsq.Project('bench', plan, os.path.join(root, 'deploy'))
+
+    os.makedirs(project.deploy_dir, exist_ok=True)
+
+    with open(os.path.join(root, 'sqitch.conf'), 'w') as fp:
+        fp.write('[core]\n\tengine = pg\n')
+
+    with open(os.path.join(root, 'sqitch.plan'), 'w') as fp:
+        fp.write('%syntax-version=1.0.0\n%project=bench\n\n')
+        seen = set()
+        last_tag = None
+        for i, change in enumerate(plan):
+            deps = f' [{change.name}{last_tag}]' if change.name in seen else ''
+            seen.add(change.name)
+            if change.tags:
+                last_tag = change.tags[-1]
+            fp.write(
+                f'{change.name}{deps} 2023-01-01T00:00:00Z'
+                f' Bench <bench@example.com> # Change {i}\n'
+            )
+            for tag in change.tags:
+                fp.write(
+                    f'{tag} 2023-01-01T00:00:00Z'
+                    f' Bench <bench@example.com> # Tag {tag}\n'
+                )
+
+    for cs in project.changesets:
+        for cname, tag in cs.changes:
+            path = project.deploy_script_path(cname, tag)
+            with open(path, 'w') as fp:
+                _write_script(fp, cname, tag, spec, extschema)
+
+    return project
+
+
+def _plan(spec):
+    names = [f'change_{i:06d}' for i in range(spec.changes)]
+    per_tag = max(1, spec.changes // max(1, spec.tags))
+    plan = []
+    tagged = 0
+
+    for i, name in enumerate(names):
+        plan.append(pgxsq.Change(name, []))
+
+        if (i + 1) % per_tag == 0 and tagged < spec.tags:
+            tagged += 1
+            plan[-1].tags.append(f'@v{tagged}')
+
+            # Rework changes from earlier tags in the next changeset.
+            reworks = {
+                names[(i - j * 7) % (i + 1)]
+                for j in range(min(spec.reworks, i + 1))
+            }
+            plan.extend(pgxsq.Change(name, []) for name in sorted(reworks))
+
+    return plan
+
+
+def _write_script(fp, cname, tag, spec, extschema):
+    fp.write('BEGIN;\n\n')
+    fp.write(f'-- Deploy {cname}{tag}\n')
+
+    line = 0
+    size = 0
+
+    while size < spec.script_size:
+        line += 1
+        schema = extschema if spec.extschema_every and \
+            line % spec.extschema_every == 0 else 'public'
+        stmt = (
+            f'CREATE OR REPLACE FUNCTION {schema}.{cname}_{line}()\n'
+            f'  RETURNS text LANGUAGE sql\n'
+            f"  AS $$ SELECT 'BEGIN; {cname} {line}' $$;\n\n"
+        )
+        fp.write(stmt)
+        size += len(stmt)
+
+    fp.write('COMMIT;\n')
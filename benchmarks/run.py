@@ -0,0 +1,202 @@
+"""Benchmark pgxsq on synthetic Sqitch projects.
+
+Time read_project, plan parsing, Project.changesets_between,
+strip_transactions and write_extension separately for each scenario from
+generate.SCENARIOS, write the results as JSON, and optionally compare them to
+a saved baseline.  sqitch-plan is replaced by the stub in directory bin so
+that the benchmarks run offline.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import generate
+import pgxsq
+
+BIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--scenario',
+        action='append',
+        choices=sorted(generate.SCENARIOS),
+        help="run only this scenario (repeatable)",
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help="report the best time of this many runs",
+    )
+    parser.add_argument(
+        '--output',
+        help="write results as JSON to this file",
+    )
+    parser.add_argument(
+        '--baseline',
+        help="compare results to the JSON results in this file",
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help="fail if a timing exceeds its baseline by this fraction",
+    )
+    opts = parser.parse_args(args)
+
+    scenarios = opts.scenario or sorted(generate.SCENARIOS)
+    results = {
+        'python': platform.python_version(),
+        'pgxsq': pgxsq._version(),
+        'scenarios': {},
+    }
+
+    for name in scenarios:
+        timings = run_scenario(generate.SCENARIOS[name], opts.repeat)
+        results['scenarios'][name] = timings
+        for phase, seconds in timings.items():
+            print(f"{name:15} {phase:25} {seconds * 1000:10.1f} ms")
+
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+            fp.write('\n')
+
+    if opts.baseline:
+        with open(opts.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(results, baseline, opts.threshold)
+        for name, phase, current, previous in regressions:
+            print(
+                f"regression: {name} {phase}: {current * 1000:.1f} ms"
+                f" (baseline {previous * 1000:.1f} ms)",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+
+    return 0
+
+
+def run_scenario(spec, repeat):
+    """Generate a project of shape `spec` and time each pgxsq phase."""
+    timings = {}
+
+    def record(phase, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[phase] = best
+
+    with tempfile.TemporaryDirectory(prefix='pgxsq-bench-') as root, \
+            _chdir(root), _path(BIN):
+        generate.generate(root, spec)
+
+        record('read_project', pgxsq.read_project)
+        record('read_project[sqitch]',
+               lambda: pgxsq.read_project(use_sqitch=True))
+
+        def parse_plan():
+            with open('sqitch.plan') as fp:
+                pgxsq._parse_plan(fp)
+
+        record('parse_plan', parse_plan)
+
+        # Trace the changesets from the plan, not from the cache that
+        # read_project() fills.
+        project = pgxsq.read_project()
+        record('changesets', lambda: list(project.changesets_between()))
+
+        scripts = {
+            project.deploy_script_path(cname, tag)
+            for cs in project.changesets
+            for cname, tag in cs.changes
+        }
+
+        bom = pgxsq._bom('utf-8')
+
+        def strip():
+            # Read scripts as Project.read_deploy_script() does.
+            for path in scripts:
+                with open(path, 'rb') as fp:
+                    if fp.read(len(bom)) != bom:
+                        fp.seek(0)
+                    chunks = iter(
+                        functools.partial(fp.read, pgxsq._BUFSIZE), b'',
+                    )
+                    for _ in pgxsq.strip_transactions(chunks):
+                        pass
+
+        record('strip_transactions', strip)
+
+        dest = os.path.join(root, 'ext')
+
+        def full_build():
+            shutil.rmtree(dest, ignore_errors=True)
+            pgxsq.write_extension(project, dest, 'extschema')
+
+        record('write_extension', full_build)
+        record('write_extension[noop]',
+               lambda: pgxsq.write_extension(project, dest, 'extschema'))
+
+    return timings
+
+
+def compare(results, baseline, threshold):
+    """Return timings that exceed their baseline by more than `threshold`."""
+    regressions = []
+
+    for name, timings in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name, {})
+        for phase, seconds in timings.items():
+            if phase in previous and \
+                    seconds > previous[phase] * (1 + threshold):
+                regressions.append((name, phase, seconds, previous[phase]))
+
+    return regressions
+
+
+@contextlib.contextmanager
+def _chdir(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+@contextlib.contextmanager
+def _path(bindir):
+    """Prepend `bindir` to PATH and make pgxsq importable by the stub."""
+    old = dict(os.environ)
+    pkgdir = os.path.dirname(os.path.abspath(pgxsq.__file__))
+    os.environ['PATH'] = os.pathsep.join([bindir, old.get('PATH', '')])
+    os.environ['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [pkgdir, old.get('PYTHONPATH')]),
+    )
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(old)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
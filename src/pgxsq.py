@@ -1,22 +1,41 @@
+import array
 import collections
+import collections.abc
+import contextlib
 import functools
+import hashlib
+import itertools
+import marshal
 import os
 import os.path
 import re
+import shutil
+import struct
 import subprocess
+import tempfile
+import threading
+import time
 import typing as t
 
 
 def main(args=None):
     import argparse
-    import importlib.metadata
     import sys
 
+    if args is None:
+        args = sys.argv[1:]
+
+    if args[:1] == ['build']:
+        return _build_main(args[1:])
+
+    if args[:1] == ['graph']:
+        return _graph_main(args[1:])
+
     def die(msg):
         print(f"error: {msg}", file=sys.stderr)
         raise SystemExit(1)
 
-    version = importlib.metadata.version(__name__)
+    version = _version()
 
     parser = argparse.ArgumentParser(
         prog=__name__,
@@ -30,6 +49,8 @@ def main(args=None):
             EXTSCHEMA so that Sqitch can deploy syntactically valid changes.
             This also requires a matching schema on search_path in target
             database.  pgxsq substitutes @extschema@ for EXTSCHEMA.
+
+            Run "%(prog)s build --help" for building multiple projects.
             """,
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
@@ -42,126 +63,3669 @@ def main(args=None):
         '--extschema',
         help="replace this substring with @extschema@",
     )
+    parser.add_argument(
+        '--placeholder',
+        action='append',
+        default=[],
+        metavar='FROM=TO',
+        help="""
+            replace substring FROM with TO (repeatable, in addition to
+            pgxsq.placeholder in the Sqitch config)
+            """,
+    )
+    parser.add_argument(
+        '--skip-comments',
+        action='store_true',
+        help="do not replace placeholders in SQL comments",
+    )
+    parser.add_argument(
+        '--encoding',
+        default='utf-8',
+        metavar='ENC',
+        help="""
+            encoding of the deploy scripts (must be compatible with ASCII like
+            all Postgres server encodings)
+            """,
+    )
+    parser.add_argument(
+        '--validate-encoding',
+        action='store_true',
+        help="fail on deploy scripts that are not valid in the encoding",
+    )
+    parser.add_argument(
+        '--minify',
+        action='store_true',
+        help="""
+            remove comments and redundant whitespace outside of literals and
+            report the savings
+            """,
+    )
+    parser.add_argument(
+        '--minify-bodies',
+        action='store_true',
+        help="""
+            like --minify but also minify the bodies of SQL and PL/pgSQL
+            functions (changes line numbers in error messages)
+            """,
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="regenerate extension files even if they are up to date",
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help="""
+            only check that the extension files can be generated and report
+            all problems
+            """,
+    )
+    parser.add_argument(
+        '--archive',
+        metavar='FILE',
+        help="""
+            write extension files to archive FILE (.tar, .tar.gz, .tgz or
+            .zip) instead of DEST
+            """,
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help="generate up to N extension files concurrently",
+    )
+    parser.add_argument(
+        '--durable',
+        action='store_true',
+        help="sync generated files to disk before moving them into DEST",
+    )
+    since = parser.add_mutually_exclusive_group()
+    since.add_argument(
+        '--from',
+        dest='from_tag',
+        metavar='TAG',
+        help="generate only extension scripts for version TAG and later",
+    )
+    since.add_argument(
+        '--since',
+        metavar='TAG',
+        help="generate only extension scripts for versions after TAG",
+    )
+    parser.add_argument(
+        '--to',
+        metavar='TAG',
+        help="generate only extension scripts up to version TAG",
+    )
+    parser.add_argument(
+        '--install-scripts',
+        nargs='*',
+        metavar='TAG',
+        help="""
+            also generate install scripts for versions TAG (or all tagged
+            versions) that do not replay reworked changes
+            """,
+    )
+    parser.add_argument(
+        '--update-path',
+        action='append',
+        default=[],
+        metavar='FROM:TO',
+        help="""
+            also generate an update script from version FROM directly to
+            version TO (repeatable)
+            """,
+    )
+    parser.add_argument(
+        '--update-to-latest',
+        action='store_true',
+        help="""
+            also generate update scripts from every version directly to the
+            latest version
+            """,
+    )
+    parser.add_argument(
+        '--elide-reworks',
+        action='store_true',
+        help="""
+            leave reworked changes whose deploy scripts are unchanged out of
+            update scripts
+            """,
+    )
+    parser.add_argument(
+        '--git-ref',
+        nargs='?',
+        const='refs/tags/{tag}',
+        metavar='FORMAT',
+        help="""
+            read the deploy scripts of tagged versions from git revision
+            FORMAT, with {tag} replaced by the Sqitch tag name, instead of
+            reworked deploy scripts (FORMAT defaults to refs/tags/{tag})
+            """,
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help="rebuild on changes to the project until interrupted",
+    )
+    parser.add_argument(
+        '--poll',
+        type=float,
+        metavar='SECONDS',
+        help="in watch mode, poll for changes instead of using inotify",
+    )
+    parser.add_argument(
+        '--use-sqitch',
+        action='store_true',
+        help="read the plan with sqitch-plan instead of parsing it",
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="do not cache the parsed plan in $XDG_CACHE_HOME/pgxsq",
+    )
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help="print timings and sizes of the build to stderr",
+    )
+    parser.add_argument(
+        '--stats-json',
+        metavar='FILE',
+        help="write timings and sizes of the build as JSON to FILE (- for"
+             " stdout)",
+    )
     parser.add_argument(
         '--version', action='version', version=f"%(prog)s {version}",
     )
 
-    opts = parser.parse_args(args)
+    opts = parser.parse_args(args)
+
+    ranged = opts.from_tag or opts.since or opts.to
+
+    try:
+        placeholders = read_placeholders(extra=opts.placeholder)
+    except InvalidConfig as exc:
+        die(f"invalid config: {exc}")
+    except ValueError as exc:
+        die(str(exc))
+
+    placeholders = Substitution(placeholders, opts.skip_comments)
+
+    try:
+        _check_encoding(opts.encoding)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    extras = (
+        opts.install_scripts is not None or opts.update_path or
+        opts.update_to_latest
+    )
+
+    instrumented = opts.timings or opts.stats_json
+
+    if opts.watch and (
+        ranged or extras or instrumented or opts.archive or
+        opts.elide_reworks or opts.check or opts.git_ref
+    ):
+        parser.error(
+            "--watch cannot be combined with --from, --since, --to,"
+            " --install-scripts, --update-path, --update-to-latest,"
+            " --timings, --stats-json, --archive, --elide-reworks, --check,"
+            " --git-ref"
+        )
+
+    minify = opts.minify or opts.minify_bodies
+    stats = BuildStats() if instrumented or minify else None
+    cache_dir = None if opts.no_cache else _cache_dir()
+
+    if opts.watch:
+        def report(msg):
+            if isinstance(msg, Exception):
+                msg = f"error: {msg}"
+            print(msg, file=sys.stderr)
+
+        try:
+            watch(
+                opts.dest, opts.extschema, use_sqitch=opts.use_sqitch,
+                cache_dir=cache_dir, poll=opts.poll, report=report,
+                force=opts.force,
+                jobs=opts.jobs, durable=opts.durable,
+                placeholders=opts.placeholder,
+                skip_comments=opts.skip_comments, encoding=opts.encoding,
+                validate_encoding=opts.validate_encoding,
+                minify=opts.minify, minify_bodies=opts.minify_bodies,
+            )
+        except KeyboardInterrupt:
+            return
+
+    try:
+        project = read_project(
+            use_sqitch=opts.use_sqitch, stats=stats, cache_dir=cache_dir,
+        )
+    except (EmptyPlan, ProjectNotFound, InvalidConfig, InvalidPlan) as exc:
+        die(_error_message(exc))
+
+    if opts.git_ref:
+        project = project._replace(git=GitObjects(opts.git_ref))
+
+    index = project.tag_index()
+
+    def position(tag):
+        try:
+            return _tag_position(index, tag)
+        except ValueError as exc:
+            die(str(exc))
+
+    def resolve(tag):
+        try:
+            return _resolve_tag(project, index, tag)
+        except ValueError as exc:
+            die(str(exc))
+
+    changesets = None
+    extra = []
+
+    if ranged:
+        start = 0
+        stop = None
+
+        if opts.from_tag:
+            start = position(opts.from_tag)
+        elif opts.since:
+            start = position(opts.since) + 1
+
+        if opts.to and opts.to != 'HEAD':
+            stop = position(opts.to) + 1
+
+        with _phase(stats, 'changesets'):
+            changesets = list(project.changesets_between(start, stop))
+
+    if opts.install_scripts is not None:
+        tags = None
+
+        if opts.install_scripts:
+            tags = {resolve(tag) for tag in opts.install_scripts}
+
+        try:
+            extra = project.install_changesets(tags)
+        except ValueError as exc:
+            die(str(exc))
+
+        if changesets is not None:
+            versions = {cs.tag for cs in changesets}
+            extra = [cs for cs in extra if cs.tag in versions]
+
+    try:
+        extra.extend(_requested_updates(
+            project, index, opts.update_path, opts.update_to_latest,
+            changesets,
+        ))
+    except ValueError as exc:
+        die(str(exc))
+
+    if opts.check:
+        try:
+            problems = check_project(project, changesets, extra)
+        except OSError as exc:
+            die(_error_message(exc))
+        finally:
+            if project.git is not None:
+                project.git.close()
+
+        for problem in problems:
+            print(f"error: {problem}", file=sys.stderr)
+
+        if problems:
+            raise SystemExit(1)
+
+        return
+
+    elided = []
+
+    try:
+        if opts.archive:
+            write_archive(
+                project, opts.archive, opts.extschema, durable=opts.durable,
+                changesets=changesets, extra_changesets=extra,
+                placeholders=placeholders, stats=stats,
+                elide_reworks=opts.elide_reworks, elided=elided,
+                encoding=opts.encoding,
+                validate_encoding=opts.validate_encoding,
+                minify=opts.minify, minify_bodies=opts.minify_bodies,
+            )
+        else:
+            write_extension(
+                project, opts.dest, opts.extschema, force=opts.force,
+                jobs=opts.jobs, durable=opts.durable, changesets=changesets,
+                extra_changesets=extra, placeholders=placeholders,
+                stats=stats, elide_reworks=opts.elide_reworks,
+                elided=elided, encoding=opts.encoding,
+                validate_encoding=opts.validate_encoding,
+                minify=opts.minify, minify_bodies=opts.minify_bodies,
+            )
+    except (InvalidName, BuildError, ValueError, OSError) as exc:
+        die(_error_message(exc))
+    finally:
+        if project.git is not None:
+            project.git.close()
+
+    for e in elided:
+        cs = Changeset(e.fromtag, e.tag, [])
+        print(
+            f"{cs.filename(project.name)}: elided unchanged rework"
+            f" {e.change}{e.script}",
+            file=sys.stderr,
+        )
+
+    # The summary includes the minify report.
+    if opts.timings:
+        print(stats.summary(), file=sys.stderr)
+    elif minify and stats.counters['minify_bytes_in']:
+        print(_minify_report(stats.counters), file=sys.stderr)
+
+    if opts.stats_json:
+        import json
+
+        data = json.dumps(stats.as_dict(), indent=2, sort_keys=True)
+
+        if opts.stats_json == '-':
+            print(data)
+        else:
+            with open(opts.stats_json, 'w') as fp:
+                print(data, file=fp)
+
+
+def _tag_position(index, tag):
+    """Return the plan position of `tag` (with or without "@") in
+    Project.tag_index() `index`."""
+    try:
+        return index['@' + _removeprefix(tag, '@')]
+    except KeyError:
+        raise ValueError(f"unknown tag: {tag}") from None
+
+
+def _resolve_tag(project, index, tag):
+    """Resolve HEAD or a tag alias to the tag of a changeset."""
+    if tag == 'HEAD':
+        return ''
+    return project.plan[_tag_position(index, tag)].tags[0]
+
+
+def _requested_updates(
+    project, index, update_paths=(), update_to_latest=False, changesets=None,
+):
+    """Return the update changesets requested with FROM:TO `update_paths`
+    and `update_to_latest` (relative to `changesets` if not None)."""
+    paths = []
+
+    for path in update_paths:
+        fromtag, sep, tag = path.partition(':')
+        if not sep:
+            raise ValueError(f"invalid update path: {path}")
+        paths.append((
+            _resolve_tag(project, index, fromtag),
+            _resolve_tag(project, index, tag),
+        ))
+
+    if update_to_latest:
+        versions = [
+            cs.tag for cs in (
+                project.changesets if changesets is None else changesets
+            )
+        ]
+        latest = versions[-1] if versions else ''
+        paths.extend((tag, latest) for tag in versions[:-1] if tag)
+
+    return project.update_changesets(paths)
+
+
+def _minify_report(counters):
+    before = counters['minify_bytes_in']
+    after = counters['minify_bytes_out']
+    saved = before - after
+    return (
+        f"minified deploy scripts from {before} to {after} bytes"
+        f" ({saved * 100 / before:.1f}% saved)"
+    )
+
+
+def _build_main(args):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog=f'{__name__} build',
+        description="""
+            Generate Postgres extension files for the Sqitch projects in
+            directories DIR concurrently and report which builds failed.
+            DIR may be a glob pattern.  Each project is built as if pgxsq
+            were run in its directory.
+            """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        'dirs',
+        nargs='*',
+        metavar='DIR',
+        help="project directory or glob pattern",
+    )
+    parser.add_argument(
+        '--manifest',
+        metavar='FILE',
+        help="""
+            also build the project directories listed in FILE, one per line
+            and relative to the directory of FILE (# starts a comment)
+            """,
+    )
+    parser.add_argument(
+        '--dest',
+        default='.',
+        help="""
+            generate extension files in this directory, relative to each
+            project directory, with {name} replaced by the project name
+            """,
+    )
+    parser.add_argument(
+        '--extschema',
+        help="replace this substring with @extschema@",
+    )
+    parser.add_argument(
+        '--placeholder',
+        action='append',
+        default=[],
+        metavar='FROM=TO',
+        help="""
+            replace substring FROM with TO (repeatable, in addition to
+            pgxsq.placeholder in the Sqitch config of each project)
+            """,
+    )
+    parser.add_argument(
+        '--skip-comments',
+        action='store_true',
+        help="do not replace placeholders in SQL comments",
+    )
+    parser.add_argument(
+        '--encoding',
+        default='utf-8',
+        metavar='ENC',
+        help="encoding of the deploy scripts",
+    )
+    parser.add_argument(
+        '--validate-encoding',
+        action='store_true',
+        help="fail on deploy scripts that are not valid in the encoding",
+    )
+    parser.add_argument(
+        '--minify',
+        action='store_true',
+        help="remove comments and redundant whitespace outside of literals",
+    )
+    parser.add_argument(
+        '--minify-bodies',
+        action='store_true',
+        help="like --minify but also minify SQL and PL/pgSQL function bodies",
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="regenerate extension files even if they are up to date",
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar='N',
+        help="build up to N projects concurrently in separate processes",
+    )
+    parser.add_argument(
+        '--durable',
+        action='store_true',
+        help="sync generated files to disk before moving them into DEST",
+    )
+    parser.add_argument(
+        '--use-sqitch',
+        action='store_true',
+        help="read the plans with sqitch-plan instead of parsing them",
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="do not cache the parsed plans in $XDG_CACHE_HOME/pgxsq",
+    )
+
+    opts = parser.parse_args(args)
+
+    patterns = list(opts.dirs)
+
+    if opts.manifest:
+        try:
+            with open(opts.manifest) as fp:
+                lines = fp.read().splitlines()
+        except OSError as exc:
+            parser.error(f"cannot read manifest: {exc}")
+
+        top = os.path.dirname(opts.manifest)
+        patterns.extend(
+            os.path.join(top, line.strip())
+            for line in lines
+            if line.strip() and not line.lstrip().startswith('#')
+        )
+
+    roots = []
+
+    for pattern in patterns:
+        if re.search(r'[*?[]', pattern):
+            import glob
+
+            matches = sorted(filter(os.path.isdir, glob.glob(pattern)))
+            if not matches:
+                parser.error(f"no directories match {pattern}")
+            roots.extend(matches)
+        else:
+            roots.append(pattern)
+
+    roots = list(dict.fromkeys(map(os.path.normpath, roots)))
+
+    if not roots:
+        parser.error("no project directories given")
+
+    for ph in opts.placeholder:
+        old, sep, _ = ph.partition('=')
+        if not old or not sep:
+            parser.error(f"invalid placeholder: {ph}")
+
+    try:
+        _check_encoding(opts.encoding)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    options = dict(
+        dest=opts.dest, extschema=opts.extschema,
+        use_sqitch=opts.use_sqitch,
+        cache_dir=None if opts.no_cache else _cache_dir(),
+        placeholders=opts.placeholder,
+        skip_comments=opts.skip_comments, force=opts.force,
+        durable=opts.durable, encoding=opts.encoding,
+        validate_encoding=opts.validate_encoding, minify=opts.minify,
+        minify_bodies=opts.minify_bodies,
+    )
+
+    results = _map(
+        _build_task, [(root, options) for root in roots], opts.jobs,
+        processes=True,
+    )
+
+    failed = 0
+
+    for root, (files, error) in zip(roots, results):
+        if error is None:
+            print(f"{root}: wrote {len(files)} file(s)")
+        else:
+            print(f"{root}: error: {error}", file=sys.stderr)
+            failed += 1
+
+    print(
+        f"{len(roots) - failed} project(s) built, {failed} failed",
+        file=sys.stderr if failed else sys.stdout,
+    )
+
+    if failed:
+        raise SystemExit(1)
+
+
+def _graph_main(args):
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        prog=f'{__name__} graph',
+        description="""
+            Report the shortest update path and the total size of its deploy
+            scripts between every pair of versions of the Sqitch project in
+            the current working directory.
+            """,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        '--update-path',
+        action='append',
+        default=[],
+        metavar='FROM:TO',
+        help="include an update script from version FROM directly to TO",
+    )
+    parser.add_argument(
+        '--update-to-latest',
+        action='store_true',
+        help="""
+            include update scripts from every version directly to the latest
+            version
+            """,
+    )
+    parser.add_argument(
+        '--target',
+        metavar='TAG',
+        help="only report paths to version TAG (or HEAD)",
+    )
+    parser.add_argument(
+        '--max-steps',
+        type=int,
+        metavar='N',
+        help="flag paths of more than N update scripts and fail if any",
+    )
+    parser.add_argument(
+        '--format',
+        choices=['text', 'dot', 'json'],
+        default='text',
+        help="output format",
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help="write the report to FILE instead of stdout",
+    )
+    parser.add_argument(
+        '--use-sqitch',
+        action='store_true',
+        help="read the plan with sqitch-plan instead of parsing it",
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help="do not cache the parsed plan in $XDG_CACHE_HOME/pgxsq",
+    )
+
+    opts = parser.parse_args(args)
+
+    def die(msg):
+        print(f"error: {msg}", file=sys.stderr)
+        raise SystemExit(1)
+
+    try:
+        project = read_project(
+            use_sqitch=opts.use_sqitch,
+            cache_dir=None if opts.no_cache else _cache_dir(),
+        )
+        index = project.tag_index()
+        extra = _requested_updates(
+            project, index, opts.update_path, opts.update_to_latest,
+        )
+        target = None
+        if opts.target:
+            target = _resolve_tag(project, index, opts.target)
+        paths = update_paths(project, extra_changesets=extra)
+    except (
+        EmptyPlan, ProjectNotFound, InvalidConfig, InvalidPlan, ValueError,
+        OSError,
+    ) as exc:
+        die(_error_message(exc))
+
+    versions = list(dict.fromkeys(cs.tag for cs in project.changesets))
+    updates = [p for p in paths if p.steps == 1]
+
+    if target is not None:
+        paths = [p for p in paths if p.target == target]
+
+    too_long = [
+        p for p in paths
+        if opts.max_steps is not None and p.steps > opts.max_steps
+    ]
+
+    report = {
+        'text': _graph_text,
+        'dot': _graph_dot,
+        'json': _graph_json,
+    }[opts.format](project.name, versions, updates, paths, too_long)
+
+    if opts.output:
+        with open(opts.output, 'w') as fp:
+            fp.write(report)
+    else:
+        sys.stdout.write(report)
+
+    if too_long:
+        print(
+            f"{len(too_long)} path(s) with more than {opts.max_steps} steps",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+
+def _version_name(tag):
+    return _removeprefix(tag, '@') or 'HEAD'
+
+
+def _graph_text(extname, versions, updates, paths, too_long):
+    rows = [('FROM', 'TO', 'STEPS', 'BYTES', 'PATH')]
+    rows.extend(
+        (
+            _version_name(p.source), _version_name(p.target), str(p.steps),
+            str(p.size),
+            ' -> '.join(map(_version_name, p.tags)) +
+            (' (too long)' if p in too_long else ''),
+        )
+        for p in paths
+    )
+    widths = [max(len(row[i]) for row in rows) for i in range(4)]
+
+    return ''.join(
+        f"{row[0]:<{widths[0]}}  {row[1]:<{widths[1]}}  "
+        f"{row[2]:>{widths[2]}}  {row[3]:>{widths[3]}}  {row[4]}\n"
+        for row in rows
+    )
+
+
+def _graph_dot(extname, versions, updates, paths, too_long):
+    import json
+
+    def quote(tag):
+        return json.dumps(_version_name(tag))
+
+    flagged = {p.source for p in too_long}
+    lines = [f"digraph {json.dumps(extname)} {{"]
+    lines.extend(
+        f"  {quote(tag)}" + (" [color=red]" if tag in flagged else "") + ";"
+        for tag in versions
+    )
+    lines.extend(
+        f"  {quote(p.source)} -> {quote(p.target)}"
+        f" [label=\"{p.size} bytes\"];"
+        for p in updates
+    )
+    lines.append("}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def _graph_json(extname, versions, updates, paths, too_long):
+    import json
+
+    def filename(fromtag, tag):
+        return Changeset(fromtag, tag, []).filename(extname)
+
+    data = {
+        'versions': [_version_name(tag) for tag in versions],
+        'updates': [
+            {
+                'from': _version_name(p.source),
+                'to': _version_name(p.target),
+                'file': filename(p.source, p.target),
+                'bytes': p.size,
+            }
+            for p in updates
+        ],
+        'paths': [
+            {
+                'from': _version_name(p.source),
+                'to': _version_name(p.target),
+                'steps': p.steps,
+                'bytes': p.size,
+                'versions': [_version_name(tag) for tag in p.tags],
+                'too_long': p in too_long,
+            }
+            for p in paths
+        ],
+    }
+
+    return json.dumps(data, indent=2) + '\n'
+
+
+def _build_task(task):
+    """Build a project for _build_main() and return (files, error)."""
+    root, options = task
+
+    try:
+        return build_project(root, **options), None
+    except Exception as exc:
+        return None, _error_message(exc)
+
+
+def _error_message(exc):
+    """Return the error message that reports `exc` to the user."""
+    if isinstance(exc, EmptyPlan):
+        return "empty plan"
+    if isinstance(exc, ProjectNotFound):
+        return "no project"
+    if isinstance(exc, InvalidConfig):
+        return f"invalid config: {exc}"
+    if isinstance(exc, InvalidPlan):
+        return f"invalid plan: {exc}"
+    if isinstance(exc, InvalidName):
+        return f"invalid extension name or version: {exc}"
+    return str(exc)
+
+
+def build_project(
+    root, dest='.', extschema=None, use_sqitch=False, cache_dir=None,
+    placeholders=(), skip_comments=False, **options,
+):
+    """Build the Sqitch project in directory `root`.
+
+    Directory `dest` is relative to `root` and "{name}" in it is replaced by
+    the project name.  Argument `placeholders` is an iterable of additional
+    FROM=TO placeholders.  Arguments `use_sqitch` and `cache_dir` are passed
+    to read_project() and other keyword arguments to write_extension().
+    Return the names of the files written to `dest`.
+    """
+    project = read_project(
+        use_sqitch=use_sqitch, root=root, cache_dir=cache_dir,
+    )
+    mapping = read_placeholders(root=root, extra=placeholders)
+    dest = os.path.join(root, dest.replace('{name}', project.name))
+
+    return write_extension(
+        project, dest, extschema,
+        placeholders=Substitution(mapping, skip_comments), **options,
+    )
+
+
+def read_placeholders(root=None, extra=()):
+    """Return the placeholders of the Sqitch project in directory `root`.
+
+    Placeholders are configured as FROM=TO strings with key
+    pgxsq.placeholder in the project config and followed by those in
+    `extra`.  Return a dict that maps FROM to TO.  Raise ValueError on
+    malformed placeholders.
+    """
+    config_file, _, _ = _project_files(root)
+    placeholders = {}
+
+    for ph in [
+        *read_config(config_file, multi=True).get('pgxsq.placeholder', []),
+        *extra,
+    ]:
+        old, sep, new = ph.partition('=')
+        if not old or not sep:
+            raise ValueError(f"invalid placeholder: {ph}")
+        placeholders[old] = new
+
+    return placeholders
+
+
+def read_project(use_sqitch=False, stats=None, root=None, cache_dir=None):
+    """Read the Sqitch project in directory `root` (the current working
+    directory by default).
+
+    The plan file and deploy directory are located through the project config
+    `sqitch.conf` (or the file named by environment variable SQITCH_CONFIG).
+    Relative paths are resolved against `root`.  The plan is parsed natively
+    unless `use_sqitch` is true, in which case the plan is read from the
+    output of sqitch-plan instead.  The time spent is recorded in BuildStats
+    `stats` if given.
+
+    Either way the plan is read line by line into a compact Plan and the
+    changesets of the returned project are computed in the same pass.
+
+    If `cache_dir` is given, the plan and its changesets are cached in that
+    directory.  The cache entry of a plan file is valid as long as the
+    content of the plan and config file, the pgxsq version and `use_sqitch`
+    are unchanged.  Reading a valid entry neither parses the plan nor runs
+    sqitch-plan, and the changesets of the returned project are not computed
+    again.
+    """
+    with _phase(stats, 'read_config'):
+        config_file, plan_file, deploy_dir = _project_files(root)
+
+    deploy_dir = os.path.normpath(deploy_dir)
+
+    if cache_dir is not None:
+        with _phase(stats, 'plan_cache'):
+            cache_file, key, cached = _load_plan_cache(
+                cache_dir, config_file, plan_file, use_sqitch,
+            )
+
+        if cached is not None:
+            name, plan, changesets = cached
+            return Project(name, plan, deploy_dir, changesets)
+
+    if use_sqitch:
+        with _phase(stats, 'sqitch_plan'):
+            name, plan, changesets = _run_sqitch_plan(root)
+    else:
+        try:
+            with _phase(stats, 'parse_plan'), open(plan_file) as fp:
+                name, plan, changesets = _parse_plan(fp)
+        except FileNotFoundError:
+            raise ProjectNotFound from None
+
+    if not plan:
+        raise EmptyPlan
+
+    project = Project(name, plan, deploy_dir, changesets)
+
+    if cache_dir is not None and key is not None:
+        _store_plan_cache(cache_file, key, project)
+
+    return project
+
+
+def _cache_dir():
+    """Return the default directory of the plan cache."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, __name__)
+
+
+def _load_plan_cache(cache_dir, config_file, plan_file, use_sqitch):
+    """Look up the plan cache entry of `plan_file`.
+
+    Return the cache file, the key of the current plan (None if the plan
+    cannot be read) and the cached (name, plan, changesets) if the entry is
+    valid (None otherwise).
+    """
+    plan_file = os.path.abspath(plan_file)
+    name = hashlib.sha256(os.fsencode(plan_file)).hexdigest()[:32]
+    cache_file = os.path.join(cache_dir, f'{name}.plan')
+
+    h = hashlib.sha256()
+    h.update(repr((_version(), marshal.version, use_sqitch)).encode())
+
+    for path in [config_file, plan_file]:
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            if path == plan_file:
+                return cache_file, None, None
+            data = None
+
+        h.update(b'\0' if data is None else b'\1%d\0' % len(data))
+        h.update(data or b'')
+
+    key = h.digest()
+
+    try:
+        with open(cache_file, 'rb') as fp:
+            entry = marshal.load(fp)
+        if entry[0] != key:
+            return cache_file, key, None
+        name, plan, changesets = entry[1:]
+        plan = Plan._from_state(plan)
+        changesets = [Changeset(*cs) for cs in changesets]
+    except (OSError, EOFError, ValueError, TypeError, IndexError):
+        return cache_file, key, None
+
+    return cache_file, key, (name, plan, changesets)
+
+
+def _store_plan_cache(cache_file, key, project):
+    """Store `project` under `key` in `cache_file`, ignoring errors."""
+    plan = project.plan
+    if not isinstance(plan, Plan):
+        plan = Plan(plan)
+
+    entry = (
+        key,
+        project.name,
+        plan._state(),
+        [tuple(cs) for cs in project.changeset_cache],
+    )
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            prefix='.pgxsq-', dir=os.path.dirname(cache_file),
+        )
+        try:
+            with open(fd, 'wb') as fp:
+                marshal.dump(entry, fp)
+            os.replace(tmp, cache_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError:
+        pass
+
+
+def _project_files(root=None):
+    """Return the paths of the config file, plan file and deploy directory of
+    the project in directory `root`."""
+    def path(p):
+        return os.path.join(root, p) if root else p
+
+    config_file = path(os.environ.get('SQITCH_CONFIG', 'sqitch.conf'))
+    config = read_config(config_file)
+
+    engine = config.get('core.engine')
+
+    def setting(key, default):
+        if engine:
+            value = config.get(f'engine.{engine}.{key}')
+            if value is not None:
+                return value
+        return config.get(f'core.{key}', default)
+
+    top_dir = setting('top_dir', '.')
+    plan_file = setting('plan_file', os.path.join(top_dir, 'sqitch.plan'))
+    deploy_dir = setting('deploy_dir', os.path.join(top_dir, 'deploy'))
+
+    return config_file, path(plan_file), path(deploy_dir)
+
+
+def _run_sqitch_plan(root=None):
+    """Read the plan from the output of sqitch-plan as it is produced.
+
+    Return the project name, the Plan and its changesets.
+    """
+    proc = subprocess.Popen(
+        args=[
+            'sqitch', '--quiet',
+            'plan', '--no-header', '--format', 'format:%o %n %{ }t #%{ }r',
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        cwd=root,
+    )
+
+    project = None
+    builder = _PlanBuilder()
+
+    with proc:
+        for line in proc.stdout:
+            # Names cannot contain "#".
+            line, _, requires = line.partition('#')
+            pname, cname, *tags = line.split()
+
+            if project:
+                assert pname == project
+            else:
+                project = pname
+
+            builder.change(cname, tuple(requires.split()))
+            for tag in tags:
+                builder.tag(tag)
+
+    # We cannot get the project name from the sqitch-plan output in case of an
+    # empty plan.  sqitch-plan also includes the project name in its optional
+    # headers but those are always omitted on empty plans.  The native parser
+    # handles empty plans but there is no point in generating an empty
+    # extension either way.
+    if proc.returncode == 1:
+        raise EmptyPlan
+
+    if proc.returncode == 2:
+        raise ProjectNotFound
+
+    assert project
+
+    return (project, *builder.finish())
+
+
+def read_config(path, multi=False):
+    """Read a Sqitch config file.
+
+    Sqitch uses the Git config format.  Return a dict that maps keys in dotted
+    notation (e.g. `engine.pg.plan_file`) to their last value, or to the list
+    of all their values if `multi` is true.  Section and key names are
+    case-insensitive and returned in lowercase whereas subsection names are
+    case-sensitive.  Return an empty dict if the file does not exist.
+    """
+    config = {}
+    section = None
+
+    try:
+        fp = open(path)
+    except FileNotFoundError:
+        return config
+
+    with fp:
+        lines = iter(fp)
+
+        for lineno, line in enumerate(lines, 1):
+            # Join continuation lines.
+            while line.rstrip('\r\n').endswith('\\') and \
+                    not line.rstrip('\r\n').endswith('\\\\'):
+                line = line.rstrip('\r\n')[:-1] + next(lines, '')
+
+            m = _CONFIG_SECTION.match(line)
+            if m:
+                name, subsection = m.group('name', 'subsection')
+                section = name.lower()
+                if subsection is not None:
+                    subsection = re.sub(r'\\(.)', r'\1', subsection)
+                    section = f'{section}.{subsection}'
+                line = line[m.end():]
+
+            m = _CONFIG_VARIABLE.match(line)
+            if not m:
+                raise InvalidConfig(f"{path}:{lineno}: syntax error")
+
+            key, value = m.group('key', 'value')
+
+            if key is None:
+                continue
+
+            if section is None:
+                raise InvalidConfig(f"{path}:{lineno}: key outside section")
+
+            key = f'{section}.{key.lower()}'
+            value = 'true' if value is None else _config_value(value)
+
+            if multi:
+                config.setdefault(key, []).append(value)
+            else:
+                config[key] = value
+
+    return config
+
+
+_CONFIG_SECTION = re.compile(r"""
+    \s* \[
+    \s* (?P<name>[A-Za-z0-9.-]+)
+    (?: \s+ "(?P<subsection>(?:[^"\\\n]|\\.)*)" )?
+    \s* \]
+""", re.X)
+
+_CONFIG_VARIABLE = re.compile(r"""
+    \s*
+    (?:
+        (?P<key>[A-Za-z][A-Za-z0-9_-]*)
+        \s* (?: = (?P<value>(?:[^"\\\n#;]|\\.|"(?:[^"\\\n]|\\.)*")*) )?
+    )?
+    \s* (?: [#;] .* )?
+    $
+""", re.X | re.S)
+
+
+def _config_value(value):
+    """Unquote and unescape a config value."""
+    def unescape(m):
+        s = m.group()
+        if s == '"':
+            return ''
+        return {'n': '\n', 't': '\t', 'b': '\b'}.get(s[1], s[1])
+
+    return re.sub(r'\\.|"', unescape, value.strip())
+
+
+def parse_plan(lines):
+    """Parse a Sqitch plan from an iterable of lines.
+
+    Return the project name and the list of changes.  Tags are attached to the
+    preceding change, just like sqitch-plan reports them.  Required changes
+    are kept in the order listed.  Pragmas other than %project, blank lines,
+    comments, notes and conflicts are recognized but do not contribute to the
+    result.
+    """
+    name, plan, _ = _parse_plan(lines)
+    return name, list(plan)
+
+
+def _parse_plan(lines):
+    """Parse a Sqitch plan like `parse_plan` in a single pass.
+
+    Return the project name, the Plan and its changesets.
+    """
+    name = None
+    builder = _PlanBuilder()
+
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+
+        m = _PLAN_PRAGMA.match(line)
+        if m:
+            if m.group('key') == 'project':
+                name = m.group('value')
+            continue
+
+        m = _PLAN_ENTRY.match(line)
+        if not m:
+            raise InvalidPlan(f"line {lineno}: syntax error: {line!r}")
+
+        if m.group('tag'):
+            if not builder.plan:
+                raise InvalidPlan(f"line {lineno}: tag before first change")
+            builder.tag(f"@{m.group('name')}")
+        elif m.group('op') == '-':
+            raise InvalidPlan(f"line {lineno}: revert operator not supported")
+        else:
+            deps = (m.group('dependencies') or '').split()
+            builder.change(m.group('name'), tuple(
+                dep for dep in deps if not dep.startswith('!')
+            ))
+
+    if name is None:
+        raise InvalidPlan("missing %project pragma")
+
+    return (name, *builder.finish())
+
+
+class _PlanBuilder:
+    """Build a Plan and its changesets from changes and tags in plan order.
+
+    This yields the same changesets as Project.changesets_between but in a
+    single forward pass.  A changeset is complete once its last change is
+    tagged.  The tag of a change's deploy script is only known when the
+    change is reworked in a later changeset, so the most recent occurrences
+    of each change are updated then.
+    """
+
+    def __init__(self):
+        self.plan = Plan()
+        self.changesets = []
+
+        # Changes of the pending changeset and the tag it applies to.
+        self._changes = []
+        self._fromtag = ''
+
+        # Whether the last change is tagged already.
+        self._tagged = False
+
+        # Map change names to the changes of the latest changeset containing
+        # that change and the positions of the change therein.
+        self._latest = {}
+
+    def change(self, name, requires=()):
+        self._changes.append(self.plan._append(name, requires))
+        self._tagged = False
+
+    def tag(self, tag):
+        self.plan._tag(tag)
+
+        # Further tags of the same change are aliases of the first one.
+        if not self._tagged:
+            self._tagged = True
+            self._close(tag)
+
+    def finish(self):
+        """Return the plan and its changesets, including untagged HEAD."""
+        if self._changes:
+            self._close('')
+
+        return self.plan, self.changesets
+
+    def _close(self, tag):
+        fromtag = self._fromtag
+        changes = [(cname, '') for cname in self._changes]
+
+        positions = {}
+        for pos, cname in enumerate(self._changes):
+            positions.setdefault(cname, []).append(pos)
+
+        # Earlier occurrences of changes that are reworked in this changeset
+        # use the deploy scripts as of the tag this changeset applies to.
+        for cname, pos in positions.items():
+            latest = self._latest.get(cname)
+            if latest is not None:
+                for i in latest[1]:
+                    latest[0][i] = (cname, fromtag)
+            self._latest[cname] = (changes, pos)
+
+        self.changesets.append(Changeset(fromtag, tag, changes))
+        self._changes = []
+        self._fromtag = tag
+
+
+_PLAN_PRAGMA = re.compile(r"""
+    \s* % \s* (?P<key>[^\s=]+) \s* (?: = \s* (?P<value>.*?) )? \s* $
+""", re.X)
+
+# Sqitch names must not contain blanks, ":", "@", "#" or "\".  Notes escape
+# line breaks and backslashes so that they always span a single line.
+_PLAN_ENTRY = re.compile(r"""
+    \s*
+    (?: (?P<tag>@) | (?P<op>[+-]) \s* )?
+    (?P<name>[^\s:@#\\]+)
+    (?: \s* \[ (?P<dependencies>[^\]]*) \] )?
+    (?: \s+ (?P<timestamp>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ) )?
+    (?: \s+ (?P<planner>[^<#]*?) \s* < (?P<email>[^>]*) > )?
+    (?: \s* \# (?P<note>.*) )?
+    \s* $
+""", re.X)
+
+
+def check_project(project, changesets=None, extra_changesets=()):
+    """Check that the extension files of `project` can be generated.
+
+    Validate the extension name, the version names of all changesets (all
+    changesets of `project` if `changesets` is None, and `extra_changesets`)
+    and that the deploy scripts of all their changes exist.  The deploy
+    directory is scanned once and no deploy script is opened.  Deploy scripts
+    read from git are looked up in git.  Return a list of all problems found.
+    """
+    problems = {}
+
+    try:
+        valid_name(project.name)
+    except InvalidName as exc:
+        problems[f"invalid extension name: {exc}"] = None
+
+    scripts = None
+
+    if os.path.isdir(project.deploy_dir):
+        scripts = {
+            os.path.normpath(os.path.join(dirpath, fname))
+            for dirpath, _, fnames in os.walk(project.deploy_dir)
+            for fname in fnames
+        }
+    else:
+        problems[f"no deploy directory: {project.deploy_dir}"] = None
+
+    if changesets is None:
+        changesets = project.changesets
+
+    for cs in itertools.chain(changesets, extra_changesets):
+        for tag in [cs.fromtag, cs.tag]:
+            version = _removeprefix(tag, '@')
+
+            if version or tag == cs.tag:
+                try:
+                    valid_name(version or 'HEAD')
+                except InvalidName as exc:
+                    problems[f"invalid version: {exc}"] = None
+
+        for cname, tag in cs.changes:
+            try:
+                path = project.deploy_script_path(cname, tag)
+            except ValueError as exc:
+                problems[f"invalid change {cname}: {exc}"] = None
+                continue
+
+            blob = project.git_script(cname, tag)
+
+            if blob is not None:
+                try:
+                    project.git.oid(*blob)
+                except FileNotFoundError:
+                    problems[f"missing deploy script: {':'.join(blob)}"] = None
+                continue
+
+            if scripts is not None and os.path.normpath(path) not in scripts:
+                problems[f"missing deploy script: {path}"] = None
+
+    return list(problems)
+
+
+def update_paths(project, changesets=None, extra_changesets=()):
+    """Return the shortest update path between every pair of versions.
+
+    The version graph has an edge for every update changeset (all changesets
+    of `project` if `changesets` is None, and `extra_changesets`) that is
+    weighted by the size of its deploy scripts.  Like ALTER EXTENSION UPDATE,
+    paths are shortest in the number of update scripts.  Ties are broken by
+    the smaller total size.  Return a list of UpdatePath tuples for all pairs
+    of distinct versions that are connected, in plan order of their source
+    and target.
+    """
+    if changesets is None:
+        changesets = project.changesets
+
+    versions = {}
+    edges = collections.defaultdict(dict)
+    sizes = {}
+
+    def size(cname, tag):
+        if (cname, tag) not in sizes:
+            sizes[cname, tag] = _deploy_script_size(project, cname, tag)
+        return sizes[cname, tag]
+
+    for cs in itertools.chain(changesets, extra_changesets):
+        if cs.fromtag:
+            versions.setdefault(cs.fromtag)
+            edges[cs.fromtag].setdefault(
+                cs.tag, sum(size(cname, tag) for cname, tag in cs.changes),
+            )
+        versions.setdefault(cs.tag)
+
+    paths = []
+
+    for source in versions:
+        # Breadth-first search that keeps the smallest path to each version
+        # among the paths with the fewest steps.
+        best = {source: (0, [source])}
+        frontier = [source]
+
+        while frontier:
+            reached = {}
+
+            for version in frontier:
+                total, path = best[version]
+
+                for target, weight in edges[version].items():
+                    if target in best:
+                        continue
+                    if target not in reached or \
+                            total + weight < reached[target][0]:
+                        reached[target] = (total + weight, path + [target])
+
+            best.update(reached)
+            frontier = list(reached)
+
+        paths.extend(
+            UpdatePath(best[target][1], best[target][0])
+            for target in versions
+            if target != source and target in best
+        )
+
+    return paths
+
+
+def build(project, **options):
+    """Generate the extension files of `project` in memory.
+
+    Return a dict that maps filenames to their content as bytes.  Keyword
+    arguments are passed to iter_build().
+    """
+    files = collections.defaultdict(list)
+
+    for fname, chunk in iter_build(project, **options):
+        files[fname].append(chunk)
+
+    return {fname: b''.join(chunks) for fname, chunks in files.items()}
+
+
+def iter_build(
+    project, extschema=None, placeholders=None, changesets=None,
+    extra_changesets=(), cache=None, stats=None, elide_reworks=False,
+    elided=None, encoding='utf-8', validate_encoding=False, minify=False,
+    minify_bodies=False,
+):
+    """Generate the extension files of `project` lazily.
+
+    Yield (filename, chunk) pairs where the chunks of each file are
+    consecutive bytes objects, i.e. the guard line and every deploy script
+    after transaction control commands are stripped and placeholders are
+    substituted.  Deploy scripts are only read as the chunks are consumed and
+    nothing is written to disk.  Large deploy scripts are read in chunks of
+    at most _BUFSIZE bytes where _zero_copy_parts() supports them.  The empty
+    control file comes last.  Arguments have the same meaning as for
+    write_extension().
+    """
+    extname = valid_name(project.name)
+    encoding = _check_encoding(encoding)
+    placeholders = _substitution(placeholders, extschema).encode(encoding)
+
+    if cache is None and elide_reworks:
+        cache = ScriptCache()
+
+    scripts = _extension_scripts(
+        project, extname, changesets, extra_changesets, stats,
+        elide_reworks, cache, elided, encoding,
+    )
+
+    minifier = _minifier(minify, minify_bodies)
+
+    for fname, cs in scripts:
+        for chunk in _read_extents(_generate(
+            project, extname, fname, cs, placeholders, cache, stats,
+            encoding, validate_encoding, minifier, zero_copy=True,
+        )):
+            yield fname, chunk
+
+    yield f'{extname}.control', b''
+
+
+def _substitution(placeholders, extschema):
+    """Return Substitution `placeholders` (or a mapping to create one) with
+    `extschema` substituted for @extschema@."""
+    if not isinstance(placeholders, Substitution):
+        placeholders = Substitution(placeholders or {})
+
+    if extschema:
+        placeholders = placeholders.extend({extschema: '@extschema@'})
+
+    return placeholders
+
+
+def _check_encoding(encoding):
+    """Return the normalized name of `encoding`.
+
+    Raise ValueError unless `encoding` is compatible with ASCII, i.e. bytes
+    below 0x80 always denote ASCII characters.  Scripts in such encodings can
+    be processed as bytes.  Postgres server encodings are all compatible with
+    ASCII whereas client-only encodings such as Shift JIS are not.
+    """
+    import codecs
+
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        raise ValueError(f"unknown encoding: {encoding}") from None
+
+    if name not in _ASCII_ENCODINGS and not name.startswith(
+        ('iso8859-', 'cp125', 'koi8-', 'mac-'),
+    ):
+        raise ValueError(f"unsupported encoding: {encoding}")
+
+    return name
+
+
+_ASCII_ENCODINGS = {
+    'ascii', 'utf-8', 'utf-8-sig', 'euc_jp', 'euc_jis_2004', 'euc_jisx0213',
+    'euc_kr', 'gb2312', 'cp866', 'cp874', 'tis-620',
+}
+
+
+def _invalid_encoding(path, exc, offset=0):
+    """Return a ValueError for UnicodeDecodeError `exc` of deploy script
+    `path` at position `offset`."""
+    return ValueError(
+        f"{path}: invalid {exc.encoding} at byte {offset + exc.start}:"
+        f" {exc.reason}"
+    )
+
+
+def _bom(encoding):
+    """Return the byte order mark that is removed from deploy scripts in
+    normalized `encoding`."""
+    import codecs
+
+    return codecs.BOM_UTF8 if encoding in ('utf-8', 'utf-8-sig') else b''
+
+
+def _extension_scripts(
+    project, extname, changesets, extra_changesets, stats,
+    elide_reworks=False, cache=None, elided=None, encoding='utf-8',
+):
+    """Return (filename, changeset) pairs of the extension scripts to build.
+
+    All changesets of `project` are built if `changesets` is None.
+    Changesets in `extra_changesets` are skipped if their extension script
+    is already covered.  Unchanged reworks are elided from the changesets if
+    `elide_reworks` is true.
+    """
+    if changesets is None:
+        with _phase(stats, 'changesets'):
+            changesets = list(project.changesets)
+
+    scripts = {}
+
+    for cs in itertools.chain(changesets, extra_changesets):
+        scripts.setdefault(cs.filename(extname), cs)
+
+    if elide_reworks:
+        with _phase(stats, 'elide_reworks'):
+            scripts = dict(zip(scripts, project.elide_reworks(
+                scripts.values(), cache, elided, encoding,
+            )))
+
+    return list(scripts.items())
+
+
+def _minifier(enabled, bodies):
+    """Return the function that minifies deploy scripts, if any."""
+    if not (enabled or bodies):
+        return None
+    return functools.partial(minify, bodies=bodies)
+
+
+def _generate(
+    project, extname, fname, cs, placeholders, cache, stats,
+    encoding='utf-8', validate=False, minifier=None, zero_copy=False,
+):
+    """Yield the content of extension script `fname` of changeset `cs` in
+    chunks of bytes.
+
+    Argument `placeholders` is a Substitution of bytes in `encoding`.
+    Function `minifier` is applied to every deploy script after substitution
+    if given.  If `zero_copy` is true, regions of large deploy scripts that
+    are copied verbatim are yielded as _Extent tuples instead (see
+    _zero_copy_parts()).
+    """
+    start = time.perf_counter()
+    size = 0
+    substitutions = 0
+
+    guard = rf'\echo Use "CREATE EXTENSION {extname}" to load this file. \quit'
+    chunk = f'{guard}\n'.encode(encoding)
+    size += len(chunk)
+    yield chunk
+
+    for cname, tag in cs.changes:
+        if zero_copy and minifier is None and \
+                project.git_script(cname, tag) is None:
+            path = project.deploy_script_path(cname, tag)
+            parts = _zero_copy_parts(
+                path, placeholders, stats, encoding, validate,
+            )
+
+            if parts is not None:
+                for part in parts:
+                    if isinstance(part, _Extent):
+                        size += part.end - part.start
+                    else:
+                        size += len(part)
+                        substitutions += 1
+                    yield part
+                continue
+
+        script = project.read_deploy_script(
+            cname, tag, cache, stats, encoding, validate,
+        )
+        chunk, n = placeholders.subn(script)
+
+        if minifier is not None:
+            minified = minifier(chunk)
+            if stats is not None:
+                stats.count('minify_bytes_in', len(chunk))
+                stats.count('minify_bytes_out', len(minified))
+            chunk = minified
+
+        size += len(chunk)
+        substitutions += n
+        yield chunk
+
+    if stats is not None:
+        stats.add_file(
+            fname,
+            seconds=time.perf_counter() - start,
+            bytes_read=sum(
+                _deploy_script_size(project, cname, tag)
+                for cname, tag in cs.changes
+            ),
+            bytes_written=size,
+            substitutions=substitutions,
+        )
+
+
+def _deploy_script_size(project, change, tag):
+    blob = project.git_script(change, tag)
+
+    if blob is not None:
+        return len(project.git.read(*blob))
+
+    return os.path.getsize(project.deploy_script_path(change, tag))
+
+
+def write_extension(
+    project, dest, extschema, force=False, jobs=1, cache=None, durable=False,
+    changesets=None, extra_changesets=(), placeholders=None, stats=None,
+    elide_reworks=False, elided=None, encoding='utf-8',
+    validate_encoding=False, minify=False, minify_bodies=False,
+):
+    """Write the extension files of `project` to directory `dest`.
+
+    Builds are incremental.  A manifest in `dest` records the deploy scripts
+    and build options of each extension script.  Extension scripts whose
+    inputs are unchanged since the last build are skipped unless `force` is
+    true.  Extension scripts recorded in the manifest that are no longer part
+    of the project are removed.
+
+    Extension scripts are generated concurrently by up to `jobs` threads.
+    Deploy scripts are read through `cache` (a new ScriptCache by default) so
+    that scripts shared by multiple changesets are read only once.  Raise
+    BuildError if generating an extension script fails.
+
+    Files are staged in a temporary directory inside `dest` and only moved
+    into place once all files are generated.  Readers therefore never see
+    partially written files and a failed build leaves `dest` unchanged.  If
+    `durable` is true, all files are synced to disk before they are moved.
+
+    Only the given `changesets` are considered if not None.  The manifest
+    entries of all other extension scripts are kept in that case and no
+    files are removed.  Changesets in `extra_changesets` (e.g. from
+    Project.install_changesets()) are written in addition unless their
+    extension scripts are already covered by `changesets`.  Return the names
+    of the files written to `dest`.
+
+    Argument `placeholders` is a Substitution (or a mapping to create one)
+    that is applied to every deploy script.  Substitution of `extschema` for
+    @extschema@ is added to it.
+
+    Timings of the build phases and the sizes of every written extension
+    script are recorded in BuildStats `stats` if given.
+
+    If `elide_reworks` is true, reworked changes whose deploy scripts are
+    unchanged are left out of update scripts (see Project.elide_reworks())
+    and reported in list `elided` if given.
+
+    Scripts are processed as bytes in `encoding` (which must be compatible
+    with ASCII) and line endings are kept as is.  A leading UTF-8 byte order
+    mark is removed from each deploy script.  Deploy scripts are only decoded
+    to check that they are valid in `encoding` if `validate_encoding` is true.
+
+    If `minify` is true, comments and redundant whitespace are removed from
+    every deploy script after substitution, and if `minify_bodies` is true,
+    also from the bodies of SQL and PL/pgSQL functions (see minify()).  The
+    bytes before and after are counted in `stats` if given.
+
+    The content of extension scripts is the same as with iter_build(), but
+    unchanged regions of large deploy scripts are copied within the kernel
+    where possible (see _copy_extent()) instead of being read into memory.
+    """
+    if cache is None:
+        cache = ScriptCache()
+
+    extname = valid_name(project.name)
+    encoding = _check_encoding(encoding)
+    filename = functools.partial(os.path.join, dest)
+
+    os.makedirs(dest, exist_ok=True)
+
+    manifest_name = f'.{extname}.pgxsq.json'
+    old_manifest = _read_manifest(filename(manifest_name))
+    manifest = {}
+    placeholders = _substitution(placeholders, extschema)
+
+    options = _options_digest(
+        placeholders=placeholders.mapping,
+        skip_comments=placeholders.skip_comments,
+        encoding=encoding,
+        validate_encoding=validate_encoding,
+        minify=bool(minify or minify_bodies),
+        minify_bodies=minify_bodies,
+    )
+    placeholders = placeholders.encode(encoding)
+    minifier = _minifier(minify, minify_bodies)
+    pending = []
+
+    scripts = _extension_scripts(
+        project, extname, changesets, extra_changesets, stats,
+        elide_reworks, cache, elided, encoding,
+    )
+
+    if changesets is not None:
+        manifest.update(old_manifest)
+
+    with _phase(stats, 'check'):
+        for fname, cs in scripts:
+            inputs = [
+                project.git_script(cname, tag) or
+                project.deploy_script_path(cname, tag)
+                for cname, tag in cs.changes
+            ]
+
+            entry = None if force else _fresh_manifest_entry(
+                old_manifest.get(fname), filename(fname), inputs, options,
+                project.git,
+            )
+
+            if entry is None:
+                pending.append((fname, cs, inputs))
+            else:
+                manifest[fname] = entry
+
+    staging = tempfile.mkdtemp(prefix='.pgxsq-', dir=dest)
+    staged = functools.partial(os.path.join, staging)
+
+    def generate(task):
+        fname, cs, inputs = task
+
+        try:
+            entry = {
+                'options': options,
+                'inputs': [
+                    _input_record(path, project.git) for path in inputs
+                ],
+            }
+
+            with open(staged(fname), 'wb', buffering=_BUFSIZE) as ext:
+                src = None
+
+                try:
+                    for chunk in _generate(
+                        project, extname, fname, cs, placeholders, cache,
+                        stats, encoding, validate_encoding, minifier,
+                        zero_copy=True,
+                    ):
+                        if not isinstance(chunk, _Extent):
+                            ext.write(chunk)
+                            continue
+
+                        if src is None or src.name != chunk.path:
+                            if src is not None:
+                                src.close()
+                            src = open(chunk.path, 'rb')
+
+                        # Copy small extents through the buffer to save
+                        # system calls.
+                        if chunk.end - chunk.start < 1 << 16:
+                            src.seek(chunk.start)
+                            ext.write(src.read(chunk.end - chunk.start))
+                            continue
+
+                        ext.flush()
+                        _copy_extent(
+                            src.fileno(), ext.fileno(), chunk.start, chunk.end,
+                        )
+                finally:
+                    if src is not None:
+                        src.close()
+
+            # Renaming preserves the mtime recorded here.
+            entry['output'] = _stat_record(staged(fname))
+        except Exception as exc:
+            raise BuildError(fname, exc) from exc
+
+        return fname, entry
+
+    try:
+        with _phase(stats, 'generate'):
+            manifest.update(_map(generate, pending, jobs))
+        files = [fname for fname, _, _ in pending]
+
+        # Create empty control file unless it already exists.
+        control = f'{extname}.control'
+        if not os.path.isfile(filename(control)) or \
+                os.path.getsize(filename(control)):
+            with open(staged(control), 'w'):
+                pass
+            files.append(control)
+
+        if manifest != old_manifest:
+            _write_manifest(staged(manifest_name), manifest)
+            files.append(manifest_name)
+
+        # Remove extension scripts of changesets that no longer exist.
+        stale = old_manifest.keys() - manifest.keys()
+
+        with _phase(stats, 'publish'):
+            _publish(staging, dest, files, stale, durable)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if stats is not None:
+        stats.count('files_skipped', len(scripts) - len(pending))
+
+    return files
+
+
+_BUFSIZE = 1 << 20
+
+
+# Deploy scripts of at least this size are copied with _copy_extent().
+_ZERO_COPY_MIN = 1 << 20
+
+# Keywords that start transaction control commands.  Scripts without any of
+# them are copied without tokenizing.
+_TRANSACTION_KEYWORD = re.compile(
+    rb'(?<![\w$])(?i:BEGIN|START|COMMIT|END)(?![\w$])',
+)
+_TRANSACTION_KEYWORD_MAX = len('COMMIT') - 1
+
+
+class _Extent(t.NamedTuple):
+    """Byte range of a file that is copied verbatim."""
+
+    path: str
+    start: int
+    end: int
+
+
+def _zero_copy_parts(
+    path, placeholders, stats=None, encoding='utf-8', validate=False,
+):
+    """Return the content of deploy script `path` with transaction control
+    commands stripped and placeholders substituted as an iterator over
+    _Extent tuples for unchanged regions and bytes for substituted
+    placeholders.
+
+    The script is memory-mapped and scanned in chunks so that memory use does
+    not depend on the script size.  Arguments `encoding` and `validate` are
+    as for Project.read_deploy_script().  Return None if the script must be
+    read in full instead: if it is smaller than _ZERO_COPY_MIN, if
+    placeholders in comments must be skipped, or if removing a statement
+    joins text into a placeholder.  Scripts without any transaction control
+    keyword are not tokenized and copied as a whole.
+    """
+    import codecs
+    import mmap
+
+    if placeholders.skip_comments:
+        return None
+
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+
+        if size < _ZERO_COPY_MIN:
+            return None
+
+        if not size:
+            # Empty files cannot be memory-mapped.
+            if stats is not None:
+                stats.count('scripts')
+                stats.count('scripts_read')
+                stats.count('scripts_zero_copy')
+            return iter(())
+
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bom = _bom(encoding)
+            skip = len(bom) if bom and mm[:len(bom)] == bom else 0
+
+            # Windows overlap so that keywords across them are found.
+            keywords = any(
+                _TRANSACTION_KEYWORD.search(
+                    mm, offset, offset + _BUFSIZE + _TRANSACTION_KEYWORD_MAX,
+                )
+                for offset in range(skip, size, _BUFSIZE)
+            )
+
+            if validate:
+                decoder = codecs.getincrementaldecoder(encoding)()
+
+            stripped = []
+            spans = []
+            stripper = _TransactionStripper(stripped, spans)
+
+            offset = skip
+
+            try:
+                limit = size if validate or keywords else skip
+                for offset in range(skip, limit, _BUFSIZE):
+                    chunk = mm[offset:offset + _BUFSIZE]
+                    if validate:
+                        decoder.decode(chunk)
+                    if keywords:
+                        stripper.feed(chunk)
+                    _release_pages(mm, offset, offset + len(chunk))
+
+                if validate:
+                    decoder.decode(b'', final=True)
+            except UnicodeDecodeError as exc:
+                raise _invalid_encoding(path, exc, offset) from exc
+
+            stripper.close()
+
+            # Regions between removed statements.
+            regions = []
+            pos = skip
+            for start, end in spans:
+                start += skip
+                end += skip
+                if start > pos:
+                    regions.append((pos, start))
+                pos = end
+            if pos < size:
+                regions.append((pos, size))
+
+            width = max(map(len, placeholders.mapping), default=0)
+
+            for (_, end), (start, _) in zip(regions, regions[1:]):
+                if placeholders.straddles(mm[max(skip, end - width):end],
+                                          mm[start:start + width]):
+                    return None
+
+    if stats is not None:
+        stats.count('scripts')
+        stats.count('scripts_read')
+        stats.count('scripts_zero_copy')
+        stats.count('statements_stripped', len(stripped))
+
+    return _zero_copy_iter(path, regions, placeholders, width)
+
+
+def _zero_copy_iter(path, regions, placeholders, width):
+    """Yield the parts of _zero_copy_parts() for `regions` of `path`."""
+    import mmap
+
+    if not placeholders:
+        for start, end in regions:
+            yield _Extent(path, start, end)
+        return
+
+    with open(path, 'rb') as fp, \
+            mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in regions:
+            pos = start
+
+            # Scan in windows that overlap by the longest placeholder.
+            for window in range(start, end, _BUFSIZE):
+                limit = min(end, window + _BUFSIZE)
+                for m in placeholders.finditer(
+                    mm, max(pos, window), min(end, limit + width - 1),
+                ):
+                    if m.start() >= limit:
+                        break
+                    if m.start() > pos:
+                        yield _Extent(path, pos, m.start())
+                    yield placeholders.mapping[m.group()]
+                    pos = m.end()
+                _release_pages(mm, window, limit)
+
+            if end > pos:
+                yield _Extent(path, pos, end)
+
+
+def _read_extents(parts):
+    """Yield `parts` of _generate() as bytes where _Extent tuples are read in
+    chunks of at most _BUFSIZE bytes."""
+    fd = path = None
+
+    try:
+        for part in parts:
+            if not isinstance(part, _Extent):
+                yield part
+                continue
+
+            if part.path != path:
+                if fd is not None:
+                    os.close(fd)
+                    fd = None
+                fd = os.open(part.path, os.O_RDONLY)
+                path = part.path
+
+            start = part.start
+            while start < part.end:
+                data = os.pread(fd, min(part.end - start, _BUFSIZE), start)
+                if not data:
+                    raise EOFError(f"unexpected end of file at {start}")
+                start += len(data)
+                yield data
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _release_pages(mm, start, end):
+    """Release the scanned pages `start` to `end` of read-only mmap `mm` to
+    keep the resident size flat.  They are read again if accessed."""
+    import mmap
+
+    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+        start -= start % mmap.PAGESIZE
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def _copy_extent(src, dst, start, end):
+    """Copy bytes `start` to `end` of file descriptor `src` to the current
+    offset of file descriptor `dst`.
+
+    Use copy_file_range() or sendfile() to copy within the kernel and fall
+    back to buffered copies where neither is supported.
+    """
+    import errno
+
+    unsupported = {
+        errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+        errno.EBADF, errno.EPERM,
+    }
+
+    for copy in [
+        getattr(os, 'copy_file_range', None) and (
+            lambda n, offset: os.copy_file_range(src, dst, n, offset)
+        ),
+        getattr(os, 'sendfile', None) and (
+            lambda n, offset: os.sendfile(dst, src, offset, n)
+        ),
+    ]:
+        if copy is None:
+            continue
+
+        try:
+            while start < end:
+                n = copy(min(end - start, 1 << 30), start)
+                if n == 0:
+                    raise EOFError(f"unexpected end of file at {start}")
+                start += n
+            return
+        except OSError as exc:
+            if exc.errno not in unsupported:
+                raise
+
+    while start < end:
+        data = os.pread(src, min(end - start, _BUFSIZE), start)
+        if not data:
+            raise EOFError(f"unexpected end of file at {start}")
+        start += len(data)
+        while data:
+            data = data[os.write(dst, data):]
+
+
+def write_archive(
+    project, path, extschema=None, durable=False, cache=None, stats=None,
+    changesets=None, extra_changesets=(), placeholders=None,
+    elide_reworks=False, elided=None, encoding='utf-8',
+    validate_encoding=False, minify=False, minify_bodies=False,
+):
+    """Write the extension files of `project` to archive `path`.
+
+    The archive format is determined by the file extension: .tar, .tar.gz
+    (or .tgz) or .zip.  Raise ValueError on other extensions.  Extension
+    scripts are generated once and large deploy scripts are read in chunks as
+    for iter_build().  Zip members are streamed into the archive.  Tar
+    members are staged in a spooled temporary file first because their size
+    must be known up front.
+
+    Members are stored in the order of iter_build() with mode 0644 and a
+    fixed mtime (environment variable SOURCE_DATE_EPOCH or 1980-01-01) so
+    that builds are reproducible.  The archive is written to a temporary
+    file next to `path` and only moved into place once complete.  If
+    `durable` is true, it is synced to disk before it is moved.  Other
+    arguments have the same meaning as for write_extension().  Raise
+    BuildError if generating an extension script fails.  Return the member
+    names.
+    """
+    fmt = _archive_format(path)
+
+    if cache is None and elide_reworks:
+        cache = ScriptCache()
+
+    extname = valid_name(project.name)
+    encoding = _check_encoding(encoding)
+    placeholders = _substitution(placeholders, extschema).encode(encoding)
+    scripts = _extension_scripts(
+        project, extname, changesets, extra_changesets, stats,
+        elide_reworks, cache, elided, encoding,
+    )
+    minifier = _minifier(minify, minify_bodies)
+
+    def chunks(fname, cs):
+        try:
+            yield from _read_extents(_generate(
+                project, extname, fname, cs, placeholders, cache, stats,
+                encoding, validate_encoding, minifier, zero_copy=True,
+            ))
+        except Exception as exc:
+            raise BuildError(fname, exc) from exc
+
+    members = [
+        (fname, functools.partial(chunks, fname, cs))
+        for fname, cs in scripts
+    ]
+    members.append((f'{extname}.control', lambda: iter([])))
+
+    mtime = int(os.environ.get('SOURCE_DATE_EPOCH', _ZIP_EPOCH))
+
+    fd, tmp = tempfile.mkstemp(
+        prefix='.pgxsq-', dir=os.path.dirname(path) or '.',
+    )
+
+    try:
+        with open(fd, 'wb') as fp:
+            with _phase(stats, 'generate'):
+                if fmt == 'zip':
+                    _write_zip(fp, members, mtime)
+                else:
+                    _write_tar(fp, members, mtime, fmt == 'gztar')
+
+            if durable:
+                fp.flush()
+                os.fsync(fp.fileno())
+
+        # Apply the default file mode instead of 0600 of temporary files.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0o666 & ~umask)
+
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return [fname for fname, _ in members]
+
+
+# Earliest timestamp representable in zip files.
+_ZIP_EPOCH = 315532800
+
+
+def _archive_format(path):
+    """Return the archive format of `path` based on its file extension."""
+    if path.endswith('.zip'):
+        return 'zip'
+    if path.endswith(('.tar.gz', '.tgz')):
+        return 'gztar'
+    if path.endswith('.tar'):
+        return 'tar'
+    raise ValueError(f"unsupported archive format: {path}")
+
+
+def _write_tar(fp, members, mtime, compress):
+    """Write `members` as (name, chunks) pairs to tar file `fp`.
+
+    Function `chunks` is called once per member.  The content is staged in a
+    temporary file that is kept in memory up to _BUFSIZE bytes to determine
+    the member size.
+    """
+    import gzip
+    import tarfile
+
+    if compress:
+        # Omit the filename and use a fixed mtime in the gzip header.
+        out = gzip.GzipFile(filename='', mode='wb', fileobj=fp, mtime=mtime)
+    else:
+        out = contextlib.nullcontext(fp)
+
+    with out as fileobj, tarfile.open(
+        fileobj=fileobj, mode='w', format=tarfile.USTAR_FORMAT,
+    ) as tar:
+        for name, chunks in members:
+            with tempfile.SpooledTemporaryFile(_BUFSIZE) as spool:
+                for chunk in chunks():
+                    spool.write(chunk)
+
+                info = tarfile.TarInfo(name)
+                info.mode = 0o644
+                info.mtime = mtime
+                info.size = spool.tell()
+
+                spool.seek(0)
+                tar.addfile(info, spool)
+
+
+def _write_zip(fp, members, mtime):
+    """Write `members` as (name, chunks) pairs to zip file `fp`."""
+    import zipfile
+
+    date_time = time.gmtime(max(mtime, _ZIP_EPOCH))[:6]
+
+    with zipfile.ZipFile(fp, 'w') as zf:
+        for name, chunks in members:
+            info = zipfile.ZipInfo(name, date_time)
+            info.external_attr = 0o644 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+
+            with zf.open(info, 'w', force_zip64=True) as out:
+                for chunk in chunks():
+                    out.write(chunk)
+
+
+def _publish(staging, dest, files, stale, durable):
+    """Move staged files into `dest` and remove stale files from `dest`.
+
+    Each file is replaced atomically.  If `durable` is true, the staged files
+    are synced before they are moved and `dest` is synced afterwards.
+    """
+    if durable:
+        for fname in files:
+            fd = os.open(os.path.join(staging, fname), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    for fname in files:
+        os.replace(os.path.join(staging, fname), os.path.join(dest, fname))
+
+    for fname in stale:
+        try:
+            os.remove(os.path.join(dest, fname))
+        except FileNotFoundError:
+            pass
+
+    # Sync the directory entries of renamed and removed files.
+    if durable and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(dest, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _map(func, items, jobs, processes=False):
+    """Apply `func` to `items` with up to `jobs` threads (or processes if
+    `processes` is true).
+
+    Return the results in the order of `items`.  The first exception in that
+    order is raised after all calls have completed.
+    """
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    import concurrent.futures
+
+    if processes:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(items)),
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+    with executor:
+        futures = [executor.submit(func, item) for item in items]
+
+    return [f.result() for f in futures]
+
+
+def _options_digest(**options):
+    """Return a digest of the build options that affect extension scripts."""
+    import json
+
+    options['pgxsq'] = _version()
+    data = json.dumps(options, sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _fresh_manifest_entry(entry, output, inputs, options, git=None):
+    """Return the manifest entry of an up-to-date extension script.
+
+    The extension script is up to date if the manifest entry records the same
+    build options and deploy scripts, the deploy scripts have the recorded
+    content, and the extension script still exists as it was written.  Deploy
+    scripts are only hashed if their size or mtime differs from the recorded
+    ones.  Inputs (revision, path) are deploy scripts read from GitObjects
+    `git` and compared by object name.  Return None if the extension script
+    must be regenerated.
+    """
+    if not entry or entry.get('options') != options:
+        return None
+
+    records = entry.get('inputs', [])
+
+    if [
+        (r['rev'], r['path']) if 'rev' in r else r.get('path')
+        for r in records
+    ] != inputs:
+        return None
+
+    fresh = []
+
+    try:
+        if _stat_record(output) != entry.get('output'):
+            return None
+
+        for record in records:
+            if 'rev' in record:
+                if git is None or git.oid(
+                    record['rev'], record['path'],
+                ) != record['oid']:
+                    return None
+                fresh.append(record)
+                continue
+
+            stat = _stat_record(record['path'])
+
+            if stat != record['stat']:
+                if _hash_file(record['path']) != record['sha256']:
+                    return None
+                record = dict(record, stat=stat)
+
+            fresh.append(record)
+    except (OSError, KeyError, TypeError):
+        return None
+
+    return dict(entry, inputs=fresh)
+
+
+def _input_record(path, git=None):
+    if isinstance(path, tuple):
+        rev, path = path
+        return {'rev': rev, 'path': path, 'oid': git.oid(rev, path)}
+
+    stat = _stat_record(path)
+    return {'path': path, 'stat': stat, 'sha256': _hash_file(path)}
+
+
+def _stat_record(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(functools.partial(fp.read, 1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_manifest(path):
+    import json
+
+    try:
+        with open(path) as fp:
+            manifest = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(manifest, dict) or manifest.get('version') != 1:
+        return {}
+
+    outputs = manifest.get('outputs')
+
+    return outputs if isinstance(outputs, dict) else {}
+
+
+def _write_manifest(path, outputs):
+    import json
+
+    with open(path, 'w') as fp:
+        json.dump({'version': 1, 'outputs': outputs}, fp, sort_keys=True)
+
+
+def _version():
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version(__name__)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def watch(
+    dest, extschema, use_sqitch=False, poll=None, report=None, cache_dir=None,
+    placeholders=(), skip_comments=False, **options,
+):
+    """Build the project in the current working directory and rebuild it on
+    changes until interrupted.
+
+    The project and its placeholders are kept in memory and only read again
+    when the config or plan file changes.  Changes to deploy scripts only
+    regenerate the extension scripts of changesets that include those
+    scripts.  Changes are detected with inotify if available.  Otherwise, or
+    if `poll` is given, files are polled every `poll` seconds.
+
+    Function `report` is called with a message after each build and with
+    exceptions raised by reading or building the project.  Arguments
+    `placeholders` and `skip_comments` are as for build_project().  Argument
+    `cache_dir` is passed to read_project() and other keyword arguments to
+    write_extension().
+    """
+    if report is None:
+        def report(msg):
+            pass
+
+    options.setdefault('cache', ScriptCache())
+
+    def build(project, changesets=None):
+        try:
+            files = write_extension(
+                project, dest, extschema, changesets=changesets, **options,
+            )
+        except (InvalidName, BuildError, OSError, ValueError) as exc:
+            report(exc)
+            return False
+
+        report(f"wrote {len(files)} file(s)")
+        return True
+
+    while True:
+        config_file, plan_file, deploy_dir = _project_files()
+        project_files = {os.path.abspath(config_file),
+                         os.path.abspath(plan_file)}
+        dirs = {os.path.dirname(path): False for path in project_files}
+        dirs[os.path.abspath(deploy_dir)] = True
+
+        # Map deploy scripts to the changesets that include them.
+        scripts = collections.defaultdict(list)
+
+        # Start watching before reading the project to not miss any changes.
+        with _watcher(dirs, poll) as watcher:
+            try:
+                project = read_project(
+                    use_sqitch=use_sqitch, cache_dir=cache_dir,
+                )
+                mapping = read_placeholders(extra=placeholders)
+            except (EmptyPlan, ProjectNotFound, InvalidConfig,
+                    InvalidPlan, ValueError) as exc:
+                report(exc)
+                project = None
+            else:
+                options['placeholders'] = Substitution(mapping, skip_comments)
+                for cs in project.changesets:
+                    for cname, tag in cs.changes:
+                        path = project.deploy_script_path(cname, tag)
+                        scripts[os.path.abspath(path)].append(cs)
+
+                ok = build(project)
+
+            while True:
+                changed = watcher.wait()
+
+                if changed is None or changed & project_files:
+                    break
+
+                if project is None:
+                    continue
+
+                affected = {
+                    id(cs): cs for path in changed for cs in scripts[path]
+                }
+
+                # Rebuild everything that is out of date after a failed build.
+                if not ok:
+                    ok = build(project)
+                elif affected:
+                    ok = build(project, list(affected.values()))
+
+
+def _watcher(dirs, poll=None):
+    """Return a watcher for the files in `dirs`.
+
+    Argument `dirs` maps directories to whether their subdirectories are
+    watched as well.  Use inotify unless `poll` is given or inotify is not
+    available.
+    """
+    if poll is None:
+        try:
+            return _InotifyWatcher(dirs)
+        except (AttributeError, OSError):
+            poll = 0.5
+
+    return _PollingWatcher(dirs, poll)
+
+
+class _InotifyWatcher:
+    """Watch directories for changed files with inotify."""
+
+    _IN_CLOSE_WRITE = 0x8
+    _IN_MOVED_FROM = 0x40
+    _IN_MOVED_TO = 0x80
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_Q_OVERFLOW = 0x4000
+    _IN_ISDIR = 0x40000000
+
+    _MASK = (
+        _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE |
+        _IN_DELETE
+    )
+
+    _EVENT = struct.Struct('iIII')
+
+    # Wait this long for further events after the first one so that a burst
+    # of events (e.g. from an editor saving a file) triggers a single build.
+    _SETTLE = 0.02
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+
+        if self._fd < 0:
+            errno = self._get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._wds = {}
+        self._recursive = {}
+
+        try:
+            for top, recursive in dirs.items():
+                for dirpath in _walk_dirs(top, recursive):
+                    self._add_watch(dirpath, recursive)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def wait(self):
+        """Block until files change and return their absolute paths.
+
+        Return None if events were lost.
+        """
+        import select
+
+        changed = set()
+        data = os.read(self._fd, 1 << 16)
+
+        while True:
+            offset = 0
+
+            while offset < len(data):
+                wd, mask, _, size = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + size].rstrip(b'\0')
+                offset += size
+
+                if mask & self._IN_Q_OVERFLOW:
+                    return None
+
+                path = os.path.join(self._wds[wd], os.fsdecode(name))
+
+                if mask & self._IN_ISDIR and mask & self._IN_CREATE and \
+                        self._recursive[wd]:
+                    self._add_watch(path, True)
+
+                changed.add(path)
+
+            ready, _, _ = select.select([self._fd], [], [], self._SETTLE)
+
+            if not ready:
+                return changed
+
+            data = os.read(self._fd, 1 << 16)
+
+    def _add_watch(self, path, recursive):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), self._MASK,
+        )
+
+        if wd < 0:
+            errno = self._get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+        self._wds[wd] = os.path.abspath(path)
+        self._recursive[wd] = recursive
+
+
+class _PollingWatcher:
+    """Watch directories for changed files by comparing file stats."""
+
+    def __init__(self, dirs, interval):
+        self._dirs = dirs
+        self._interval = interval
+        self._snapshot = self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def wait(self):
+        """Block until files change and return their absolute paths."""
+        import time
+
+        while True:
+            time.sleep(self._interval)
+            snapshot = self._scan()
+            changed = {
+                path
+                for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+            }
+            self._snapshot = snapshot
+
+            if changed:
+                return changed
+
+    def _scan(self):
+        snapshot = {}
+
+        for top, recursive in self._dirs.items():
+            for dirpath in _walk_dirs(top, recursive):
+                try:
+                    entries = list(os.scandir(dirpath))
+                except FileNotFoundError:
+                    continue
+
+                for entry in entries:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+
+                    path = os.path.abspath(entry.path)
+                    snapshot[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+        return snapshot
+
+
+def _walk_dirs(top, recursive):
+    """Yield directory `top` and, if `recursive`, all its subdirectories."""
+    if not recursive:
+        yield top
+        return
+
+    for dirpath, _, _ in os.walk(top):
+        yield dirpath
+
+
+class Substitution:
+    """Substitute multiple placeholders in a single pass.
+
+    Argument `mapping` maps placeholder strings to their replacements.  All
+    placeholders are compiled into a single pattern that prefers the longest
+    placeholder at any position.  If `skip_comments` is true, placeholders in
+    SQL line comments and (nested) block comments are kept as is.  Comments
+    are found with the lexer of strip_transactions() (see _comment_spans()) so
+    that comment markers within string literals, quoted identifiers and
+    dollar quotes are not mistaken for comments.  Placeholders and text are
+    either all str or all bytes (see encode()).
+    """
+
+    def __init__(self, mapping, skip_comments=False):
+        self.mapping = dict(mapping)
+        self.skip_comments = skip_comments
+
+        if '' in self.mapping or b'' in self.mapping:
+            raise ValueError("empty placeholder")
+
+        self._pattern = None
+
+        if not self.mapping:
+            return
+
+        bar = b'|' if isinstance(next(iter(self.mapping)), bytes) else '|'
+        alternatives = bar.join(
+            re.escape(ph)
+            for ph in sorted(self.mapping, key=len, reverse=True)
+        )
+
+        self._pattern = re.compile(alternatives)
+
+    def __call__(self, text):
+        return self.subn(text)[0]
+
+    def __bool__(self):
+        return bool(self.mapping)
+
+    def extend(self, mapping):
+        """Return a new Substitution that also substitutes `mapping`."""
+        return Substitution({**self.mapping, **mapping}, self.skip_comments)
+
+    def encode(self, encoding):
+        """Return an equivalent Substitution of bytes in `encoding`."""
+        return Substitution({
+            (ph.encode(encoding) if isinstance(ph, str) else ph):
+                (value.encode(encoding) if isinstance(value, str) else value)
+            for ph, value in self.mapping.items()
+        }, self.skip_comments)
+
+    def subn(self, text):
+        """Return `text` with placeholders substituted and the number of
+        substitutions made."""
+        if not self._pattern:
+            return text, 0
+
+        if not self.skip_comments:
+            return self._pattern.subn(self._replace, text)
+
+        parts = []
+        count = 0
+        pos = 0
+
+        for start, end in itertools.chain(
+            _comment_spans(text), [(len(text), len(text))],
+        ):
+            sub, n = self._pattern.subn(self._replace, text[pos:start])
+            parts.append(sub)
+            parts.append(text[start:end])
+            count += n
+            pos = end
+
+        return text[:0].join(parts), count
+
+    def finditer(self, text, start, end):
+        """Iterate over placeholder matches in `text[start:end]`.
+
+        Comments are not skipped.
+        """
+        if not self._pattern:
+            return iter(())
+        return self._pattern.finditer(text, start, end)
+
+    def straddles(self, before, after):
+        """Could a placeholder match across the junction of `before` and
+        `after`?"""
+        return any(
+            before.endswith(ph[:i]) and after.startswith(ph[i:])
+            for ph in self.mapping
+            for i in range(1, len(ph))
+        )
+
+    def _replace(self, m):
+        return self.mapping[m.group()]
+
+
+def _comment_spans(text, start=0, end=None):
+    """Yield the (start, end) positions of the SQL comments in `text` from
+    `start` to `end`.
+
+    String literals and quoted identifiers are skipped.  The content of
+    dollar quotes is scanned like SQL code because it usually is a function
+    body, but no comment or literal extends past the closing tag.
+    """
+    lex = _Lexer.get(type(text))
+    quote_end = {
+        'estring': lex.estring_end,
+        'squote': lex.squote_end,
+        'dquote': lex.dquote_end,
+    }
+
+    if end is None:
+        end = len(text)
+
+    pos = start
+
+    while True:
+        m = lex.special.search(text, pos, end)
+        if not m:
+            return
+
+        token = lex.token.match(text, m.start(), end)
+        kind = token.lastgroup
+        pos = token.end()
+
+        if kind == 'line_comment':
+            pos = text.find(lex.lf, pos, end)
+            pos = end if pos < 0 else pos
+            yield m.start(), pos
+        elif kind == 'block_comment':
+            depth = 1
+            for c in lex.block_comment.finditer(text, pos, end):
+                depth += 1 if c.group() == lex.block_start else -1
+                if depth == 0:
+                    pos = c.end()
+                    break
+            else:
+                pos = end
+            yield m.start(), pos
+        elif kind in quote_end:
+            while True:
+                q = quote_end[kind].search(text, pos, end)
+                if not q:
+                    pos = end
+                    break
+                pos = q.end()
+                if len(q.group()) == 1:
+                    if pos == end or text[pos:pos + 1] != q.group():
+                        break
+                    pos += 1
+        elif kind == 'dollar':
+            tag = token.group()
+            close = text.find(tag, pos, end)
+            close = end if close < 0 else close
+            yield from _comment_spans(text, pos, close)
+            pos = min(end, close + len(tag))
+
+
+def strip_transactions(chunks, stripped=None):
+    """Strip transaction control commands from a Sqitch change script.
+
+    Sqitch recommends explicit transactions for atomic changes.  Extension
+    scripts, however, do not permit transaction control commands because
+    extensions are installed in an implicit transaction.  Therefore, scripts
+    must be stripped of transaction control commands.
+
+    The script is read from `chunks`, an iterable of str or bytes of arbitrary
+    size (e.g. lines or blocks), and yielded in pieces of the same type.  A
+    streaming SQL lexer tracks string literals (including escape strings and
+    dollar quotes), quoted identifiers, and line and nested block comments.
+    Only top-level statements BEGIN, START TRANSACTION, COMMIT and END are
+    removed, case-insensitively and with optional transaction modes or
+    chaining.  Statements within the body of CREATE FUNCTION ... BEGIN ATOMIC
+    are kept, and so is the data of COPY ... FROM STDIN up to the line \\.
+    Runs of statements that start with any other keyword, or with CREATE
+    but without a BEGIN keyword, are skipped with a single pattern match, so
+    that only those statements are tokenized.
+    Consider the following definition of function `foo` that returns a
+    string that is formatted such that BEGIN and COMMIT appear on separate
+    lines as if they are transaction control commands.
+
+        BEGIN;
+
+        CREATE FUNCTION foo()
+            RETURNS text
+            LANGUAGE plpgsql
+            AS $$
+        BEGIN
+            RETURN '
+        BEGIN;
+        COMMIT;
+        ';
+        END $$;
+
+        COMMIT;
+
+    Only the first and last line are removed.  Whitespace that precedes a
+    removed statement on its line is removed as well, and so is the rest of
+    the line if it contains nothing but whitespace.
+
+    If list `stripped` is given, a Stripped tuple is appended to it for every
+    removed statement.
+    """
+    stripper = _TransactionStripper(stripped)
+
+    for chunk in chunks:
+        yield from stripper.feed(chunk)
+
+    yield from stripper.close()
+
+
+class Stripped(t.NamedTuple):
+    """Statement removed by strip_transactions()."""
+
+    line: int
+    statement: t.Union[str, bytes]
+
+
+class _TransactionStripper:
+    """Lexer state of strip_transactions()."""
+
+    # Candidates for transaction control statements are buffered until they
+    # are complete.  Give up on longer statements to bound memory usage.
+    _MAX_CANDIDATE = 1 << 12
+
+    def __init__(self, stripped=None, spans=None):
+        self._stripped = stripped
+        self._lex = None
+        self._buf = None
+        self._pos = 0
+
+        # If list `spans` is given, the (start, end) offsets of removed parts
+        # of the input are appended to it instead of copying the remaining
+        # text to the output.  `_base` is the offset of `_buf`.
+        self._spans = spans
+        self._base = 0
+        self._out = []
+        self._line = 1
+
+        # Current lexer state and its argument (e.g. the dollar-quote tag).
+        self._state = 'top'
+        self._arg = None
+
+        # At the start of a statement (i.e. only whitespace and comments since
+        # the last top-level semicolon)?
+        self._stmt_start = True
+
+        # At the start of a line (i.e. only whitespace since the last line
+        # feed or removed statement)?
+        self._line_start = True
+
+        # Whitespace at the start of a line and statement is held back in case
+        # a transaction control statement follows.
+        self._held = []
+
+        # Parts and keywords of a buffered transaction control statement.
+        self._cand = None
+        self._cand_words = []
+        self._cand_line = 0
+        self._cand_size = 0
+        self._cand_line_start = False
+
+        # After removing a statement: swallow trailing whitespace and, if
+        # `_strip_line`, the line feed.
+        self._after_strip = False
+        self._strip_line = False
+
+        # The first keywords of the current statement and the BEGIN ... END
+        # depth of CREATE FUNCTION ... BEGIN ATOMIC bodies.
+        self._idents = []
+        self._depth = 0
+
+        # Is the current statement COPY ... FROM STDIN?  Its data follows the
+        # statement up to a line \. and is not SQL.
+        self._copy = False
+
+    def feed(self, chunk):
+        if self._lex is None:
+            self._lex = _Lexer.get(type(chunk))
+            self._buf = chunk[:0]
+
+        drop = self._pos - 1 if self._pos else 0
+        self._buf = self._buf[drop:] + chunk
+        self._base += drop
+        self._pos = 1 if self._pos else 0
+        self._scan(eof=False)
+
+        return self._flush()
+
+    def close(self):
+        if self._lex is not None:
+            self._scan(eof=True)
+
+            if self._cand is not None:
+                self._abort()
+
+            self._out.extend(self._held)
+            self._held = []
+
+        return self._flush()
+
+    def _flush(self):
+        out, self._out = self._out, []
+        return out
+
+    def _emit(self, text):
+        if self._cand is not None:
+            self._cand.append(text)
+            self._cand_size += len(text)
+        else:
+            self._out.append(text)
+
+    def _remove(self, start, end):
+        """Record that `_buf[start:end]` is removed."""
+        if self._spans is None or start == end:
+            return
+
+        start += self._base
+        end += self._base
+
+        if self._spans and self._spans[-1][1] == start:
+            start = self._spans.pop()[0]
+
+        self._spans.append((start, end))
+
+    def _consume(self, end):
+        if self._spans is not None and self._cand is None:
+            self._line += self._buf.count(self._lex.lf, self._pos, end)
+            self._pos = end
+            return
+
+        text = self._buf[self._pos:end]
+        self._line += text.count(self._lex.lf)
+        self._pos = end
+        self._emit(text)
+
+    def _scan(self, eof):
+        lex = self._lex
+        buf = self._buf
+
+        while self._pos < len(buf):
+            state = self._state
+            pos = self._pos
+
+            if state == 'top':
+                if self._skips_statements() and \
+                        buf.find(lex.semicolon, pos) >= 0:
+                    m = lex.statements.match(buf, pos)
+                    if m:
+                        self._out.extend(self._held)
+                        self._held = []
+                        self._line_start = False
+                        self._consume(m.end())
+                        continue
+
+                elif self._fast():
+                    m = lex.parts.match(buf, pos)
+                    if m.end() > pos:
+                        self._consume(m.end())
+                        continue
+
+                    m = lex.special.search(buf, pos)
+                    if m:
+                        end = m.start()
+                    else:
+                        end = len(buf) if eof else max(pos, len(buf) - 1)
+                    if end > pos:
+                        self._consume(end)
+                        continue
+                    if not m and not eof:
+                        break
+                elif self._skips_to_begin() and \
+                        not lex.in_word.match(buf, pos):
+                    m = lex.special.search(buf, pos)
+                    if m:
+                        end = m.start()
+                    elif eof:
+                        end = len(buf)
+                    else:
+                        end = lex.partial.search(buf, pos).start()
+                    begin = lex.begin.search(buf, pos, end)
+                    if begin:
+                        end = begin.start()
+                    if end > pos:
+                        self._consume(end)
+                        continue
+
+                m = lex.token.match(buf, pos)
+
+                # Wait for the rest of a token, including a dollar-quote tag
+                # that is cut short by the end of the buffer.
+                if not eof and (m.end() == len(buf) or (
+                    m.lastgroup == 'other' and
+                    lex.dollar_prefix.match(buf, pos)
+                )):
+                    break
+
+                self._token(m.lastgroup, m.group(), m.end())
+
+            elif state == 'line_comment':
+                end = buf.find(lex.lf, pos)
+                if end < 0:
+                    end = len(buf)
+                else:
+                    self._state = 'top'
+                self._consume(end)
+
+            elif state == 'block_comment':
+                m = lex.block_comment.search(buf, pos)
+                if not m:
+                    self._consume(len(buf) if eof else max(pos, len(buf) - 1))
+                    if not eof:
+                        break
+                    continue
+                self._arg += 1 if m.group() == lex.block_start else -1
+                if self._arg == 0:
+                    self._state = 'top'
+                self._consume(m.end())
+
+            elif state == 'copy':
+                m = lex.copy_end.search(buf, pos)
+                if not m:
+                    self._consume(len(buf) if eof else max(pos, len(buf) - 3))
+                    if not eof:
+                        break
+                    continue
+                self._state = 'top'
+                self._line_start = True
+                self._consume(m.end())
+
+            elif state == 'dollar':
+                end = buf.find(self._arg, pos)
+                if end < 0:
+                    keep = 0 if eof else len(self._arg) - 1
+                    self._consume(max(pos, len(buf) - keep))
+                    if not eof:
+                        break
+                    continue
+                self._state = 'top'
+                self._consume(end + len(self._arg))
+
+            else:
+                # Quoted literals and identifiers end with a quote that is not
+                # doubled.  Escape strings also treat backslashes as escape.
+                m = self._arg.search(buf, pos)
+                if not m:
+                    self._consume(len(buf) if eof else max(pos, len(buf) - 1))
+                    if not eof:
+                        break
+                    continue
+                end = m.end()
+                if len(m.group()) == 1:
+                    if end == len(buf) and not eof:
+                        self._consume(m.start())
+                        break
+                    if buf[end:end + 1] == m.group():
+                        end += 1
+                    else:
+                        self._state = 'top'
+                self._consume(end)
+
+    def _skips_statements(self):
+        """Can the lexer skip whole statements that are not candidates for
+        transaction control, COPY ... FROM STDIN or CREATE FUNCTION?"""
+        return self._stmt_start and not self._after_strip and \
+            self._cand is None
+
+    def _fast(self):
+        """Can the lexer skip to the next quote, comment or semicolon?"""
+        return not (
+            self._stmt_start or self._after_strip or
+            self._cand is not None or self._tracks_function() or
+            self._idents[:1] == ['COPY']
+        )
+
+    def _skips_to_begin(self):
+        """Can the lexer skip to the next BEGIN in CREATE FUNCTION or
+        PROCEDURE?  Nothing else matters before a BEGIN ATOMIC body."""
+        return not (
+            self._stmt_start or self._after_strip or
+            self._cand is not None or self._depth
+        ) and self._tracks_function() and (
+            'FUNCTION' in self._idents or 'PROCEDURE' in self._idents
+        )
+
+    def _tracks_function(self):
+        """Could the current statement be CREATE [OR REPLACE] FUNCTION or
+        PROCEDURE?  Those need to be tracked to recognize semicolons in
+        BEGIN ATOMIC bodies."""
+        idents = self._idents + [None] * 4
+
+        if idents[0] != 'CREATE':
+            return False
+
+        if idents[1] == 'OR':
+            return idents[2] in ('REPLACE', None) and \
+                idents[3] in ('FUNCTION', 'PROCEDURE', None)
+
+        return idents[1] in ('FUNCTION', 'PROCEDURE', None)
+
+    def _token(self, kind, text, end):
+        lex = self._lex
+
+        if kind == 'hspace':
+            self._pos = end
+            if self._after_strip:
+                self._remove(end - len(text), end)
+            elif self._stmt_start and self._line_start and self._cand is None:
+                self._held.append(text)
+            else:
+                self._emit(text)
+            return
+
+        if kind == 'newline':
+            self._pos = end
+            self._line += text.count(lex.lf)
+
+            if self._after_strip:
+                self._after_strip = False
+                if self._strip_line:
+                    self._remove(end - len(text), end)
+                    self._line_start = True
+                    return
+
+            if self._cand is None:
+                self._out.extend(self._held)
+                self._held = []
+
+            self._emit(text)
+            self._line_start = True
+            return
+
+        self._after_strip = False
+
+        if kind in ('line_comment', 'block_comment'):
+            if self._cand is None:
+                self._out.extend(self._held)
+                self._held = []
+            self._line_start = False
+            self._state = kind
+            self._arg = 1
+            self._consume(end)
+            return
+
+        word = lex.upper(text) if kind == 'word' else None
+
+        if self._cand is not None:
+            if kind == 'comma' or word in _TRANSACTION_WORDS:
+                self._cand_words.append(word or ',')
+                self._consume(end)
+                if self._cand_size > self._MAX_CANDIDATE:
+                    self._abort()
+                return
+
+            if kind == 'semicolon':
+                self._consume(end)
+                if _is_transaction_control(self._cand_words):
+                    self._strip()
+                else:
+                    self._abort()
+                    self._end_statement()
+                return
+
+            self._abort()
+
+        if kind == 'word' and self._stmt_start and self._depth == 0 and \
+                word in _TRANSACTION_STARTS:
+            self._cand = self._held
+            self._cand_size = sum(map(len, self._cand))
+            self._cand_words = [word]
+            self._cand_line = self._line
+            self._cand_line_start = self._line_start
+            self._held = []
+            self._stmt_start = False
+            self._line_start = False
+            self._consume(end)
+            return
+
+        self._out.extend(self._held)
+        self._held = []
+        self._line_start = False
+
+        if kind == 'semicolon':
+            self._consume(end)
+            if self._depth == 0:
+                if self._copy:
+                    self._state = 'copy'
+                self._end_statement()
+            return
+
+        self._stmt_start = False
+
+        if kind == 'word':
+            if len(self._idents) < 4:
+                self._idents.append(word)
+            if word == 'STDIN' and self._idents[0] == 'COPY':
+                self._copy = True
+            if self._depth or self._tracks_function():
+                if word == 'BEGIN':
+                    self._depth += 1
+                elif word == 'CASE' and self._depth:
+                    self._depth += 1
+                elif word == 'END' and self._depth:
+                    self._depth -= 1
+        elif kind == 'estring':
+            self._state = 'quote'
+            self._arg = lex.estring_end
+        elif kind == 'squote':
+            self._state = 'quote'
+            self._arg = lex.squote_end
+        elif kind == 'dquote':
+            self._state = 'quote'
+            self._arg = lex.dquote_end
+        elif kind == 'dollar':
+            self._state = 'dollar'
+            self._arg = text
+
+        self._consume(end)
+
+    def _strip(self):
+        parts = self._cand
+        self._cand = None
+        self._remove(self._pos - self._cand_size, self._pos)
+
+        if self._stripped is not None:
+            statement = parts[0][:0].join(parts).strip()
+            self._stripped.append(Stripped(self._cand_line, statement))
+
+        self._after_strip = True
+        self._strip_line = self._cand_line_start
+        self._line_start = self._cand_line_start
+        self._end_statement()
+
+    def _abort(self):
+        """Emit the buffered candidate as a regular statement."""
+        parts = self._cand
+        self._cand = None
+        self._out.extend(parts)
 
-    try:
-        project = read_project()
-    except EmptyPlan:
-        die("empty plan")
-    except ProjectNotFound:
-        die("no project")
+    def _end_statement(self):
+        self._stmt_start = True
+        self._idents = []
+        self._depth = 0
+        self._copy = False
 
-    try:
-        write_extension(project, opts.dest, opts.extschema)
-    except InvalidName as exc:
-        die(f"invalid extension name or version: {exc}")
 
+class _Lexer:
+    """Patterns of strip_transactions() for either str or bytes."""
 
-def read_project():
-    proc = subprocess.run(
-        args=[
-            'sqitch', '--quiet',
-            'plan', '--no-header', '--format', 'format:%o %n %{ }t',
-        ],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True,
-    )
+    _cache = {}
 
-    # We cannot get the project name from the sqitch-plan output in case of an
-    # empty plan.  sqitch-plan also includes the project name in its optional
-    # headers but those are always omitted on empty plans.  The only other
-    # possibility is to parse the project pragma from the plan file.  But the
-    # plan file path must be resolved from the project config first.  It's not
-    # worth the effort just to generate an empty extension.
-    if proc.returncode == 1:
-        raise EmptyPlan
+    def __init__(self, type_):
+        if type_ is str:
+            def compile(pattern, flags=0):
+                return re.compile(pattern.replace('HI', '\\x80-\\U0010ffff'),
+                                  flags)
+            self.upper = str.upper
+        else:
+            def compile(pattern, flags=0):
+                return re.compile(
+                    pattern.replace('HI', '\\x80-\\xff').encode(), flags,
+                )
+            self.upper = _upper_bytes
 
-    if proc.returncode == 2:
-        raise ProjectNotFound
+        ident = r'[A-Za-z_HI][\w$HI]*'
 
-    project = None
+        self.token = compile(rf"""
+            (?P<hspace>[ \t\f\v]+)
+          | (?P<newline>\r\n|\n|\r)
+          | (?P<line_comment>--)
+          | (?P<block_comment>/\*)
+          | (?P<estring>[Ee]')
+          | (?P<squote>')
+          | (?P<dquote>")
+          | (?P<dollar>\$(?:[A-Za-z_HI][\wHI]*)?\$)
+          | (?P<word>{ident})
+          | (?P<semicolon>;)
+          | (?P<comma>,)
+          | (?P<other>[0-9]+|.)
+        """, re.X | re.S)
 
-    for line in proc.stdout.splitlines():
-        pname, cname, *tags = re.split(r'\s+', line.strip())
+        # Tokens other than plain text and semicolons that need no further
+        # attention within a statement.  None of them can match in another
+        # way when a pattern backtracks, and escape strings and dollar quotes
+        # cannot follow identifier characters as in `special`.  A quote after
+        # such an E starts an escape string.  Group names end with `g`.
+        special = r"""
+            ' (?<![^\w$HI][Ee]') (?<!^[Ee]') [^']* '
+          | (?<![\w$HI]) \$\$ [^$]* (?: \$ (?!\$) [^$]* )* \$\$
+          | (?<![\w$HI]) (?P<tag{g}> \$ [A-Za-z_HI][\wHI]* \$ )
+            [^$]* (?: (?!(?P=tag{g})) \$ [^$]* )* (?P=tag{g})
+          | -- [^\n]* \n
+          | /\* [^*/]* (?: (?: \*(?!/) | /(?!\*) ) [^*/]* )* \*/
+          | " [^"]* "
+          | (?<![\w$HI]) [Ee]' [^'\\]* (?: (?: \\. | '' ) [^'\\]* )* ' (?=[^'])
+          | - (?=[^-])
+          | / (?=[^*])
+          | (?<=[\w$HI]) \$
+          | (?<![\w$HI]) \$ (?=[^A-Za-z_HI$])
+        """
+        text = r"""[^;'"$/\-]"""
 
-        if project:
-            assert pname == project.name
-        else:
-            project = Project(pname, plan=[])
+        # Complete tokens other than semicolons in long runs.  Plain text is
+        # followed by a character that ends it, so that nothing is cut short
+        # at the end of the input.
+        self.parts = compile(rf"""
+            (?:
+                {text}+ (?= [;"$/\-] | ' (?<![^\w$HI][Ee]') (?<!^[Ee]') )
+              | {special.format(g='')}
+              | {text}* (?<![\w$HI]) (?=[Ee]')
+            )*
+        """, re.X | re.S)
 
-        project.plan.append(Change(cname, tags))
+        # Statement up to its semicolon, unrolled so that runs of plain text
+        # are matched in one go.  The variant for CREATE statements does not
+        # match the keyword BEGIN, which may start a BEGIN ATOMIC body in
+        # CREATE FUNCTION or PROCEDURE, even within identifiers.
+        body = rf"""
+            {text}* (?: (?: {special.format(g='')} ) {text}* )*
+        """
+        no_begin = r"""
+            [^;'"$/\-Bb]*
+            (?: (?: {special} | [Bb] (?!(?i:EGIN)) ) [^;'"$/\-Bb]* )*
+        """.format(special=special.format(g='_'))
 
-    assert project
+        # Complete statements, including preceding whitespace and comments,
+        # that do not start with a keyword that needs to be tracked.  CREATE
+        # only needs to be tracked for a BEGIN ATOMIC body.  Leading
+        # whitespace and comments cannot be cut short.
+        self.statements = compile(rf"""
+            (?:
+                (?:
+                    [ \t\f\v\r\n]+
+                  | -- [^\n]* \n
+                  | /\* [^*/]* (?: (?: \*(?!/) | /(?!\*) ) [^*/]* )* \*/
+                )*
+                (?! [ \t\f\v\r\n] | -- | /\* )
+                (?:
+                    (?i: CREATE ) (?![\w$HI]) {no_begin}
+                  | (?! (?i: BEGIN | START | COMMIT | END | COPY | CREATE )
+                        (?![\w$HI]) )
+                    {body}
+                )
+                ;
+            )+
+        """, re.X | re.S)
 
-    return project
+        # Tokens that end the fast path.  Escape strings and dollar quotes
+        # cannot follow identifier characters.
+        self.special = compile(r"""
+            [;'"] | -- | /\* | (?<![\w$HI]) (?: [Ee]' | \$ )
+        """, re.X)
 
+        # Run of identifier characters that ends with a keyword that may
+        # start a BEGIN ATOMIC body.  The tokenizer may still split the run
+        # after numbers and lone dollar signs.
+        self.begin = compile(
+            r'(?<![\w$HI])[\w$HI]*?(?i:BEGIN)(?![\w$HI])',
+        )
 
-def write_extension(project, dest, extschema):
-    extname = valid_name(project.name)
-    guard = rf'\echo Use "CREATE EXTENSION {extname}" to load this file. \quit'
+        # Position within a run of identifier characters.
+        self.in_word = compile(r'(?<=[\w$HI])')
 
-    filename = functools.partial(os.path.join, dest)
+        # Word or other character at the end of the input that may continue
+        # in the next chunk.
+        self.partial = compile(r'(?:[\w$HI]+|.)?\Z', re.S)
 
-    os.makedirs(dest, exist_ok=True)
+        # Incomplete dollar-quote tag at the end of the input.
+        self.dollar_prefix = compile(r'\$(?:[A-Za-z_HI][\wHI]*)?\Z')
 
-    # Create empty control file.
-    with open(filename(f'{extname}.control'), 'w'):
-        pass
+        self.block_comment = compile(r'/\*|\*/')
+        self.copy_end = compile(r'\n\\\.(?:\r\n|\n|\r)')
+        self.estring_end = compile(r"\\.|'", re.S)
+        self.squote_end = compile(r"'")
+        self.dquote_end = compile(r'"')
 
-    for cs in project.changesets:
-        with open(filename(cs.filename(extname)), 'w') as ext:
-            ext.write(guard)
-            ext.write('\n')
-            for cname, tag in cs.changes:
-                with project.open_deploy_script(cname, tag) as fp:
-                    for ln in strip_transactions(fp):
-                        if extschema:
-                            ln = ln.replace(extschema, '@extschema@')
-                        ext.write(ln)
+        self.lf = '\n' if type_ is str else b'\n'
+        self.semicolon = ';' if type_ is str else b';'
+        self.block_start = '/*' if type_ is str else b'/*'
 
+    @classmethod
+    def get(cls, type_):
+        try:
+            return cls._cache[type_]
+        except KeyError:
+            return cls._cache.setdefault(type_, cls(type_))
 
-def strip_transactions(lines):
-    """Strip transaction control commands from lines of a Sqitch change script.
 
-    Sqitch recommends explicit transactions for atomic changes.  Extension
-    scripts, however, do not permit transaction control commands because
-    extensions are installed in an implicit transaction.  Therefore, scripts
-    must be stripped of transaction control commands.
+def _upper_bytes(word):
+    return word.decode('latin-1').upper()
 
-    The filter removes lines that only contain the commands BEGIN or COMMIT
-    followed by a semicolon.  A single trailing line feed is the only allowed
-    whitespace.  The filter is case-insensitive.
 
-    The filter is that strict to minimize edge cases where it would detect
-    false positives in certain contexts, e.g. multiline string literals.
+_TRANSACTION_STARTS = {'BEGIN', 'START', 'COMMIT', 'END'}
 
-    Consider the following definition of function `foo` that returns a string
-    that is formatted such that BEGIN and COMMIT appear on separate lines as if
-    they are transaction control commands.
+_TRANSACTION_MODES = {
+    'ISOLATION', 'LEVEL', 'SERIALIZABLE', 'REPEATABLE', 'READ', 'COMMITTED',
+    'UNCOMMITTED', 'WRITE', 'ONLY', 'NOT', 'DEFERRABLE', ',',
+}
 
-        BEGIN;
+_TRANSACTION_WORDS = {
+    'WORK', 'TRANSACTION', 'AND', 'NO', 'CHAIN',
+} | _TRANSACTION_MODES
 
-        CREATE FUNCTION foo()
-            RETURNS text
-            LANGUAGE plpgsql
-            AS $$
-        BEGIN
-            RETURN '
-        BEGIN;
-        COMMIT;
-        ';
-        END $$;
 
-        COMMIT;
+def _is_transaction_control(words):
+    """Check that `words` form a transaction control statement.
+
+        BEGIN [ WORK | TRANSACTION ] [ transaction_mode [, ...] ]
+        START TRANSACTION [ transaction_mode [, ...] ]
+        COMMIT [ WORK | TRANSACTION ] [ AND [ NO ] CHAIN ]
+        END [ WORK | TRANSACTION ] [ AND [ NO ] CHAIN ]
+    """
+    first, *rest = words
+
+    if first == 'START':
+        if rest[:1] != ['TRANSACTION']:
+            return False
+        rest = rest[1:]
+    elif rest[:1] in (['WORK'], ['TRANSACTION']):
+        rest = rest[1:]
+
+    if first in ('COMMIT', 'END'):
+        return rest in ([], ['AND', 'CHAIN'], ['AND', 'NO', 'CHAIN'])
+
+    return all(w in _TRANSACTION_MODES for w in rest)
+
+
+def minify(script, bodies=False):
+    """Remove comments and redundant whitespace from SQL `script`.
+
+    The script is a complete str or bytes.  String literals, quoted
+    identifiers, dollar-quoted strings, and the data of COPY ... FROM STDIN
+    are kept byte-exact.  Whitespace and comments between tokens are replaced
+    by a single space, or a line feed if they span lines (string constants
+    continue across line feeds only), and removed next to parentheses, commas
+    and semicolons.  If `bodies` is true, the dollar-quoted bodies of SQL and
+    PL/pgSQL functions, procedures and DO blocks are minified as well.  The
+    result ends with a line feed unless it is empty.
     """
-    return filter(
-        lambda ln: ln.upper() not in ('BEGIN;\n', 'COMMIT;\n'),
-        lines,
+    lex = _Lexer.get(type(script))
+    space, tight = (' ', '(),;') if isinstance(script, str) else \
+        (b' ', b'(),;')
+    quote_end = {
+        'estring': lex.estring_end,
+        'squote': lex.squote_end,
+        'dquote': lex.dquote_end,
+    }
+
+    out = []
+    sep = None
+    last = script[:0]
+    pos = 0
+
+    # Uppercase words (and quoted names) of the current statement and the
+    # positions in `out` of dollar-quoted strings that may be bodies.
+    words = []
+    candidates = []
+
+    def emit(text):
+        nonlocal sep, last
+        if sep and last and last not in tight and text[:1] not in tight:
+            out.append(sep)
+        sep = None
+        out.append(text)
+        last = text[-1:]
+
+    def end_statement():
+        if candidates:
+            language = 'PLPGSQL' if words[0] == 'DO' else None
+            if 'LANGUAGE' in words[:-1]:
+                language = words[words.index('LANGUAGE') + 1]
+            if language in ('SQL', 'PLPGSQL'):
+                for i in candidates:
+                    out[i] = minify(out[i], bodies).rstrip(lex.lf)
+        words.clear()
+        candidates.clear()
+
+    while pos < len(script):
+        m = lex.token.match(script, pos)
+        kind = m.lastgroup
+        end = m.end()
+
+        if kind == 'hspace':
+            sep = sep or space
+        elif kind == 'newline':
+            sep = lex.lf
+        elif kind == 'line_comment':
+            end = script.find(lex.lf, end)
+            end = len(script) if end < 0 else end
+            sep = sep or space
+        elif kind == 'block_comment':
+            depth = 1
+            end = len(script)
+            for c in lex.block_comment.finditer(script, m.end()):
+                depth += 1 if c.group() == lex.block_start else -1
+                if depth == 0:
+                    end = c.end()
+                    break
+            sep = sep or space
+        elif kind in quote_end:
+            while True:
+                q = quote_end[kind].search(script, end)
+                if not q:
+                    end = len(script)
+                    break
+                end = q.end()
+                if len(q.group()) == 1:
+                    if script[end:end + 1] != q.group():
+                        break
+                    end += 1
+            emit(script[pos:end])
+            name = script[m.end():end - 1]
+            words.append(
+                lex.upper(name) if kind == 'dquote' or name.isalpha() else "'"
+            )
+        elif kind == 'dollar':
+            tag = m.group()
+            close = script.find(tag, end)
+            close = len(script) if close < 0 else close
+            emit(tag)
+            if bodies and _is_body(words):
+                candidates.append(len(out))
+            out.append(script[end:close])
+            end = min(len(script), close + len(tag))
+            out.append(script[close:end])
+            last = tag[-1:]
+            words.append('$')
+        elif kind == 'semicolon':
+            emit(m.group())
+            if words[:1] == ['COPY'] and 'STDIN' in words:
+                # Data follows up to a line \.
+                c = lex.copy_end.search(script, end)
+                end = c.end() if c else len(script)
+                out.append(script[m.end():end])
+                last = lex.lf
+            end_statement()
+        else:
+            emit(m.group())
+            if kind == 'word':
+                words.append(lex.upper(m.group()))
+
+        pos = end
+
+    if words:
+        end_statement()
+
+    if out:
+        out.append(lex.lf)
+
+    return script[:0].join(out)
+
+
+def _is_body(words):
+    """Is a dollar-quoted string after `words` (see minify()) the body of a
+    function, procedure or DO block?"""
+    if words[:1] == ['DO']:
+        return len(words) == 1 or len(words) == 3 and words[1] == 'LANGUAGE'
+
+    return words[:1] == ['CREATE'] and words[-1:] == ['AS'] and bool(
+        {'FUNCTION', 'PROCEDURE'} & set(words[:5]),
     )
 
 
@@ -169,15 +3733,39 @@ class Project(t.NamedTuple):
     """Sqitch project."""
 
     name: str
-    plan: t.List['Change']
+    plan: t.Sequence['Change']
+    deploy_dir: str = 'deploy'
+
+    # Precomputed changesets of the plan, e.g. from the plan cache.
+    changeset_cache: t.Optional[t.List['Changeset']] = None
+
+    # Read deploy scripts of tagged changes from these git objects instead of
+    # reworked deploy scripts.
+    git: t.Optional['GitObjects'] = None
 
     @property
     def changesets(self):
+        if self.changeset_cache is not None:
+            return iter(self.changeset_cache)
+        return self.changesets_between()
+
+    def changesets_between(self, start=0, stop=None):
+        """Return the changesets whose last change is within plan positions
+        `start` (inclusive) and `stop` (exclusive).
+
+        The plan is traced back from HEAD only as far as necessary to find the
+        changesets in that range and the tags of their reworked changes.
+        """
+        if stop is None:
+            stop = len(self.plan)
+
         # The final changesets.
         changesets = []
 
-        # Changes for a single changeset.
+        # Changes for a single changeset and the plan position of its last
+        # change.
         changes = []
+        end = None
 
         # The two most recent tags that determine a changeset version.
         # Changesets apply to the version given by the first tag and
@@ -189,7 +3777,9 @@ class Project(t.NamedTuple):
         rework = {}
 
         # Collect changes in reverse to trace back reworked changes.
-        for change in reversed(self.plan):
+        for pos in range(len(self.plan) - 1, -1, -1):
+            change = self.plan[pos]
+
             if change.tags:
                 tags.appendleft(change.tags[0])
 
@@ -206,31 +3796,593 @@ class Project(t.NamedTuple):
                     for cname, _ in cs.changes:
                         rework[cname] = cs.fromtag
 
-                    changesets.append(cs)
+                    if start <= end < stop:
+                        changesets.append(cs)
                     changes = []
 
+                    # Earlier changesets end before the requested range.
+                    if pos < start:
+                        break
+
+            if not changes:
+                end = pos
             changes.append(change.name)
+        else:
+            # Remaining changes before the first tag or untagged HEAD in
+            # case there are no tags at all.
+            if changes and start <= end < stop:
+                tags.appendleft('')
+                cs = Changeset(
+                    *tags,
+                    [
+                        (cname, rework.get(cname, ''))
+                        for cname in reversed(changes)
+                    ],
+                )
+                changesets.append(cs)
 
-        # Remaining changes before the first tag or untagged HEAD in
-        # case there are no tags at all.
-        if changes:
-            tags.appendleft('')
-            cs = Changeset(
-                *tags,
-                [
-                    (cname, rework.get(cname, ''))
-                    for cname in reversed(changes)
-                ],
+        return reversed(changesets)
+
+    def install_changesets(self, tags=None):
+        """Return changesets that install the given versions directly.
+
+        Each changeset contains every change planned up to the tag of the
+        respective version exactly once, using the deploy script of the
+        change's latest rework as of that tag.  Changes are ordered by their
+        first appearance in the plan unless a change must follow the changes
+        that its latest rework requires (see _order_changes()).  Argument
+        `tags` selects versions by tag (including the leading "@", or "" for
+        untagged HEAD) and defaults to all tagged versions.  The version of
+        the first changeset is omitted as it already has an install script.
+        Raise ValueError if required changes form a cycle.
+        """
+        changesets = []
+
+        # Map changes in order of first appearance to their latest script
+        # and the changes it requires.
+        latest = {}
+        requires = {}
+
+        pos = 0
+        for cs in self.changesets:
+            for cname, tag in cs.changes:
+                latest[cname] = tag
+                requires[cname] = self.plan[pos].requires
+                pos += 1
+
+            if not cs.fromtag:
+                continue
+
+            if cs.tag in tags if tags is not None else cs.tag:
+                changesets.append(Changeset('', cs.tag, _order_changes(
+                    self.name, latest, requires,
+                )))
+
+        return changesets
+
+    def update_changesets(self, paths):
+        """Return changesets that update between non-adjacent versions.
+
+        Argument `paths` is an iterable of (fromtag, tag) pairs with tags
+        including the leading "@" ("" as target denotes untagged HEAD).  Each
+        changeset contains every change planned after `fromtag` up to `tag`
+        exactly once, using the deploy script of the change's latest rework as
+        of `tag`.  Changes are ordered as for install_changesets() within that
+        part of the plan.  Pairs of adjacent versions are skipped as they
+        already have an update script.  Raise ValueError if a pair does not
+        denote an update path or if required changes form a cycle.
+        """
+        changesets = list(self.changesets)
+        versions = {cs.tag: i for i, cs in enumerate(changesets)}
+        result = []
+
+        # Plan positions of the first change of each changeset.
+        offsets = list(itertools.accumulate(
+            [0] + [len(cs.changes) for cs in changesets],
+        ))
+
+        for fromtag, tag in paths:
+            if not fromtag or fromtag not in versions or tag not in versions:
+                raise ValueError(f"no update path: {fromtag!r} to {tag!r}")
+
+            start = versions[fromtag] + 1
+            stop = versions[tag] + 1
+
+            if start >= stop:
+                raise ValueError(f"no update path: {fromtag!r} to {tag!r}")
+
+            if start + 1 == stop:
+                continue
+
+            latest = {}
+            requires = {}
+            pos = offsets[start]
+            for cs in changesets[start:stop]:
+                for cname, script in cs.changes:
+                    latest[cname] = script
+                    requires[cname] = self.plan[pos].requires
+                    pos += 1
+
+            result.append(Changeset(fromtag, tag, _order_changes(
+                self.name, latest, requires,
+            )))
+
+        return result
+
+    def elide_reworks(
+        self, changesets, cache=None, elided=None, encoding='utf-8',
+    ):
+        """Return `changesets` without unchanged reworks in update changesets.
+
+        A change is elided from a changeset that updates from version
+        `fromtag` if its deploy script equals the deploy script of the same
+        change as of `fromtag`.  Scripts are compared after stripping
+        transaction control commands, trailing whitespace on each line, and
+        leading and trailing blank lines.  Changesets whose changes are all
+        elided are kept with no changes so that the update path still exists.
+        Install changesets are returned unchanged.  Deploy scripts are read
+        through `cache` if given and compared as bytes in `encoding`.  If list
+        `elided` is given, an Elided tuple is appended to it for every elided
+        change.
+        """
+        changesets = list(changesets)
+        fromtags = {cs.fromtag for cs in changesets if cs.fromtag}
+
+        # Map versions to the deploy scripts of all their changes.
+        deployed = {}
+        latest = {}
+
+        for cs in self.changesets:
+            for cname, tag in cs.changes:
+                latest[cname] = tag
+
+            if cs.tag in fromtags:
+                deployed[cs.tag] = dict(latest)
+
+        @functools.lru_cache(maxsize=None)
+        def content(cname, tag):
+            script = self.read_deploy_script(
+                cname, tag, cache, encoding=encoding,
             )
-            changesets.append(cs)
+            lines = (ln.rstrip() for ln in script.splitlines())
+            return b'\n'.join(lines).strip()
 
-        return reversed(changesets)
+        result = []
 
-    def open_deploy_script(self, change, tag):
+        for cs in changesets:
+            if not cs.fromtag:
+                result.append(cs)
+                continue
+
+            previous = deployed.get(cs.fromtag, {})
+            changes = []
+
+            for cname, tag in cs.changes:
+                prev = previous.get(cname)
+
+                if prev is not None and (
+                    prev == tag or content(cname, prev) == content(cname, tag)
+                ):
+                    if elided is not None:
+                        elided.append(Elided(cs.fromtag, cs.tag, cname, tag))
+                else:
+                    changes.append((cname, tag))
+
+            result.append(cs._replace(changes=changes))
+
+        return result
+
+    def tag_index(self):
+        """Map tags (including the leading "@") to their plan positions."""
+        return {
+            tag: pos
+            for pos, change in enumerate(self.plan)
+            for tag in change.tags
+        }
+
+    def deploy_script_path(self, change, tag):
         if tag and not tag.startswith('@'):
             raise ValueError(f"tag {tag!r} must start with '@'")
 
-        return open(f'deploy/{change}{tag}.sql')
+        return os.path.join(self.deploy_dir, f'{change}{tag}.sql')
+
+    def git_script(self, change, tag):
+        """Return the git revision and path of the deploy script of `change`
+        as of `tag`, or None if it is read from the deploy directory.
+
+        With `git`, deploy scripts of tagged changes are read as of the git
+        revision of the Sqitch tag instead of reworked deploy scripts.
+        """
+        if self.git is None or not tag:
+            return None
+
+        # Reject malformed tags as for scripts in the deploy directory.
+        self.deploy_script_path(change, tag)
+
+        return self.git.rev(tag), self.deploy_script_path(change, '')
+
+    def open_deploy_script(self, change, tag):
+        blob = self.git_script(change, tag)
+
+        if blob is not None:
+            import io
+
+            return io.BytesIO(self.git.read(*blob))
+
+        return open(self.deploy_script_path(change, tag), 'rb')
+
+    def read_deploy_script(
+        self, change, tag, cache=None, stats=None, encoding='utf-8',
+        validate=False,
+    ):
+        """Return the deploy script stripped of transaction control commands.
+
+        The script is returned as bytes in `encoding` with line endings kept
+        as is and without a leading UTF-8 byte order mark.  It is only decoded
+        to raise UnicodeDecodeError on invalid bytes if `validate` is true.
+        The script is read through `cache` if given unless it is read from
+        git.  The number of scripts read and statements stripped is counted in
+        BuildStats `stats` if given.
+        """
+        import codecs
+
+        path = self.deploy_script_path(change, tag)
+        blob = self.git_script(change, tag)
+        encoding = codecs.lookup(encoding).name
+
+        if blob is not None:
+            path = ':'.join(blob)
+
+        def load():
+            stripped = None if stats is None else []
+            bom = _bom(encoding)
+
+            with self.open_deploy_script(change, tag) as fp:
+                if bom and fp.read(len(bom)) != bom:
+                    fp.seek(0)
+                chunks = iter(functools.partial(fp.read, _BUFSIZE), b'')
+                script = b''.join(strip_transactions(chunks, stripped))
+
+            if validate:
+                try:
+                    script.decode(encoding)
+                except UnicodeDecodeError as exc:
+                    raise _invalid_encoding(path, exc) from exc
+
+            if stats is not None:
+                stats.count('scripts_read')
+                stats.count('statements_stripped', len(stripped))
+
+            return script
+
+        if stats is not None:
+            stats.count('scripts')
+
+        if cache is None or blob is not None:
+            return load()
+
+        return cache.get(path, load, (encoding, validate))
+
+
+def _order_changes(project, latest, requires):
+    """Return the (change, tag) pairs of dict `latest` so that every change
+    follows the changes of `project` that it requires.
+
+    Dict `requires` maps changes to their required changes as listed in the
+    plan.  Changes keep the order of `latest` where possible.  Required
+    changes that are not in `latest`, of other projects, or tags only are
+    ignored, and so is a rework requiring its own earlier version.  Raise
+    ValueError if required changes form a cycle.
+    """
+    def required(cname):
+        for dep in requires.get(cname, ()):
+            pname, _, dep = dep.rpartition(':')
+            dep = dep.partition('@')[0]
+            if pname in ('', project) and dep in latest and dep != cname:
+                yield dep
+
+    result = []
+    done = set()
+
+    for cname in latest:
+        if cname in done:
+            continue
+
+        # Depth-first search without recursion as plans can be long.
+        stack = [(cname, required(cname))]
+        active = {cname}
+
+        while stack:
+            name, deps = stack[-1]
+
+            for dep in deps:
+                if dep in active:
+                    path = [n for n, _ in stack]
+                    path = path[path.index(dep):] + [dep]
+                    raise ValueError(
+                        f"required changes form a cycle: {' -> '.join(path)}"
+                    )
+                if dep not in done:
+                    stack.append((dep, required(dep)))
+                    active.add(dep)
+                    break
+            else:
+                stack.pop()
+                active.remove(name)
+                done.add(name)
+                result.append((name, latest[name]))
+
+    return result
+
+
+class BuildStats:
+    """Timings and sizes recorded by read_project() and write_extension().
+
+    Attribute `phases` maps build phases to the wall time in seconds spent in
+    them, `files` maps the names of written extension scripts to their
+    generation time, input and output size in bytes, and number of
+    placeholder substitutions, and `counters` counts deploy scripts read,
+    transaction control statements stripped, and bytes before and after
+    minification.  Function `callback` is called
+    with ('phase', name, seconds) and ('file', name, dict) as they are
+    recorded.  Recording is thread-safe.
+    """
+
+    def __init__(self, callback=None):
+        self.phases = {}
+        self.files = {}
+        self.counters = collections.Counter()
+        self._callback = callback
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Add the wall time of the with block to phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if self._callback:
+            self._callback('phase', name, seconds)
+
+    def add_file(self, name, **data):
+        with self._lock:
+            self.files[name] = data
+        if self._callback:
+            self._callback('file', name, data)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def as_dict(self):
+        """Return the recorded stats as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'phases': dict(self.phases),
+                'total': sum(self.phases.values()),
+                'files': {k: dict(v) for k, v in self.files.items()},
+                'counters': dict(self.counters),
+            }
+
+    def summary(self):
+        """Return the recorded stats as human-readable text."""
+        stats = self.as_dict()
+        width = max(map(len, [*stats['phases'], *stats['files'], 'total']))
+        lines = [
+            f"{name:<{width}}  {seconds:8.3f}s"
+            for name, seconds in stats['phases'].items()
+        ]
+        lines.append(f"{'total':<{width}}  {stats['total']:8.3f}s")
+
+        if stats['files']:
+            lines.append('')
+            lines.append(
+                f"{'file':<{width}}  {'time':>9}  {'read':>10}  "
+                f"{'written':>10}  {'subst':>6}"
+            )
+            for name, data in sorted(stats['files'].items()):
+                lines.append(
+                    f"{name:<{width}}  {data['seconds']:8.3f}s  "
+                    f"{data['bytes_read']:10d}  {data['bytes_written']:10d}  "
+                    f"{data['substitutions']:6d}"
+                )
+
+        counters = stats['counters']
+        lines.append('')
+        lines.append(
+            f"{counters.get('scripts_read', 0)} of "
+            f"{counters.get('scripts', 0)} deploy script(s) read, "
+            f"{counters.get('statements_stripped', 0)} statement(s) "
+            f"stripped, {counters.get('files_skipped', 0)} file(s) up to date"
+        )
+
+        if counters.get('minify_bytes_in'):
+            lines.append(_minify_report(counters))
+
+        return '\n'.join(lines)
+
+
+def _phase(stats, name):
+    """Time phase `name` in BuildStats `stats` unless it is None."""
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.phase(name)
+
+
+class GitObjects:
+    """Deploy scripts read from git objects.
+
+    Sqitch tags are mapped to git revisions with `ref_format` in which
+    "{tag}" is replaced by the tag name without the leading "@".  Blobs are
+    read through a single `git cat-file --batch` process that is started on
+    first use in directory `cwd` (the current working directory by default)
+    and cached in memory by revision and path.  Paths are relative to `cwd`.
+    The process is shared by threads and terminated by close().
+    """
+
+    def __init__(self, ref_format='refs/tags/{tag}', cwd=None):
+        self.ref_format = ref_format
+        self.cwd = os.path.abspath(cwd or os.curdir)
+        self._blobs = {}
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def rev(self, tag):
+        """Return the git revision of Sqitch tag `tag`."""
+        return self.ref_format.format(tag=_removeprefix(tag, '@'))
+
+    def read(self, rev, path):
+        """Return the content of file `path` as of revision `rev`."""
+        return self._blob(rev, path)[1]
+
+    def oid(self, rev, path):
+        """Return the object name of file `path` as of revision `rev`."""
+        return self._blob(rev, path)[0]
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None:
+                self._proc.stdin.close()
+                self._proc.stdout.close()
+                self._proc.wait()
+                self._proc = None
+
+    def _blob(self, rev, path):
+        """Return the object name and content of `path` as of `rev`.
+
+        Raise FileNotFoundError if there is no such file.
+        """
+        import errno
+
+        key = (rev, path)
+
+        with self._lock:
+            if key in self._blobs:
+                return self._blobs[key]
+
+            rel = os.path.relpath(os.path.join(self.cwd, path), self.cwd)
+            spec = f'{rev}:./{rel}'
+            missing = FileNotFoundError(
+                errno.ENOENT, "no such file in git", f'{rev}:{path}',
+            )
+
+            if '\n' in spec:
+                raise missing
+
+            # Either "<oid> <type> <size>" followed by the content or
+            # "<spec> missing" or "<spec> ambiguous".
+            header = self._request(spec).split()
+
+            if header[-1] in (b'missing', b'ambiguous'):
+                raise missing
+
+            oid, kind, size = header
+            data = self._proc.stdout.read(int(size) + 1)[:-1]
+
+            if len(data) != int(size):
+                raise OSError("git cat-file: unexpected end of output")
+
+            if kind != b'blob':
+                raise missing
+
+            self._blobs[key] = blob = (oid.decode(), data)
+
+            return blob
+
+    def _request(self, spec):
+        if self._proc is None:
+            self._proc = subprocess.Popen(
+                ['git', 'cat-file', '--batch'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=self.cwd,
+            )
+
+        try:
+            self._proc.stdin.write(f'{spec}\n'.encode())
+            self._proc.stdin.flush()
+        except BrokenPipeError:
+            pass
+
+        header = self._proc.stdout.readline()
+
+        if not header:
+            code = self._proc.wait()
+            self._proc = None
+            raise OSError(f"git cat-file exited with status {code}")
+
+        return header
+
+
+class ScriptCache:
+    """Cache of deploy scripts stripped of transaction control commands.
+
+    Entries are keyed by path and invalidated when the file identity (device,
+    inode, size, or mtime) changes.  The least recently used entries are
+    evicted once the total file size of all entries exceeds `max_bytes`.
+    The cache can be shared by threads and across builds.
+    """
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, load, variant=None):
+        """Return the cached content of `path` or call `load` on a miss.
+
+        Content loaded with different options is cached separately by
+        `variant`.
+        """
+        st = os.stat(path)
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        key = path if variant is None else (path, variant)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == ident:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        content = load()
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= old[1]
+
+            if st.st_size <= self.max_bytes:
+                self._entries[key] = (ident, st.st_size, content)
+                self._size += st.st_size
+
+            while self._size > self.max_bytes:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self._size -= size
+
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
 
 
 def valid_name(name):
@@ -268,6 +4420,115 @@ class Change(t.NamedTuple):
     name: str
     tags: t.List[str]
 
+    # Required changes as listed in the plan, e.g. "a", "a@0.1" or
+    # "project:a".
+    requires: t.Tuple[str, ...] = ()
+
+
+class Plan(collections.abc.Sequence):
+    """Compact sequence of the changes of a Sqitch plan.
+
+    Plans with many changes repeat the same change names over and over due to
+    reworks.  Each name is stored once and changes only record the index of
+    their name and the end of their tags in a flat list of tags.  The few
+    changes that require other changes are looked up by position.  Change
+    tuples are created on access.  A plan compares equal to any sequence of
+    the same changes.
+    """
+
+    __slots__ = (
+        '_names', '_index', '_changes', '_tags', '_tag_ends', '_requires',
+    )
+
+    def __init__(self, changes=()):
+        self._names = []
+        self._index = {}
+        self._changes = array.array('I')
+        self._tags = []
+        self._tag_ends = array.array('I')
+        self._requires = {}
+
+        for change in changes:
+            self._append(change.name, change.requires)
+            for tag in change.tags:
+                self._tag(tag)
+
+    def _append(self, name, requires=()):
+        """Append a change and return its interned name."""
+        index = self._index.get(name)
+        if index is None:
+            index = self._index[name] = len(self._names)
+            self._names.append(name)
+        if requires:
+            self._requires[len(self._changes)] = tuple(requires)
+        self._changes.append(index)
+        self._tag_ends.append(len(self._tags))
+        return self._names[index]
+
+    def _tag(self, tag):
+        """Tag the last change."""
+        self._tags.append(tag)
+        self._tag_ends[-1] += 1
+
+    def __len__(self):
+        return len(self._changes)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+
+        pos = range(len(self))[pos]
+        start = self._tag_ends[pos - 1] if pos else 0
+
+        return Change(
+            self._names[self._changes[pos]],
+            self._tags[start:self._tag_ends[pos]],
+            self._requires.get(pos, ()),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence) or \
+                isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and \
+            all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self)!r})'
+
+    def _state(self):
+        """Return the marshallable state of the plan."""
+        return (
+            self._names,
+            self._changes.tobytes(),
+            self._tags,
+            self._tag_ends.tobytes(),
+            self._requires,
+        )
+
+    @classmethod
+    def _from_state(cls, state):
+        """Restore a plan from the result of `_state`."""
+        names, changes, tags, tag_ends, requires = state
+
+        plan = cls()
+        plan._names = list(names)
+        plan._index = {name: i for i, name in enumerate(plan._names)}
+        plan._changes.frombytes(changes)
+        plan._tags = list(tags)
+        plan._tag_ends.frombytes(tag_ends)
+        plan._requires = dict(requires)
+
+        if len(plan._changes) != len(plan._tag_ends) or \
+                max(plan._changes, default=-1) >= len(plan._names) or \
+                plan._tag_ends and plan._tag_ends[-1] != len(plan._tags) or \
+                max(plan._requires, default=-1) >= len(plan._changes):
+            raise ValueError("inconsistent plan state")
+
+        return plan
+
 
 class Changeset(t.NamedTuple):
     """Set of changes for a single extension script.
@@ -298,6 +4559,39 @@ class Changeset(t.NamedTuple):
             return f'{extname}--{version}.sql'
 
 
+class UpdatePath(t.NamedTuple):
+    """Update path found by update_paths().
+
+    Attribute `tags` lists the versions along the path from the source to
+    the target (empty for HEAD) and `size` is the total size of the deploy
+    scripts of its update scripts in bytes.
+    """
+
+    tags: t.List[str]
+    size: int
+
+    @property
+    def source(self):
+        return self.tags[0]
+
+    @property
+    def target(self):
+        return self.tags[-1]
+
+    @property
+    def steps(self):
+        return len(self.tags) - 1
+
+
+class Elided(t.NamedTuple):
+    """Change elided by Project.elide_reworks()."""
+
+    fromtag: str
+    tag: str
+    change: str
+    script: str
+
+
 try:
     _removeprefix = str.removeprefix
 except AttributeError:  # py38
@@ -316,5 +4610,25 @@ class ProjectNotFound(Exception):
     """Raised when no Sqitch project is found."""
 
 
+class InvalidConfig(Exception):
+    """Raised on syntax errors in a Sqitch config file."""
+
+
+class InvalidPlan(Exception):
+    """Raised on syntax errors in a Sqitch plan."""
+
+
 class InvalidName(Exception):
     """Raised on invalid extension name or version name."""
+
+
+class BuildError(Exception):
+    """Raised when generating an extension file fails."""
+
+    def __init__(self, filename, cause):
+        super().__init__(filename, cause)
+        self.filename = filename
+        self.cause = cause
+
+    def __str__(self):
+        return f"{self.filename}: {self.cause}"
@@ -0,0 +1,112 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import pgxsq
+from pgxsq import BuildError, build, write_archive
+
+
+@pytest.mark.parametrize('suffix', ['.tar', '.tar.gz', '.tgz'])
+def test_tar(project, tmp_path, suffix):
+    path = tmp_path / f'test{suffix}'
+    names = write_archive(project, str(path), 'a')
+
+    with tarfile.open(path) as tar:
+        assert tar.getnames() == names == [
+            'test--0.1.sql',
+            'test--0.1--0.2.sql',
+            'test--0.2--HEAD.sql',
+            'test.control',
+        ]
+        assert {
+            m.name: tar.extractfile(m).read() for m in tar.getmembers()
+        } == build(project, extschema='a')
+        assert {(m.mode, m.mtime) for m in tar.getmembers()} == \
+            {(0o644, 315532800)}
+
+
+def test_zip(project, tmp_path):
+    path = tmp_path / 'test.zip'
+    write_archive(project, str(path), 'a')
+
+    with zipfile.ZipFile(path) as zf:
+        assert zf.namelist() == [
+            'test--0.1.sql',
+            'test--0.1--0.2.sql',
+            'test--0.2--HEAD.sql',
+            'test.control',
+        ]
+        assert {
+            name: zf.read(name) for name in zf.namelist()
+        } == build(project, extschema='a')
+        assert {i.date_time for i in zf.infolist()} == {(1980, 1, 1, 0, 0, 0)}
+
+
+@pytest.mark.parametrize('suffix', ['.tar', '.zip'])
+def test_members_generated_once(monkeypatch, project, tmp_path, suffix):
+    expected = build(project, extschema='a')
+    generated = []
+    generate = pgxsq._generate
+
+    def counting(project, extname, fname, *args, **kwargs):
+        generated.append(fname)
+        return generate(project, extname, fname, *args, **kwargs)
+
+    monkeypatch.setattr(pgxsq, '_generate', counting)
+    monkeypatch.setattr(pgxsq, '_ZERO_COPY_MIN', 1)
+    monkeypatch.setattr(pgxsq, '_BUFSIZE', 64)
+
+    path = tmp_path / f'test{suffix}'
+    names = write_archive(project, str(path), 'a')
+
+    assert generated == names[:-1]
+
+    if suffix == '.zip':
+        with zipfile.ZipFile(path) as zf:
+            assert {name: zf.read(name) for name in names} == expected
+    else:
+        with tarfile.open(path) as tar:
+            assert {
+                name: tar.extractfile(name).read() for name in names
+            } == expected
+
+
+@pytest.mark.parametrize('fname', ['test.tar.gz', 'test.zip'])
+def test_reproducible(project, tmp_path, fname):
+    first = tmp_path / 'first'
+    second = tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+
+    write_archive(project, str(first / fname))
+    os.utime(project.deploy_script_path('b', ''), (0, 0))
+    write_archive(project, str(second / fname))
+
+    assert (first / fname).read_bytes() == (second / fname).read_bytes()
+
+
+def test_source_date_epoch(monkeypatch, project, tmp_path):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    path = tmp_path / 'test.tar'
+    write_archive(project, str(path))
+
+    with tarfile.open(path) as tar:
+        assert {m.mtime for m in tar.getmembers()} == {1700000000}
+
+
+def test_unsupported_format(project, tmp_path):
+    with pytest.raises(ValueError, match='unsupported archive format'):
+        write_archive(project, str(tmp_path / 'test.rar'))
+
+    assert os.listdir(tmp_path) == ['deploy']
+
+
+def test_failed_build_leaves_no_file(project, tmp_path):
+    os.remove(project.deploy_script_path('b', ''))
+
+    with pytest.raises(BuildError, match='test--0.1--0.2.sql'):
+        write_archive(project, str(tmp_path / 'test.zip'))
+
+    assert os.listdir(tmp_path) == ['deploy']
@@ -0,0 +1,106 @@
+import os
+import textwrap
+
+import pytest
+
+import pgxsq
+
+
+def make_project(path, name, changes=('a',)):
+    path.mkdir(parents=True)
+    (path / 'sqitch.plan').write_text(
+        f"%project={name}\n" + ''.join(f"{c}\n" for c in changes),
+    )
+    (path / 'deploy').mkdir()
+    for c in changes:
+        (path / 'deploy' / f'{c}.sql').write_text(f"SELECT '{c}';\n")
+    return path
+
+
+@pytest.fixture
+def monorepo(tmp_path, workdir):
+    """Directory with projects foo and bar and a broken project."""
+    make_project(tmp_path / 'ext' / 'foo', 'foo')
+    make_project(tmp_path / 'ext' / 'bar', 'bar', ['a', 'b'])
+    broken = tmp_path / 'broken'
+    broken.mkdir()
+    (broken / 'sqitch.plan').write_text("a\n")
+    return tmp_path
+
+
+def test_build_project(tmp_path):
+    root = make_project(tmp_path / 'foo', 'foo')
+    (root / 'sqitch.conf').write_text(textwrap.dedent("""
+        [pgxsq]
+            placeholder = SELECT=select
+        """))
+
+    files = pgxsq.build_project(str(root), dest='out/{name}')
+
+    assert sorted(files) == ['.foo.pgxsq.json', 'foo--HEAD.sql', 'foo.control']
+    assert (root / 'out' / 'foo' / 'foo--HEAD.sql').read_text() == (
+        '\\echo Use "CREATE EXTENSION foo" to load this file. \\quit\n'
+        "select 'a';\n"
+    )
+
+
+def test_read_project_root(tmp_path):
+    root = tmp_path / 'foo'
+    make_project(root / 'src', 'foo')
+    (root / 'sqitch.conf').write_text(textwrap.dedent("""
+        [core]
+            top_dir = src
+        """))
+
+    project = pgxsq.read_project(root=str(root))
+
+    assert project.name == 'foo'
+    assert project.deploy_dir == str(root / 'src' / 'deploy')
+    assert project.read_deploy_script('a', '') == b"SELECT 'a';\n"
+
+
+@pytest.mark.parametrize('jobs', ['1', '4'])
+def test_build(capsys, cli, monorepo, jobs):
+    assert cli.build_projects('-j', jobs, '--dest', 'out', 'ext/*') == 0
+
+    assert sorted(os.listdir('ext/foo/out')) == [
+        '.foo.pgxsq.json', 'foo--HEAD.sql', 'foo.control',
+    ]
+    assert sorted(os.listdir('ext/bar/out')) == [
+        '.bar.pgxsq.json', 'bar--HEAD.sql', 'bar.control',
+    ]
+    assert capsys.readouterr().out.splitlines() == [
+        'ext/bar: wrote 3 file(s)',
+        'ext/foo: wrote 3 file(s)',
+        '2 project(s) built, 0 failed',
+    ]
+
+
+def test_build_failures(capsys, cli, monorepo):
+    assert cli.build_projects('-j', '2', 'ext/foo', 'broken', 'missing') == 1
+
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ['ext/foo: wrote 3 file(s)']
+    assert captured.err.splitlines() == [
+        'broken: error: invalid plan: missing %project pragma',
+        'missing: error: no project',
+        '1 project(s) built, 2 failed',
+    ]
+
+
+def test_build_manifest(capsys, cli, monorepo):
+    (monorepo / 'projects.txt').write_text(textwrap.dedent("""
+        # Extensions
+        ext/foo
+
+        ext/bar
+        """))
+
+    assert cli.build_projects('--manifest', 'projects.txt') == 0
+    assert os.path.exists('ext/foo/foo--HEAD.sql')
+    assert os.path.exists('ext/bar/bar--HEAD.sql')
+
+
+def test_build_no_match(capsys, cli, monorepo):
+    assert cli.build_projects('nothing/*') == 2
+    assert "no directories match nothing/*" in capsys.readouterr().err
@@ -112,3 +112,147 @@ def test_filename_invalid_version(version):
     # Test invalid base version with second changeset.
     with pytest.raises(InvalidName):
         next(cs).filename(project.name)
+
+
+RANGE_PLAN = [
+    Change('a', ['@0.1']),
+    Change('b', ['@0.2', '@0.2-alias']),
+    Change('a', []),
+    Change('c', ['@0.3']),
+    Change('d', []),
+]
+
+
+@pytest.mark.parametrize('start, stop, expected', [
+    (0, None, [
+        Changeset('',     '@0.1', [('a', '@0.2')]),
+        Changeset('@0.1', '@0.2', [('b', '')]),
+        Changeset('@0.2', '@0.3', [('a', ''), ('c', '')]),
+        Changeset('@0.3', '',     [('d', '')]),
+    ]),
+    (1, None, [
+        Changeset('@0.1', '@0.2', [('b', '')]),
+        Changeset('@0.2', '@0.3', [('a', ''), ('c', '')]),
+        Changeset('@0.3', '',     [('d', '')]),
+    ]),
+    (2, 4, [
+        Changeset('@0.2', '@0.3', [('a', ''), ('c', '')]),
+    ]),
+    (0, 1, [
+        Changeset('',     '@0.1', [('a', '@0.2')]),
+    ]),
+    (4, None, [
+        Changeset('@0.3', '',     [('d', '')]),
+    ]),
+    (5, None, []),
+    (3, 2, []),
+])
+def test_changesets_between(start, stop, expected):
+    project = Project('test', plan=RANGE_PLAN)
+
+    assert list(project.changesets_between(start, stop)) == expected
+
+
+def test_changesets_between_traces_back_only_to_start():
+    class Plan(list):
+        def __getitem__(self, pos):
+            visited.add(pos)
+            return super().__getitem__(pos)
+
+    visited = set()
+    project = Project('test', plan=Plan(RANGE_PLAN))
+
+    list(project.changesets_between(3))
+
+    assert min(visited) == 1
+
+
+def test_tag_index():
+    project = Project('test', plan=RANGE_PLAN)
+
+    assert project.tag_index() == {
+        '@0.1': 0,
+        '@0.2': 1,
+        '@0.2-alias': 1,
+        '@0.3': 3,
+    }
+
+
+def test_install_changesets():
+    project = Project('test', plan=RANGE_PLAN)
+
+    assert project.install_changesets() == [
+        Changeset('', '@0.2', [('a', '@0.2'), ('b', '')]),
+        Changeset('', '@0.3', [('a', ''), ('b', ''), ('c', '')]),
+    ]
+
+
+def test_install_changesets_selected():
+    project = Project('test', plan=RANGE_PLAN)
+
+    assert project.install_changesets({'@0.1', '@0.3', ''}) == [
+        Changeset('', '@0.3', [('a', ''), ('b', ''), ('c', '')]),
+        Changeset('', '', [('a', ''), ('b', ''), ('c', ''), ('d', '')]),
+    ]
+
+
+def test_update_changesets():
+    project = Project('test', plan=RANGE_PLAN)
+
+    assert project.update_changesets([
+        ('@0.1', '@0.3'),
+        ('@0.1', ''),
+        ('@0.2', '@0.3'),  # Adjacent versions
+    ]) == [
+        Changeset('@0.1', '@0.3', [('b', ''), ('a', ''), ('c', '')]),
+        Changeset('@0.1', '', [('b', ''), ('a', ''), ('c', ''), ('d', '')]),
+    ]
+
+
+# Change v is reworked to use change u that is added after v.
+REQUIRES_PLAN = [
+    Change('t', ['@0.1']),
+    Change('v', ['@0.2']),
+    Change('u', []),
+    Change('v', ['@0.3'], ('v@0.2', 'u', 'other:w', '@0.1')),
+]
+
+
+def test_install_changesets_requires():
+    project = Project('test', plan=REQUIRES_PLAN)
+
+    assert project.install_changesets({'@0.3'}) == [
+        Changeset('', '@0.3', [('t', ''), ('u', ''), ('v', '')]),
+    ]
+
+
+def test_update_changesets_requires():
+    project = Project('test', plan=REQUIRES_PLAN)
+
+    assert project.update_changesets([('@0.1', '@0.3')]) == [
+        Changeset('@0.1', '@0.3', [('u', ''), ('v', '')]),
+    ]
+
+
+def test_install_changesets_requires_cycle():
+    project = Project('test', plan=[
+        Change('a', ['@0.1']),
+        Change('b', [], ('a',)),
+        Change('a', ['@0.2'], ('a@0.1', 'b')),
+    ])
+
+    with pytest.raises(ValueError, match='cycle: a -> b -> a'):
+        project.install_changesets()
+
+
+@pytest.mark.parametrize('path', [
+    ('@0.3', '@0.1'),
+    ('@0.1', '@0.1'),
+    ('', '@0.3'),
+    ('@0.1', '@0.4'),
+])
+def test_update_changesets_invalid_path(path):
+    project = Project('test', plan=RANGE_PLAN)
+
+    with pytest.raises(ValueError):
+        project.update_changesets([path])
@@ -0,0 +1,63 @@
+import pytest
+
+from pgxsq import Change, Changeset, Project, check_project
+
+
+@pytest.fixture
+def project(tmp_path):
+    deploy = tmp_path / 'deploy'
+    (deploy / 'sub').mkdir(parents=True)
+    (deploy / 'a@0.2.sql').write_text("SELECT 'a1';\n")
+    (deploy / 'a.sql').write_text("SELECT 'a2';\n")
+    (deploy / 'sub' / 'b.sql').write_text("SELECT 'b';\n")
+    return Project('test', [
+        Change('a', ['@0.1']),
+        Change('sub/b', ['@0.2']),
+        Change('a', []),
+    ], str(deploy))
+
+
+def test_check(project):
+    assert check_project(project) == []
+
+
+def test_check_does_not_open_scripts(project, monkeypatch):
+    monkeypatch.setattr('builtins.open', None)
+
+    assert check_project(project) == []
+
+
+def test_check_reports_all_problems(project, tmp_path):
+    (tmp_path / 'deploy' / 'a.sql').unlink()
+    (tmp_path / 'deploy' / 'c.sql').write_text("SELECT 'c';\n")
+    project = project._replace(name='my--ext', plan=[
+        *project.plan,
+        Change('c', ['@-1']),
+        Change('d', []),
+    ])
+
+    assert check_project(project) == [
+        "invalid extension name: contains '--': 'my--ext'",
+        "invalid version: starts or ends with '-': '-1'",
+        f"missing deploy script: {tmp_path / 'deploy' / 'a.sql'}",
+        f"missing deploy script: {tmp_path / 'deploy' / 'd.sql'}",
+    ]
+
+
+def test_check_changesets(project, tmp_path):
+    (tmp_path / 'deploy' / 'a.sql').unlink()
+    changesets = list(project.changesets)[:1]
+    extra = [Changeset('@0.1', '@x--y', [('e', '')])]
+
+    assert check_project(project, changesets, extra) == [
+        "invalid version: contains '--': 'x--y'",
+        f"missing deploy script: {tmp_path / 'deploy' / 'e.sql'}",
+    ]
+
+
+def test_check_no_deploy_dir(project, tmp_path):
+    project = project._replace(deploy_dir=str(tmp_path / 'missing'))
+
+    assert check_project(project) == [
+        f"no deploy directory: {tmp_path / 'missing'}",
+    ]
@@ -0,0 +1,264 @@
+import json
+import os
+import textwrap
+import zipfile
+
+import pytest
+
+
+@pytest.fixture
+def project_dir(tmp_path, workdir):
+    """Sqitch project with tags 0.1 to 0.3 and untagged HEAD."""
+    (tmp_path / 'sqitch.plan').write_text(textwrap.dedent("""
+        %project=test
+        a
+        @0.1
+        b
+        @0.2
+        a [a@0.2]
+        @0.3
+        c
+        """))
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    for name in ['a@0.2', 'a', 'b', 'c']:
+        (deploy / f'{name}.sql').write_text(f"SELECT '{name}';\n")
+    return tmp_path
+
+
+def extfiles(dirname='ext'):
+    return sorted(f for f in os.listdir(dirname) if f.endswith('.sql'))
+
+
+@pytest.mark.parametrize('args, expected', [
+    ([], [
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+    (['--from', '0.2'], [
+        'test--0.1--0.2.sql',
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+    (['--since', '@0.2'], [
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+    (['--to', '0.2'], [
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+    ]),
+    (['--from', '0.3', '--to', 'HEAD'], [
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+])
+def test_version_range(args, expected, cli, project_dir):
+    assert cli.build(*args, dest='ext') == 0
+    assert extfiles() == expected
+
+
+def test_version_range_unknown_tag(capsys, cli, project_dir):
+    assert cli.build('--from', '0.4', dest='ext') == 1
+
+    _, err = capsys.readouterr()
+    assert err == "error: unknown tag: 0.4\n"
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['--install-scripts'], [
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+        'test--0.2.sql',
+        'test--0.3--HEAD.sql',
+        'test--0.3.sql',
+    ]),
+    (['--install-scripts', '0.3', 'HEAD'], [
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+        'test--0.3.sql',
+        'test--HEAD.sql',
+    ]),
+    (['--from', '0.3', '--install-scripts'], [
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+        'test--0.3.sql',
+    ]),
+])
+def test_install_scripts(args, expected, cli, project_dir):
+    assert cli.build(*args, dest='ext') == 0
+    assert extfiles() == expected
+
+
+def test_install_script_content(cli, project_dir):
+    assert cli.build('--install-scripts', '0.3', dest='ext') == 0
+
+    script = (project_dir / 'ext' / 'test--0.3.sql').read_text()
+    assert script.splitlines()[1:] == [
+        "SELECT 'a';",
+        "SELECT 'b';",
+    ]
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['--update-path', '0.1:0.3'], [
+        'test--0.1--0.2.sql',
+        'test--0.1--0.3.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+    (['--update-to-latest'], [
+        'test--0.1--0.2.sql',
+        'test--0.1--HEAD.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+        'test--0.2--HEAD.sql',
+        'test--0.3--HEAD.sql',
+    ]),
+    (['--to', '0.3', '--update-to-latest'], [
+        'test--0.1--0.2.sql',
+        'test--0.1--0.3.sql',
+        'test--0.1.sql',
+        'test--0.2--0.3.sql',
+    ]),
+])
+def test_update_paths(args, expected, cli, project_dir):
+    assert cli.build(*args, dest='ext') == 0
+    assert extfiles() == expected
+
+
+def test_update_path_content(cli, project_dir):
+    assert cli.build('--update-path', '0.1:HEAD', dest='ext') == 0
+
+    script = (project_dir / 'ext' / 'test--0.1--HEAD.sql').read_text()
+    assert script.splitlines()[1:] == [
+        "SELECT 'b';",
+        "SELECT 'a';",
+        "SELECT 'c';",
+    ]
+
+
+@pytest.mark.parametrize('path', ['0.3:0.1', '0.1', '0.1:0.4'])
+def test_invalid_update_path(path, cli, project_dir):
+    assert cli.build('--update-path', path, dest='ext') == 1
+
+
+def test_placeholders(cli, project_dir):
+    with open('sqitch.conf', 'w') as fp:
+        fp.write('[pgxsq]\n\tplaceholder = a=A\n\tplaceholder = b=B\n')
+
+    assert cli.build('--placeholder', 'b=X', dest='ext', extschema='c') == 0
+
+    script = (project_dir / 'ext' / 'test--0.3--HEAD.sql').read_text()
+    assert script.splitlines()[1:] == ["SELECT '@extschema@';"]
+
+    script = (project_dir / 'ext' / 'test--0.1--0.2.sql').read_text()
+    assert script.splitlines()[1:] == ["SELECT 'X';"]
+
+    script = (project_dir / 'ext' / 'test--0.1.sql').read_text()
+    assert script.splitlines()[1:] == ["SELECT 'A@0.2';"]
+
+
+def test_invalid_placeholder(capsys, cli, project_dir):
+    assert cli.build('--placeholder', 'a', dest='ext') == 1
+
+    _, err = capsys.readouterr()
+    assert err == "error: invalid placeholder: a\n"
+
+
+def test_timings(capsys, cli, project_dir):
+    assert cli.build('--timings', dest='ext') == 0
+    err = capsys.readouterr().err
+
+    assert 'parse_plan' in err
+    assert 'test--0.3--HEAD.sql' in err
+
+
+def test_stats_json(capsys, cli, project_dir):
+    assert cli.build('--stats-json', '-', dest='ext') == 0
+    stats = json.loads(capsys.readouterr().out)
+
+    assert sorted(stats['phases']) == [
+        'changesets', 'check', 'generate', 'parse_plan', 'plan_cache',
+        'publish', 'read_config',
+    ]
+    assert sorted(stats['files']) == extfiles()
+
+
+def test_archive(cli, project_dir):
+    assert cli.build('--archive', 'test.zip', dest='ext') == 0
+
+    assert not os.path.exists('ext')
+    with zipfile.ZipFile('test.zip') as zf:
+        assert zf.namelist() == [
+            'test--0.1.sql',
+            'test--0.1--0.2.sql',
+            'test--0.2--0.3.sql',
+            'test--0.3--HEAD.sql',
+            'test.control',
+        ]
+
+
+def test_archive_unsupported(capsys, cli, project_dir):
+    assert cli.build('--archive', 'test.rar', dest='ext') == 1
+    assert "unsupported archive format" in capsys.readouterr().err
+
+
+def test_elide_reworks(capsys, cli, project_dir):
+    (project_dir / 'deploy' / 'a.sql').write_text("SELECT 'a@0.2';\n")
+
+    assert cli.build('--elide-reworks', dest='ext') == 0
+    assert capsys.readouterr().err == (
+        "test--0.2--0.3.sql: elided unchanged rework a\n"
+    )
+    assert open('ext/test--0.2--0.3.sql').read() == (
+        '\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+    )
+
+
+def test_check(capsys, cli, project_dir):
+    (project_dir / 'deploy' / 'b.sql').unlink()
+
+    assert cli.build('--check', dest='ext') == 1
+    assert not os.path.exists('ext')
+    assert capsys.readouterr().err == (
+        f"error: missing deploy script: {os.path.join('deploy', 'b.sql')}\n"
+    )
+
+
+def test_encoding(capsys, cli, project_dir):
+    (project_dir / 'deploy' / 'c.sql').write_bytes(b"SELECT '\xe9';\n")
+
+    assert cli.build(
+        '--encoding', 'latin-1', '--validate-encoding', dest='ext',
+    ) == 0
+    assert cli.build('--validate-encoding', '--force', dest='ext') == 1
+    assert "c.sql: invalid utf-8 at byte 8" in capsys.readouterr().err
+
+
+def test_unsupported_encoding(capsys, cli, project_dir):
+    assert cli.build('--encoding', 'utf-16', dest='ext') == 2
+    assert "unsupported encoding: utf-16" in capsys.readouterr().err
+
+
+def test_minify(capsys, cli, project_dir):
+    (project_dir / 'deploy' / 'c.sql').write_text("SELECT  'c';  -- c\n")
+
+    assert cli.build('--minify', dest='ext') == 0
+    assert "minified deploy scripts from" in capsys.readouterr().err
+    assert (project_dir / 'ext' / 'test--0.3--HEAD.sql').read_text() \
+        .endswith("\nSELECT 'c';\n")
+
+
+def test_minify_timings(capsys, cli, project_dir):
+    assert cli.build('--minify', '--timings', dest='ext') == 0
+    err = capsys.readouterr().err
+
+    assert 'parse_plan' in err
+    assert err.count("minified deploy scripts from") == 1
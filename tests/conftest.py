@@ -15,7 +15,16 @@ import pgxsq
 
 
 @pytest.fixture
-def cli():
+def cache_home(monkeypatch, tmp_path_factory):
+    """Keep the plan cache of pgxsq in a temporary directory during test.
+    """
+    path = tmp_path_factory.mktemp('cache')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(path))
+    return path
+
+
+@pytest.fixture
+def cli(cache_home):
     return Pgxsq()
 
 
@@ -36,7 +45,7 @@ def sqitch():
 
 
 @pytest.fixture
-def workdir(tmp_path):
+def workdir(tmp_path, cache_home):
     """Change working directory to a temporary directory during test.
     """
     oldcwd = os.getcwd()
@@ -48,34 +57,73 @@ def workdir(tmp_path):
         os.chdir(oldcwd)
 
 
+@pytest.fixture
+def project(tmp_path):
+    """Project with three changes, one of them reworked, and deploy scripts
+    in a temporary directory.
+    """
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    (deploy / 'a@0.2.sql').write_text("BEGIN;\nSELECT 'a1';\nCOMMIT;\n")
+    (deploy / 'a.sql').write_text("SELECT 'a2';\n")
+    (deploy / 'b.sql').write_text("SELECT 'b';\n")
+    return pgxsq.Project('test', [
+        pgxsq.Change('a', ['@0.1']),
+        pgxsq.Change('b', ['@0.2']),
+        pgxsq.Change('a', []),
+    ], str(deploy))
+
+
 class Pgxsq:
     """Client to the pgxsq command line.
     """
 
-    def build(self, dest=None, extschema=None):
+    def run(self, *args):
+        """Invoke the pgxsq command line.
+
+        :param args: command line arguments
+        :return: exit code, 0 on success
+        """
+        try:
+            pgxsq.main(list(args))
+        except SystemExit as exc:
+            return exc.code
+
+        return 0
+
+    def build(self, *args, dest=None, extschema=None):
         """Build extension scripts by invoking the pgxsq command line.
 
+        :param args: further command line options
         :param dest: output directory
         :param extschema: placeholder for @extschema@
         :return: exit code, 0 on success, 1 on failure
         """
-        args = []
+        opts = []
         if dest is not None:
-            args.extend(['--dest', dest])
+            opts.extend(['--dest', dest])
         if extschema is not None:
-            args.extend(['--extschema', extschema])
-        try:
-            pgxsq.main(args)
-        except SystemExit as exc:
-            return exc.code
+            opts.extend(['--extschema', extschema])
+        return self.run(*opts, *args)
 
-        return 0
+    def build_projects(self, *args):
+        """Build multiple projects with the build subcommand.
+
+        :param args: project patterns and options
+        :return: exit code, 0 on success, 1 on failure
+        """
+        return self.run('build', *args)
+
+    def graph(self, *args):
+        """Report update paths with the graph subcommand.
+
+        :param args: command line options
+        :return: exit code, 0 on success, 1 if paths are too long
+        """
+        return self.run('graph', *args)
 
     def version(self):
-        try:
-            pgxsq.main(['--version'])
-        except SystemExit as exc:
-            return exc.code
+        return self.run('--version')
 
 
 class Postgres:
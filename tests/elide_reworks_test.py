@@ -0,0 +1,68 @@
+import pytest
+
+from pgxsq import Change, Changeset, Elided, Project, build
+
+
+@pytest.fixture
+def project(tmp_path):
+    """Project with change a reworked twice and b reworked once.
+
+    The first rework of a only changes whitespace and the rework of b is
+    identical whereas the second rework of a changes the script.
+    """
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    (deploy / 'a@0.2.sql').write_text("BEGIN;\nSELECT 'a';\nCOMMIT;\n")
+    (deploy / 'a@0.3.sql').write_text("\nSELECT 'a';  \n\n")
+    (deploy / 'a.sql').write_text("SELECT 'a2';\n")
+    (deploy / 'b@0.2.sql').write_text("SELECT 'b';\n")
+    (deploy / 'b.sql').write_text("SELECT 'b';\n")
+    (deploy / 'c.sql').write_text("SELECT 'c';\n")
+    return Project('test', [
+        Change('a', []),
+        Change('b', ['@0.1']),
+        Change('c', ['@0.2']),
+        Change('a', []),
+        Change('b', ['@0.3']),
+        Change('a', []),
+    ], str(deploy))
+
+
+def test_elide_reworks(project):
+    elided = []
+    changesets = project.elide_reworks(project.changesets, elided=elided)
+
+    assert changesets == [
+        Changeset('', '@0.1', [('a', '@0.2'), ('b', '@0.2')]),
+        Changeset('@0.1', '@0.2', [('c', '')]),
+        Changeset('@0.2', '@0.3', []),
+        Changeset('@0.3', '', [('a', '')]),
+    ]
+    assert elided == [
+        Elided('@0.2', '@0.3', 'a', '@0.3'),
+        Elided('@0.2', '@0.3', 'b', ''),
+    ]
+
+
+def test_elide_reworks_skip_level(project):
+    changesets = project.update_changesets([('@0.1', '@0.3'), ('@0.1', '')])
+
+    assert project.elide_reworks(changesets) == [
+        Changeset('@0.1', '@0.3', [('c', '')]),
+        Changeset('@0.1', '', [('c', ''), ('a', '')]),
+    ]
+
+
+def test_elide_reworks_install_scripts(project):
+    changesets = project.install_changesets()
+
+    assert project.elide_reworks(changesets) == changesets
+
+
+def test_build_trivial_update_script(project):
+    files = build(project, elide_reworks=True)
+
+    assert files['test--0.2--0.3.sql'] == (
+        b'\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+    )
+    assert files['test--0.3--HEAD.sql'].endswith(b"SELECT 'a2';\n")
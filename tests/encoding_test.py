@@ -0,0 +1,84 @@
+import pytest
+
+from pgxsq import (
+    BuildError, Change, Project, ScriptCache, build, write_archive,
+    write_extension,
+)
+
+
+GUARD = b'\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+
+
+def project(tmp_path, script):
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir(exist_ok=True)
+    (deploy / 'a.sql').write_bytes(script)
+    return Project('test', [Change('a', [])], str(deploy))
+
+
+def test_line_endings(tmp_path):
+    p = project(tmp_path, b"BEGIN;\r\nSELECT 1;\r\nCOMMIT;\r\n")
+
+    assert build(p)['test--HEAD.sql'] == GUARD + b"SELECT 1;\r\n"
+
+
+def test_byte_order_mark(tmp_path):
+    p = project(tmp_path, b"\xef\xbb\xbfBEGIN;\nSELECT 1;\n")
+
+    assert p.read_deploy_script('a', '') == b"SELECT 1;\n"
+    assert build(p)['test--HEAD.sql'] == GUARD + b"SELECT 1;\n"
+
+
+def test_latin1(tmp_path):
+    p = project(tmp_path, b"SELECT 'gr\xf6\xdfe' AS @x;\n")
+    files = build(p, placeholders={'@x': 'maß'}, encoding='latin-1')
+
+    assert files['test--HEAD.sql'] == \
+        GUARD + b"SELECT 'gr\xf6\xdfe' AS ma\xdf;\n"
+
+
+def test_invalid_bytes_are_copied(tmp_path):
+    p = project(tmp_path, b"SELECT '\xff';\n")
+
+    assert build(p)['test--HEAD.sql'] == GUARD + b"SELECT '\xff';\n"
+
+
+def test_validate(tmp_path):
+    p = project(tmp_path, b"SELECT 1;\nSELECT '\xff';\n")
+
+    with pytest.raises(BuildError, match=r"a\.sql: invalid utf-8 at byte 18"):
+        write_extension(p, str(tmp_path / 'ext'), None, validate_encoding=True)
+
+    assert not (tmp_path / 'ext' / 'test--HEAD.sql').exists()
+
+
+def test_validate_archive(tmp_path):
+    p = project(tmp_path, b"SELECT '\xff';\n")
+
+    with pytest.raises(BuildError, match="invalid utf-8"):
+        write_archive(
+            p, str(tmp_path / 'ext.tar'), validate_encoding=True,
+        )
+
+    write_archive(
+        p, str(tmp_path / 'ext.tar'), encoding='latin-1',
+        validate_encoding=True,
+    )
+
+
+@pytest.mark.parametrize('encoding', ['utf-16', 'shift_jis', 'nonexistent'])
+def test_unsupported(tmp_path, encoding):
+    p = project(tmp_path, b"SELECT 1;\n")
+
+    with pytest.raises(ValueError, match=encoding):
+        build(p, encoding=encoding)
+
+
+def test_cache_variants(tmp_path):
+    p = project(tmp_path, b"\xef\xbb\xbfSELECT 1;\n")
+    cache = ScriptCache()
+
+    assert p.read_deploy_script('a', '', cache) == b"SELECT 1;\n"
+    assert p.read_deploy_script('a', '', cache, encoding='latin-1') == \
+        b"\xef\xbb\xbfSELECT 1;\n"
+    assert cache.misses == 2
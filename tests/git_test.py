@@ -0,0 +1,165 @@
+import os
+import subprocess
+import textwrap
+
+import pytest
+
+import pgxsq
+from pgxsq import GitObjects, build, check_project, read_project
+
+
+GUARD = b'\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+
+
+def git(*args, cwd):
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com',
+         *args],
+        cwd=cwd, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+@pytest.fixture
+def repo(tmp_path, workdir):
+    """Sqitch project whose change "a" was modified in place after tags 0.1
+    and 0.2 instead of being reworked."""
+    git('init', '-q', cwd=tmp_path)
+
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    plan = tmp_path / 'sqitch.plan'
+
+    plan.write_text("%project=test\na\n@0.1\n")
+    (deploy / 'a.sql').write_text("BEGIN;\nSELECT 1;\nCOMMIT;\n")
+    git('add', '.', cwd=tmp_path)
+    git('commit', '-q', '-m', '0.1', cwd=tmp_path)
+    git('tag', '0.1', cwd=tmp_path)
+
+    plan.write_text("%project=test\na\n@0.1\na [a@0.1]\n@0.2\n")
+    (deploy / 'a.sql').write_text("SELECT 2;\n")
+    git('commit', '-q', '-am', '0.2', cwd=tmp_path)
+    git('tag', '0.2', cwd=tmp_path)
+
+    plan.write_text(textwrap.dedent("""\
+        %project=test
+        a
+        @0.1
+        a [a@0.1]
+        @0.2
+        a [a@0.2]
+        """))
+    (deploy / 'a.sql').write_text("SELECT 3;\n")
+
+    return tmp_path
+
+
+def test_git_objects(repo):
+    with GitObjects() as objects:
+        assert objects.rev('@0.1') == 'refs/tags/0.1'
+        assert objects.read('refs/tags/0.1', 'deploy/a.sql') == \
+            b"BEGIN;\nSELECT 1;\nCOMMIT;\n"
+        assert objects.read('HEAD', str(repo / 'deploy' / 'a.sql')) == \
+            b"SELECT 2;\n"
+        assert objects.oid('HEAD', 'deploy/a.sql') == \
+            subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD:deploy/a.sql'], text=True,
+            ).strip()
+
+        with pytest.raises(FileNotFoundError):
+            objects.read('refs/tags/0.1', 'deploy/b.sql')
+
+        with pytest.raises(FileNotFoundError):
+            objects.read('refs/tags/nope', 'deploy/a.sql')
+
+        with pytest.raises(FileNotFoundError):
+            objects.read('HEAD', 'deploy')
+
+        assert objects.read('HEAD', 'deploy/a.sql') == b"SELECT 2;\n"
+
+
+def test_single_process(monkeypatch, repo):
+    popen = []
+    monkeypatch.setattr(
+        subprocess, 'Popen',
+        lambda *args, _popen=subprocess.Popen, **kwargs:
+            popen.append(args) or _popen(*args, **kwargs),
+    )
+
+    with GitObjects('{tag}') as objects:
+        files = build(read_project()._replace(git=objects))
+
+    assert len(popen) == 1
+    assert files['test--0.1.sql'] == GUARD + b"SELECT 1;\n"
+
+
+def test_build(repo):
+    with GitObjects() as objects:
+        project = read_project()._replace(git=objects)
+
+        assert build(project) == {
+            'test--0.1.sql': GUARD + b"SELECT 1;\n",
+            'test--0.1--0.2.sql': GUARD + b"SELECT 2;\n",
+            'test--0.2--HEAD.sql': GUARD + b"SELECT 3;\n",
+            'test.control': b'',
+        }
+
+
+def test_build_missing(repo):
+    with GitObjects('refs/tags/v{tag}') as objects:
+        project = read_project()._replace(git=objects)
+
+        with pytest.raises(FileNotFoundError, match="no such file in git"):
+            build(project)
+
+
+def test_git_script(repo):
+    with GitObjects() as objects:
+        project = read_project()._replace(git=objects)
+
+        assert project.git_script('a', '') is None
+        assert project.git_script('a', '@0.1') == \
+            ('refs/tags/0.1', os.path.join('deploy', 'a.sql'))
+
+        with pytest.raises(ValueError, match="must start with '@'"):
+            project.git_script('a', '0.1')
+
+
+def test_check(repo):
+    with GitObjects() as objects:
+        assert check_project(read_project()._replace(git=objects)) == []
+
+    with GitObjects('refs/tags/v{tag}') as objects:
+        assert check_project(read_project()._replace(git=objects)) == [
+            "missing deploy script: refs/tags/v0.1:deploy/a.sql",
+            "missing deploy script: refs/tags/v0.2:deploy/a.sql",
+        ]
+
+
+def test_cli(repo):
+    pgxsq.main(['--dest', 'ext', '--git-ref'])
+
+    assert (repo / 'ext' / 'test--0.1.sql').read_bytes() == \
+        GUARD + b"SELECT 1;\n"
+    assert (repo / 'ext' / 'test--0.1--0.2.sql').read_bytes() == \
+        GUARD + b"SELECT 2;\n"
+
+    # Up to date as long as the tags point to the same blobs.
+    before = os.stat(repo / 'ext' / 'test--0.1.sql').st_mtime_ns
+    pgxsq.main(['--dest', 'ext', '--git-ref'])
+    assert os.stat(repo / 'ext' / 'test--0.1.sql').st_mtime_ns == before
+
+    git('tag', '-f', '0.1', '0.2', cwd=repo)
+    pgxsq.main(['--dest', 'ext', '--git-ref'])
+    assert (repo / 'ext' / 'test--0.1.sql').read_bytes() == \
+        GUARD + b"SELECT 2;\n"
+
+
+def test_cli_check(capsys, repo):
+    with pytest.raises(SystemExit) as exc:
+        pgxsq.main(['--check', '--git-ref', 'refs/tags/v{tag}'])
+
+    assert exc.value.code == 1
+    assert capsys.readouterr().err == (
+        "error: missing deploy script: refs/tags/v0.1:deploy/a.sql\n"
+        "error: missing deploy script: refs/tags/v0.2:deploy/a.sql\n"
+    )
@@ -0,0 +1,135 @@
+import json
+import textwrap
+
+import pytest
+
+from pgxsq import Change, Changeset, Project, UpdatePath, update_paths
+
+
+@pytest.fixture
+def project(tmp_path):
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    for name, size in [('a', 10), ('b', 20), ('c', 40), ('d', 80)]:
+        (deploy / f'{name}.sql').write_text('-' * (size - 1) + '\n')
+    return Project('test', [
+        Change('a', ['@0.1']),
+        Change('b', ['@0.2']),
+        Change('c', ['@0.3']),
+        Change('d', []),
+    ], str(deploy))
+
+
+def test_update_paths(project):
+    assert update_paths(project) == [
+        UpdatePath(['@0.1', '@0.2'], 20),
+        UpdatePath(['@0.1', '@0.2', '@0.3'], 60),
+        UpdatePath(['@0.1', '@0.2', '@0.3', ''], 140),
+        UpdatePath(['@0.2', '@0.3'], 40),
+        UpdatePath(['@0.2', '@0.3', ''], 120),
+        UpdatePath(['@0.3', ''], 80),
+    ]
+
+
+def test_update_paths_extra(project):
+    extra = [
+        Changeset('@0.1', '', [('b', ''), ('c', ''), ('d', '')]),
+        Changeset('@0.1', '@0.3', [('b', ''), ('c', '')]),
+    ]
+    paths = {
+        (p.source, p.target): p for p in update_paths(project, None, extra)
+    }
+
+    assert paths['@0.1', ''] == UpdatePath(['@0.1', ''], 140)
+    assert paths['@0.1', ''].steps == 1
+    assert paths['@0.1', '@0.3'] == UpdatePath(['@0.1', '@0.3'], 60)
+    assert paths['@0.2', ''].steps == 2
+
+
+def test_update_paths_ties(project):
+    # Both paths to HEAD take two steps.  The smaller one is chosen.
+    changesets = [
+        Changeset('', '@0.1', [('a', '')]),
+        Changeset('@0.1', '@0.2', [('d', '')]),
+        Changeset('@0.1', '@0.3', [('a', '')]),
+        Changeset('@0.2', '', [('a', '')]),
+        Changeset('@0.3', '', [('a', '')]),
+    ]
+    paths = {
+        (p.source, p.target): p for p in update_paths(project, changesets)
+    }
+
+    assert paths['@0.1', ''] == UpdatePath(['@0.1', '@0.3', ''], 20)
+    assert ('@0.2', '@0.3') not in paths
+
+
+@pytest.fixture
+def project_dir(tmp_path, workdir):
+    (tmp_path / 'sqitch.plan').write_text(textwrap.dedent("""
+        %project=test
+        a
+        @0.1
+        b
+        @0.2
+        c
+        """))
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    for name in 'abc':
+        (deploy / f'{name}.sql').write_text(f"SELECT '{name}';\n")
+    return tmp_path
+
+
+def test_cli_text(capsys, cli, project_dir):
+    assert cli.graph('--max-steps', '1') == 1
+    out, err = capsys.readouterr()
+
+    assert out == (
+        "FROM  TO    STEPS  BYTES  PATH\n"
+        "0.1   0.2       1     12  0.1 -> 0.2\n"
+        "0.1   HEAD      2     24  0.1 -> 0.2 -> HEAD (too long)\n"
+        "0.2   HEAD      1     12  0.2 -> HEAD\n"
+    )
+    assert err == "1 path(s) with more than 1 steps\n"
+
+
+def test_cli_json(capsys, cli, project_dir):
+    assert cli.graph(
+        '--format', 'json', '--update-to-latest', '--target', 'HEAD',
+    ) == 0
+    data = json.loads(capsys.readouterr().out)
+
+    assert data['versions'] == ['0.1', '0.2', 'HEAD']
+    assert data['updates'] == [
+        {'from': '0.1', 'to': '0.2', 'file': 'test--0.1--0.2.sql',
+         'bytes': 12},
+        {'from': '0.1', 'to': 'HEAD', 'file': 'test--0.1--HEAD.sql',
+         'bytes': 24},
+        {'from': '0.2', 'to': 'HEAD', 'file': 'test--0.2--HEAD.sql',
+         'bytes': 12},
+    ]
+    assert [(p['from'], p['to'], p['steps']) for p in data['paths']] == [
+        ('0.1', 'HEAD', 1),
+        ('0.2', 'HEAD', 1),
+    ]
+
+
+def test_cli_dot(cli, project_dir):
+    assert cli.graph(
+        '--format', 'dot', '--max-steps', '1', '--output', 'graph.dot',
+    ) == 1
+
+    assert (project_dir / 'graph.dot').read_text() == textwrap.dedent("""\
+        digraph "test" {
+          "0.1" [color=red];
+          "0.2";
+          "HEAD";
+          "0.1" -> "0.2" [label="12 bytes"];
+          "0.2" -> "HEAD" [label="12 bytes"];
+        }
+        """)
+
+
+def test_cli_unknown_tag(capsys, cli, project_dir):
+    assert cli.graph('--target', '0.9') == 1
+    assert capsys.readouterr().err == "error: unknown tag: 0.9\n"
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import pgxsq
+from pgxsq import build, iter_build, write_extension
+
+
+GUARD = b'\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+
+
+def test_build(project, tmp_path):
+    before = set(os.listdir(tmp_path))
+    files = build(project, extschema='a', placeholders={'SELECT': 'select'})
+
+    assert files == {
+        'test--0.1.sql': GUARD + b"select '@extschema@1';\n",
+        'test--0.1--0.2.sql': GUARD + b"select 'b';\n",
+        'test--0.2--HEAD.sql': GUARD + b"select '@extschema@2';\n",
+        'test.control': b'',
+    }
+    assert set(os.listdir(tmp_path)) == before
+
+
+def test_build_matches_write_extension(project, tmp_path):
+    dest = tmp_path / 'ext'
+    write_extension(project, str(dest), 'a')
+
+    for fname, content in build(project, extschema='a').items():
+        assert (dest / fname).read_bytes() == content
+
+
+def test_iter_build_is_lazy(project):
+    chunks = iter_build(project)
+
+    assert next(chunks) == ('test--0.1.sql', GUARD)
+
+    os.remove(project.deploy_script_path('a', '@0.2'))
+
+    with pytest.raises(FileNotFoundError):
+        next(chunks)
+
+
+def test_iter_build_chunks(project):
+    assert [fname for fname, _ in iter_build(project)] == [
+        'test--0.1.sql', 'test--0.1.sql',
+        'test--0.1--0.2.sql', 'test--0.1--0.2.sql',
+        'test--0.2--HEAD.sql', 'test--0.2--HEAD.sql',
+        'test.control',
+    ]
+
+
+def test_iter_build_reads_large_scripts_in_chunks(monkeypatch, project):
+    expected = build(project)
+
+    monkeypatch.setattr(pgxsq, '_ZERO_COPY_MIN', 1)
+    monkeypatch.setattr(pgxsq, '_BUFSIZE', 4)
+    chunks = [chunk for _, chunk in iter_build(project) if chunk != GUARD]
+
+    assert max(map(len, chunks)) <= 4
+    assert build(project) == expected
+
+
+def test_build_changesets(project):
+    changesets = list(project.changesets)[1:2]
+    extra = project.install_changesets()
+
+    assert sorted(build(
+        project, changesets=changesets, extra_changesets=extra,
+    )) == ['test--0.1--0.2.sql', 'test--0.2.sql', 'test.control']
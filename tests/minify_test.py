@@ -0,0 +1,115 @@
+import pytest
+
+from pgxsq import BuildStats, Change, Project, build, minify, write_extension
+
+
+@pytest.mark.parametrize('script, expected', [
+    ("", ""),
+    ("-- only a comment\n\n", ""),
+    ("SELECT 1;", "SELECT 1;\n"),
+    ("  SELECT\t\t1 ,\n    2 ;\n\n", "SELECT 1,2;\n"),
+    ("CREATE TABLE t (\n  a int, -- x\n  b text\n);\n",
+     "CREATE TABLE t(a int,b text);\n"),
+    ("SELECT 1 /* a /* nested */ comment */ + 2;", "SELECT 1 + 2;\n"),
+    ("SELECT 1-/**/-1, 2 - -2;", "SELECT 1- -1,2 - -2;\n"),
+    ("SELECT 'a  -- b',  \"c  /* d */\";",
+     "SELECT 'a  -- b',\"c  /* d */\";\n"),
+    ("SELECT E'\\'  -- x' ;", "SELECT E'\\'  -- x';\n"),
+    ("SELECT 'it''s  ok' ;", "SELECT 'it''s  ok';\n"),
+    ("SELECT U&'d\\0061t\\+000061'  ;", "SELECT U&'d\\0061t\\+000061';\n"),
+    # String constants continue across line feeds only.
+    ("SELECT 'a'\n  -- x\n  'b';", "SELECT 'a'\n'b';\n"),
+    ("SELECT $$ a  -- b $$,  $x$ $$ $x$;",
+     "SELECT $$ a  -- b $$,$x$ $$ $x$;\n"),
+    ("COPY t FROM stdin;  \n1\t  -- a\n\\.\nSELECT  1;",
+     "COPY t FROM stdin;  \n1\t  -- a\n\\.\nSELECT 1;\n"),
+])
+def test_minify(script, expected):
+    assert minify(script) == expected
+    assert minify(script.encode()) == expected.encode()
+    assert minify(expected) == expected
+
+
+BODIES = """\
+CREATE FUNCTION f() RETURNS int AS $$
+  -- comment
+  SELECT  1;
+$$ LANGUAGE sql;
+CREATE OR REPLACE FUNCTION g(a text DEFAULT $d$  x  $d$) RETURNS int
+LANGUAGE plpgsql AS $body$
+BEGIN
+  RETURN  1;  /* comment */
+END
+$body$;
+CREATE FUNCTION h() RETURNS int LANGUAGE plpython3u AS $$
+if  True:
+    return 1
+$$;
+DO $$ BEGIN  PERFORM 1; END $$;
+DO LANGUAGE plperl $$ print  1; $$;
+SELECT $$  not  a  body  $$;
+"""
+
+
+def test_minify_bodies():
+    assert minify(BODIES) == (
+        "CREATE FUNCTION f()RETURNS int AS $$\n  -- comment\n  SELECT  1;\n"
+        "$$ LANGUAGE sql;"
+        "CREATE OR REPLACE FUNCTION g(a text DEFAULT $d$  x  $d$)RETURNS int\n"
+        "LANGUAGE plpgsql AS $body$\nBEGIN\n  RETURN  1;  /* comment */\n"
+        "END\n$body$;"
+        "CREATE FUNCTION h()RETURNS int LANGUAGE plpython3u AS $$\n"
+        "if  True:\n    return 1\n$$;"
+        "DO $$ BEGIN  PERFORM 1; END $$;"
+        "DO LANGUAGE plperl $$ print  1; $$;"
+        "SELECT $$  not  a  body  $$;\n"
+    )
+    assert minify(BODIES, bodies=True) == (
+        "CREATE FUNCTION f()RETURNS int AS $$SELECT 1;$$ LANGUAGE sql;"
+        "CREATE OR REPLACE FUNCTION g(a text DEFAULT $d$  x  $d$)RETURNS int\n"
+        "LANGUAGE plpgsql AS $body$BEGIN\nRETURN 1;END$body$;"
+        "CREATE FUNCTION h()RETURNS int LANGUAGE plpython3u AS $$\n"
+        "if  True:\n    return 1\n$$;"
+        "DO $$BEGIN PERFORM 1;END$$;"
+        "DO LANGUAGE plperl $$ print  1; $$;"
+        "SELECT $$  not  a  body  $$;\n"
+    )
+    assert minify(BODIES.encode(), bodies=True) == \
+        minify(BODIES, bodies=True).encode()
+
+
+@pytest.fixture
+def project(tmp_path):
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    (deploy / 'a.sql').write_text(
+        "BEGIN;\n\n-- Table a.\nCREATE TABLE a (\n    x int\n);\n\nCOMMIT;\n",
+    )
+    (deploy / 'b.sql').write_text("SELECT  'b';  -- b\n")
+    return Project('test', [Change('a', []), Change('b', [])], str(deploy))
+
+
+GUARD = b'\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+
+
+def test_build(project):
+    files = build(project, minify=True)
+
+    assert files['test--HEAD.sql'] == \
+        GUARD + b"CREATE TABLE a(x int);\nSELECT 'b';\n"
+
+
+def test_write_extension(project, tmp_path):
+    stats = BuildStats()
+    dest = tmp_path / 'ext'
+    write_extension(project, str(dest), None, minify=True, stats=stats)
+
+    assert (dest / 'test--HEAD.sql').read_bytes() == \
+        build(project, minify=True)['test--HEAD.sql']
+    assert stats.counters['minify_bytes_in'] == 63
+    assert stats.counters['minify_bytes_out'] == 35
+    assert 'from 63 to 35 bytes (44.4% saved)' in stats.summary()
+
+    # Minification is a build option.
+    write_extension(project, str(dest), None)
+    assert b'-- Table a.' in (dest / 'test--HEAD.sql').read_bytes()
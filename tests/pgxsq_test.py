@@ -3,6 +3,8 @@ import textwrap
 
 import pytest
 
+import pgxsq
+
 
 def test_version(cli, capfd):
     rc = cli.version()
@@ -298,3 +300,12 @@ def test_invalid_extname(capsys, cli, extname, sqitch, workdir):
 
     assert rc == 1
     assert err.startswith("error: invalid extension name or version: ")
+
+
+def test_use_sqitch(sqitch, workdir):
+    sqitch.init('test')
+    sqitch.add('foo', "CREATE VIEW foo AS SELECT 1;")
+    sqitch.tag('0.1')
+    sqitch.rework('foo', "CREATE OR REPLACE VIEW foo AS SELECT 2;")
+
+    assert pgxsq.read_project(use_sqitch=True) == pgxsq.read_project()
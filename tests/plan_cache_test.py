@@ -0,0 +1,99 @@
+import os
+import textwrap
+
+import pytest
+
+import pgxsq
+from pgxsq import BuildStats, Change, Changeset, read_project
+
+
+@pytest.fixture
+def project_dir(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'sqitch.plan').write_text(textwrap.dedent("""
+        %project=test
+        a
+        @0.1
+        a [a@0.1]
+        """))
+    return tmp_path
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+def test_cold_and_warm(project_dir, cache_dir):
+    cold = BuildStats()
+    project = read_project(stats=cold, cache_dir=cache_dir)
+    warm = BuildStats()
+    cached = read_project(stats=warm, cache_dir=cache_dir)
+
+    assert 'parse_plan' in cold.phases
+    assert 'parse_plan' not in warm.phases
+    assert cached == project
+    assert cached.plan == [
+        Change('a', ['@0.1']),
+        Change('a', [], ('a@0.1',)),
+    ]
+    assert cached.changeset_cache == [
+        Changeset('', '@0.1', [('a', '@0.1')]),
+        Changeset('@0.1', '', [('a', '')]),
+    ]
+    assert list(cached.changesets) == list(
+        cached._replace(changeset_cache=None).changesets
+    )
+
+
+def test_warm_run_skips_sqitch(monkeypatch, project_dir, cache_dir):
+    monkeypatch.setattr(
+        pgxsq, '_run_sqitch_plan',
+        lambda root=None: (
+            'test', [Change('a', [])], [Changeset('', '', [('a', '')])],
+        ),
+    )
+    read_project(use_sqitch=True, cache_dir=cache_dir)
+    monkeypatch.setattr(pgxsq, '_run_sqitch_plan', None)
+
+    assert read_project(use_sqitch=True, cache_dir=cache_dir).plan == [
+        Change('a', []),
+    ]
+
+
+@pytest.mark.parametrize('fname, content', [
+    ('sqitch.plan', "%project=test\nb\n"),
+    ('sqitch.conf', "[core]\n\tengine = pg\n"),
+])
+def test_invalidate(project_dir, cache_dir, fname, content):
+    read_project(cache_dir=cache_dir)
+    (project_dir / fname).write_text(content)
+    stats = BuildStats()
+    read_project(stats=stats, cache_dir=cache_dir)
+
+    assert 'parse_plan' in stats.phases
+
+
+def test_invalidate_version(monkeypatch, project_dir, cache_dir):
+    read_project(cache_dir=cache_dir)
+    monkeypatch.setattr(pgxsq, '_version', lambda: '999')
+    stats = BuildStats()
+    read_project(stats=stats, cache_dir=cache_dir)
+
+    assert 'parse_plan' in stats.phases
+
+
+def test_corrupt_cache(project_dir, cache_dir):
+    project = read_project(cache_dir=cache_dir)
+    for fname in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, fname), 'wb') as fp:
+            fp.write(b'garbage')
+
+    assert read_project(cache_dir=cache_dir) == project
+
+
+def test_missing_plan(tmp_path, monkeypatch, cache_dir):
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(pgxsq.ProjectNotFound):
+        read_project(cache_dir=cache_dir)
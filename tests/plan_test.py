@@ -0,0 +1,191 @@
+import io
+import os
+import random
+import textwrap
+
+import pytest
+
+from pgxsq import (
+    Change, Changeset, EmptyPlan, InvalidPlan, Plan, Project, ProjectNotFound,
+    parse_plan, read_config, read_project,
+)
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example')
+
+
+def plan(text):
+    return io.StringIO(textwrap.dedent(text).lstrip())
+
+
+def test_parse_plan():
+    name, changes = parse_plan(plan("""
+        %syntax-version=1.0.0
+        %project=test
+        %uri=https://example.com/
+
+        # Comment
+        a 2023-02-26T20:26:35Z Jane Doe <jane@example.com> # Add a
+        @0.1 2023-02-26T20:32:57Z Jane Doe <jane@example.com> # Tag 0.1
+        @rc1 2023-02-26T20:32:58Z Jane Doe <jane@example.com>
+        b [a] 2023-02-26T20:33:00Z Jane Doe <jane@example.com> # Add b [x]
+        a [a@0.1 !c] 2023-02-26T20:45:56Z Jane Doe <jane@example.com> # a\\nb
+        +c 2023-02-26T20:46:00Z Jane Doe <jane@example.com>
+        """))
+
+    assert name == 'test'
+    assert changes == [
+        Change('a', ['@0.1', '@rc1']),
+        Change('b', [], ('a',)),
+        Change('a', [], ('a@0.1',)),
+        Change('c', []),
+    ]
+
+
+def test_parse_plan_crlf():
+    name, changes = parse_plan(io.StringIO(
+        "%project=test\r\na 2023-02-26T20:26:35Z J <j@x> # n\r\n@0.1\r\n",
+    ))
+
+    assert name == 'test'
+    assert changes == [Change('a', ['@0.1'])]
+
+
+def test_parse_plan_interned_names():
+    name, changes = parse_plan(plan("""
+        %project=test
+        a
+        @0.1
+        a [a@0.1]
+        """))
+
+    assert changes[0].name is changes[1].name
+
+
+def test_parse_plan_without_project():
+    with pytest.raises(InvalidPlan):
+        parse_plan(plan("a\n"))
+
+
+def test_parse_plan_tag_before_change():
+    with pytest.raises(InvalidPlan):
+        parse_plan(plan("""
+            %project=test
+            @0.1
+            """))
+
+
+@pytest.mark.parametrize('line', ['-a', 'a:b', 'a [b', '@'])
+def test_parse_plan_invalid_line(line):
+    with pytest.raises(InvalidPlan):
+        parse_plan(plan(f"%project=test\n{line}\n"))
+
+
+def test_read_config(tmp_path):
+    path = tmp_path / 'sqitch.conf'
+    path.write_text(textwrap.dedent("""
+        [core]
+        \tengine = pg ; comment
+        \tTop_Dir = "my project"  # comment
+        [engine "pg"]
+        \tplan_file = "a\\"b"
+        \tregistry
+        """))
+
+    assert read_config(path) == {
+        'core.engine': 'pg',
+        'core.top_dir': 'my project',
+        'engine.pg.plan_file': 'a"b',
+        'engine.pg.registry': 'true',
+    }
+
+
+def test_read_config_missing(tmp_path):
+    assert read_config(tmp_path / 'sqitch.conf') == {}
+
+
+def test_read_project_example(monkeypatch):
+    monkeypatch.chdir(EXAMPLE)
+
+    assert read_project() == Project('array_util', [
+        Change('array_sort', ['@0.1']),
+        Change('array_sort', ['@0.2'], ('array_sort@0.1',)),
+    ], changeset_cache=[
+        Changeset('', '@0.1', [('array_sort', '@0.1')]),
+        Changeset('@0.1', '@0.2', [('array_sort', '')]),
+    ])
+
+
+def test_read_project_dirs(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'sqitch.conf').write_text(textwrap.dedent("""
+        [core]
+        \tengine = pg
+        \ttop_dir = db
+        [engine "pg"]
+        \tdeploy_dir = db/scripts
+        """))
+    (tmp_path / 'db').mkdir()
+    (tmp_path / 'db' / 'sqitch.plan').write_text("%project=test\na\n")
+
+    project = read_project()
+
+    assert project == Project('test', [Change('a', [])], 'db/scripts', [
+        Changeset('', '', [('a', '')]),
+    ])
+
+
+def test_read_project_not_found(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+    with pytest.raises(ProjectNotFound):
+        read_project()
+
+
+def test_read_project_empty_plan(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'sqitch.plan').write_text("%project=test\n")
+
+    with pytest.raises(EmptyPlan):
+        read_project()
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_read_project_changesets(monkeypatch, tmp_path, seed):
+    rng = random.Random(seed)
+    lines = ['%project=test']
+    for i in range(rng.randrange(1, 40)):
+        lines.append(rng.choice('abcde'))
+        for j in range(rng.choice([0, 0, 0, 1, 2])):
+            lines.append(f'@{i}.{j}')
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'sqitch.plan').write_text('\n'.join(lines) + '\n')
+    project = read_project()
+
+    # Changesets computed while reading the plan match the changesets traced
+    # back from HEAD.
+    assert project.changeset_cache == list(
+        project._replace(changeset_cache=None).changesets
+    )
+
+
+def test_plan():
+    changes = [
+        Change('a', ['@0.1', '@v1']),
+        Change('b', [], ('a',)),
+        Change('a', ['@0.2']),
+    ]
+    plan = Plan(changes)
+
+    assert plan == changes
+    assert changes == plan
+    assert plan != changes[:2]
+    assert plan != 'abc'
+    assert len(plan) == 3
+    assert plan[-1] == Change('a', ['@0.2'])
+    assert plan[1:] == changes[1:]
+    assert list(reversed(plan)) == changes[::-1]
+
+    with pytest.raises(IndexError):
+        plan[3]
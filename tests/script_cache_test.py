@@ -0,0 +1,72 @@
+import os
+
+from pgxsq import Change, Project, ScriptCache, write_extension
+
+
+def test_cache_hit(tmp_path):
+    path = tmp_path / 'a.sql'
+    path.write_text('a')
+    cache = ScriptCache()
+    calls = []
+
+    def load():
+        calls.append(None)
+        return path.read_text()
+
+    assert cache.get(str(path), load) == 'a'
+    assert cache.get(str(path), load) == 'a'
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_invalidate_on_change(tmp_path):
+    path = tmp_path / 'a.sql'
+    path.write_text('a')
+    cache = ScriptCache()
+
+    assert cache.get(str(path), path.read_text) == 'a'
+
+    path.write_text('bb')
+
+    assert cache.get(str(path), path.read_text) == 'bb'
+
+
+def test_cache_evict_lru(tmp_path):
+    paths = []
+    for name in 'abc':
+        path = tmp_path / f'{name}.sql'
+        path.write_text(name * 4)
+        paths.append(str(path))
+
+    cache = ScriptCache(max_bytes=8)
+    a, b, c = paths
+
+    cache.get(a, lambda: 'a')
+    cache.get(b, lambda: 'b')
+    cache.get(a, lambda: 'a')  # Make b least recently used.
+    cache.get(c, lambda: 'c')
+
+    assert cache.misses == 3
+    cache.get(a, lambda: 'a')
+    assert cache.misses == 3
+    cache.get(b, lambda: 'b')
+    assert cache.misses == 4
+
+
+def test_shared_across_builds(tmp_path):
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir()
+    (deploy / 'a@0.1.sql').write_text("BEGIN;\nSELECT 1;\nCOMMIT;\n")
+    (deploy / 'a.sql').write_text("SELECT 2;\n")
+
+    project = Project('test', [
+        Change('a', ['@0.1']),
+        Change('a', []),
+    ], str(deploy))
+    cache = ScriptCache()
+
+    write_extension(project, str(tmp_path / 'x'), None, cache=cache)
+    write_extension(project, str(tmp_path / 'y'), None, cache=cache)
+
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert os.listdir(tmp_path / 'y')
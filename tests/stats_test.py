@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from pgxsq import BuildStats, write_extension
+
+
+def test_stats(project, tmp_path):
+    stats = BuildStats()
+    write_extension(project, str(tmp_path / 'ext'), 'a', stats=stats)
+
+    assert list(stats.phases) == ['changesets', 'check', 'generate', 'publish']
+    assert sorted(stats.files) == [
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--HEAD.sql',
+    ]
+
+    data = stats.files['test--0.1.sql']
+    assert data['bytes_read'] == len("BEGIN;\nSELECT 'a1';\nCOMMIT;\n")
+    assert data['bytes_written'] == \
+        (tmp_path / 'ext' / 'test--0.1.sql').stat().st_size
+    assert data['substitutions'] == 1
+    assert data['seconds'] >= 0
+
+    assert stats.counters == {
+        'scripts': 3,
+        'scripts_read': 3,
+        'statements_stripped': 2,
+        'files_skipped': 0,
+    }
+
+
+def test_stats_up_to_date(project, tmp_path):
+    write_extension(project, str(tmp_path / 'ext'), None)
+    stats = BuildStats()
+    write_extension(project, str(tmp_path / 'ext'), None, stats=stats)
+
+    assert stats.files == {}
+    assert stats.counters == {'files_skipped': 3}
+
+
+def test_callback(project, tmp_path):
+    events = []
+    stats = BuildStats(lambda *event: events.append(event))
+    write_extension(project, str(tmp_path / 'ext'), None, stats=stats)
+
+    assert [(kind, name) for kind, name, _ in events if kind == 'phase'] == [
+        ('phase', 'changesets'),
+        ('phase', 'check'),
+        ('phase', 'generate'),
+        ('phase', 'publish'),
+    ]
+    assert {name: data for kind, name, data in events if kind == 'file'} == \
+        stats.files
+
+
+def test_as_dict(project, tmp_path):
+    stats = BuildStats()
+    write_extension(project, str(tmp_path / 'ext'), None, stats=stats)
+    data = json.loads(json.dumps(stats.as_dict()))
+
+    assert data['total'] == pytest.approx(sum(data['phases'].values()))
+    assert data['files'].keys() == stats.files.keys()
+    assert data['counters'] == dict(stats.counters)
+
+
+def test_summary(project, tmp_path):
+    stats = BuildStats()
+    write_extension(project, str(tmp_path / 'ext'), None, stats=stats)
+    summary = stats.summary()
+
+    assert 'test--0.1--0.2.sql' in summary
+    assert summary.endswith(
+        "3 of 3 deploy script(s) read, 2 statement(s) stripped,"
+        " 0 file(s) up to date"
+    )
@@ -21,11 +21,11 @@ def test_case_insensitive(mapcase):
     assert ''.join(strip_transactions(fp)) == ""
 
 
-def test_keep_indented_statements():
-    sql = " BEGIN;\n COMMIT;\n"
+def test_strip_indented_statements():
+    sql = " BEGIN;\n\tCOMMIT;\n"
     fp = io.StringIO(sql)
 
-    assert ''.join(strip_transactions(fp)) == sql
+    assert ''.join(strip_transactions(fp)) == ""
 
 
 def test_multiple_transactions():
@@ -53,8 +53,7 @@ def test_keep_plpgsql_begin():
     assert ''.join(strip_transactions(fp)) == sql
 
 
-@pytest.mark.xfail(reason="edge case", strict=True)
-def test_edge_case_multline_string_literal():
+def test_keep_multiline_string_literal():
     sql = textwrap.dedent("""
         SELECT '
         BEGIN;
@@ -64,3 +63,242 @@ def test_edge_case_multline_string_literal():
     fp = io.StringIO(sql)
 
     assert ''.join(strip_transactions(fp)) == sql
+
+
+@pytest.mark.parametrize('stmt', [
+    'BEGIN WORK;',
+    'begin transaction;',
+    'BEGIN ISOLATION LEVEL SERIALIZABLE, READ ONLY, NOT DEFERRABLE;',
+    'START TRANSACTION;',
+    'START TRANSACTION ISOLATION LEVEL REPEATABLE READ;',
+    'COMMIT WORK;',
+    'COMMIT AND NO CHAIN;',
+    'END;',
+    'END TRANSACTION;',
+    'BEGIN\n  ;',
+])
+def test_transaction_statements(stmt):
+    sql = f"SELECT 1;\n{stmt}\nSELECT 2;\n"
+
+    assert ''.join(strip_transactions([sql])) == "SELECT 1;\nSELECT 2;\n"
+
+
+@pytest.mark.parametrize('sql', [
+    "START;\n",
+    "BEGIN ATOMIC;\n",
+    "COMMIT PREPARED 'x';\n",
+    "BEGIN 1;\n",
+    "SELECT 1; SELECT BEGIN;\n",
+    "SELECT\nBEGIN;\n",
+    "ROLLBACK;\n",
+    "END\n",
+])
+def test_keep_other_statements(sql):
+    assert ''.join(strip_transactions([sql])) == sql
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("BEGIN; -- start\nSELECT 1;\nCOMMIT; /* end */\n",
+     "-- start\nSELECT 1;\n/* end */\n"),
+    ("BEGIN;\r\nSELECT 1;\r\nCOMMIT;\r\n", "SELECT 1;\r\n"),
+    ("SELECT 1; COMMIT;\n", "SELECT 1; \n"),
+    ("BEGIN; COMMIT;\nSELECT 1;\n", "SELECT 1;\n"),
+    ("\n  \nBEGIN;\n\n", "\n  \n\n"),
+    ("COMMIT;", ""),
+])
+def test_whitespace_and_comments(sql, expected):
+    assert ''.join(strip_transactions([sql])) == expected
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT '\nBEGIN;\n';\n",
+    "SELECT E'\\'\nBEGIN;\n';\n",
+    "SELECT 'it''s\nBEGIN;\n';\n",
+    'SELECT 1 AS "\nBEGIN;\n";\n',
+    "SELECT $$\nBEGIN;\n$$;\n",
+    "SELECT $a$ $$\nBEGIN;\n$a$;\n",
+    "-- x\nSELECT 1 -- ;\nBEGIN;\n",
+    "/* /* */\nBEGIN;\n*/\n",
+    "SELECT a$b$c\nBEGIN;\nSELECT $b$;\n",
+    "SELECT a$$ $$;\nBEGIN;\n",
+])
+def test_keep_quoted_and_commented(sql):
+    assert ''.join(strip_transactions([sql])) == sql
+
+
+def test_keep_begin_atomic():
+    sql = textwrap.dedent("""
+        BEGIN;
+        CREATE OR REPLACE FUNCTION f(x int) RETURNS int
+            LANGUAGE sql
+            BEGIN ATOMIC
+                SELECT CASE WHEN x > 0 THEN 1 END;
+                SELECT 2;
+            END;
+        COMMIT;
+        """)
+
+    assert ''.join(strip_transactions([sql])) == textwrap.dedent("""
+        CREATE OR REPLACE FUNCTION f(x int) RETURNS int
+            LANGUAGE sql
+            BEGIN ATOMIC
+                SELECT CASE WHEN x > 0 THEN 1 END;
+                SELECT 2;
+            END;
+        """)
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("CREATE PROCEDURE p() $BEGIN; BEGIN;\n",
+     "CREATE PROCEDURE p() $BEGIN; BEGIN;\n"),
+    ("CREATE PROCEDURE p() 1BEGIN; BEGIN;\n",
+     "CREATE PROCEDURE p() 1BEGIN; BEGIN;\n"),
+    ("CREATE PROCEDURE p$BEGIN; BEGIN;\n",
+     "CREATE PROCEDURE p$BEGIN; \n"),
+    ("CREATE FUNCTION f() 'BEGIN' -- BEGIN\nxbegin BEGIN;\n",
+     "CREATE FUNCTION f() 'BEGIN' -- BEGIN\nxbegin BEGIN;\n"),
+    ("CREATE FUNCTION f() AS 'BEGIN;' /* BEGIN */;\nCOMMIT;\n",
+     "CREATE FUNCTION f() AS 'BEGIN;' /* BEGIN */;\n"),
+    ("CREATE TABLE begins (b int);\nCOMMIT;\n",
+     "CREATE TABLE begins (b int);\n"),
+])
+def test_begin_in_create_function(sql, expected):
+    for i in range(len(sql)):
+        assert ''.join(strip_transactions([sql[:i], sql[i:]])) == expected
+
+
+SCRIPT = textwrap.dedent("""
+    BEGIN;
+    -- Comment with 'quote
+    CREATE FUNCTION foo()
+        RETURNS text
+        LANGUAGE plpgsql
+        AS $body$
+    BEGIN
+        RETURN E'\\'
+    BEGIN;
+    COMMIT;
+    ' || $$;$$;
+    END $body$;
+    /* nested /* comment */ BEGIN; */
+    START TRANSACTION ISOLATION LEVEL SERIALIZABLE;
+    COMMIT;
+    """)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64])
+def test_chunk_boundaries(size):
+    chunks = [SCRIPT[i:i + size] for i in range(0, len(SCRIPT), size)]
+
+    assert ''.join(strip_transactions(chunks)) == \
+        ''.join(strip_transactions([SCRIPT]))
+
+
+SEED = textwrap.dedent("""\
+    BEGIN;
+    INSERT INTO t VALUES (1, 'a;b', E'c\\';d', "e;f", $$g;h$$, 2 - -1 / 3);
+    /* i; */ -- j;
+    insert into t values ($1, x$y$, e'\\'', 'k''', E''';');commit;
+    UPDATE t SET a = E'l' WHERE b = $m$;$m$;
+    END;
+    """)
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 16, 1000])
+def test_chunk_boundaries_skipped_statements(size):
+    chunks = [SEED[i:i + size] for i in range(0, len(SEED), size)]
+
+    assert ''.join(strip_transactions(chunks)) == textwrap.dedent("""\
+        INSERT INTO t VALUES (1, 'a;b', E'c\\';d', "e;f", $$g;h$$, 2 - -1 / 3);
+        /* i; */ -- j;
+        insert into t values ($1, x$y$, e'\\'', 'k''', E''';');
+        UPDATE t SET a = E'l' WHERE b = $m$;$m$;
+        """)
+
+
+def test_chunk_boundary_in_dollar_quote_tag():
+    sql = textwrap.dedent("""\
+        CREATE FUNCTION f() RETURNS void LANGUAGE plpgsql AS $fn$
+        BEGIN
+            IF true THEN
+                PERFORM 1;
+            END IF;
+        END;
+        $fn$;
+        """)
+
+    for i in range(len(sql)):
+        assert ''.join(strip_transactions([sql[:i], sql[i:]])) == sql
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT $$a$b $c$$, 'x' -- $$\n/* $ */;\n",
+    "SELECT typE'x', 1-/**/2/3 AS \"$$\";\n",
+    "SELECT E'a\\'' '', $q$ $ $$ $q$ FROM t;\n",
+])
+def test_chunk_boundaries_in_skipped_tokens(sql):
+    for i in range(len(sql)):
+        chunks = [sql[:i], sql[i:] + "COMMIT;\n"]
+        assert ''.join(strip_transactions(chunks)) == sql
+
+
+def test_stripped():
+    stripped = []
+    result = ''.join(strip_transactions([SCRIPT], stripped))
+
+    assert [(s.line, s.statement) for s in stripped] == [
+        (2, 'BEGIN;'),
+        (15, 'START TRANSACTION ISOLATION LEVEL SERIALIZABLE;'),
+        (16, 'COMMIT;'),
+    ]
+    assert result == SCRIPT.replace('\nBEGIN;', '', 1).replace(
+        'START TRANSACTION ISOLATION LEVEL SERIALIZABLE;\nCOMMIT;\n', '',
+    )
+
+
+def test_stripped_line_counts_line_feeds():
+    stripped = []
+    ''.join(strip_transactions(["SELECT 1;\r\n\rBEGIN;\n"], stripped))
+
+    assert [s.line for s in stripped] == [2]
+
+
+def test_bytes():
+    chunks = [SCRIPT.encode()[i:i + 5] for i in range(0, len(SCRIPT), 5)]
+    result = b''.join(strip_transactions(chunks))
+
+    assert result == ''.join(strip_transactions([SCRIPT])).encode()
+
+
+def test_non_ascii_identifiers():
+    sql = "SELECT größe$x$ FROM t;\nCOMMIT;\n"
+
+    assert ''.join(strip_transactions([sql])) == "SELECT größe$x$ FROM t;\n"
+    assert b''.join(strip_transactions([sql.encode()])) == \
+        "SELECT größe$x$ FROM t;\n".encode()
+
+
+@pytest.mark.parametrize('size', [1, 3, 1000])
+def test_copy_from_stdin(size):
+    sql = textwrap.dedent("""\
+        BEGIN;
+        COPY t (a, b) FROM stdin;
+        1\tit's
+        COMMIT;
+        \\.
+        COMMIT;
+        """)
+    chunks = [sql[i:i + size] for i in range(0, len(sql), size)]
+
+    assert ''.join(strip_transactions(chunks)) == textwrap.dedent("""\
+        COPY t (a, b) FROM stdin;
+        1\tit's
+        COMMIT;
+        \\.
+        """)
+
+
+def test_copy_to_stdout():
+    sql = "COPY t TO stdout;\nCOMMIT;\n"
+
+    assert ''.join(strip_transactions([sql])) == "COPY t TO stdout;\n"
@@ -0,0 +1,96 @@
+import pytest
+
+from pgxsq import Substitution
+
+
+def test_substitute():
+    subst = Substitution({
+        'EXTSCHEMA': '@extschema@',
+        'EXTOWNER': '@extowner@',
+        '$libdir/foo': 'MODULE_PATHNAME',
+    })
+
+    assert subst.subn(
+        "CREATE FUNCTION EXTSCHEMA.f() AS '$libdir/foo'; -- EXTOWNER\n"
+    ) == (
+        "CREATE FUNCTION @extschema@.f() AS 'MODULE_PATHNAME';"
+        " -- @extowner@\n",
+        3,
+    )
+
+
+def test_longest_match():
+    subst = Substitution({'ext': 'a', 'extschema': 'b'})
+
+    assert subst('extschema ext') == 'b a'
+
+
+def test_single_pass():
+    subst = Substitution({'a': 'b', 'b': 'a'})
+
+    assert subst('ab') == 'ba'
+
+
+def test_empty():
+    subst = Substitution({})
+
+    assert not subst
+    assert subst.subn('x') == ('x', 0)
+
+
+def test_empty_placeholder():
+    with pytest.raises(ValueError):
+        Substitution({'': 'x'})
+
+
+def test_extend():
+    subst = Substitution({'a': 'b'}, skip_comments=True).extend({'c': 'd'})
+
+    assert subst.mapping == {'a': 'b', 'c': 'd'}
+    assert subst.skip_comments
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("x -- x\nx", "y -- x\ny"),
+    ("x /* x /* x */ x */ x", "y /* x /* x */ x */ y"),
+    ("x /* don't */ x", "y /* don't */ y"),
+    ("'x -- x' x", "'y -- y' y"),
+    ("E'\\' -- x' x", "E'\\' -- y' y"),
+    ("'it''s -- x' x", "'it''s -- y' y"),
+    ('"x--x" x', '"y--y" y'),
+    ("$$ x -- x\n$$", "$$ y -- x\n$$"),
+    ("$re$a--b$re$, x", "$re$a--b$re$, y"),
+    ("$$it's$$; -- x\n", "$$it's$$; -- x\n"),
+    ("$a$ $$ -- $$ x $a$ x", "$a$ $$ -- $$ y $a$ y"),
+    ("a$$ -- x\n", "a$$ -- x\n"),
+    ("x /* x", "y /* x"),
+])
+def test_skip_comments(text, expected):
+    subst = Substitution({'x': 'y'}, skip_comments=True)
+
+    assert subst(text) == expected
+    assert subst.encode('utf-8')(text.encode()) == expected.encode()
+
+
+def test_encode():
+    subst = Substitution({'größe': 'maß'}).encode('latin-1')
+
+    assert subst.mapping == {b'gr\xf6\xdfe': b'ma\xdf'}
+    assert subst.subn(b"SELECT gr\xf6\xdfe;\r\n") == (b"SELECT ma\xdf;\r\n", 1)
+
+
+def test_skip_comments_dollar_quotes():
+    subst = Substitution({'EXTSCHEMA': '@extschema@'}, skip_comments=True)
+
+    assert subst("SELECT $re$a--b$re$, EXTSCHEMA.f();\n") == \
+        "SELECT $re$a--b$re$, @extschema@.f();\n"
+    assert subst("SELECT $$it's$$; -- EXTSCHEMA\n") == \
+        "SELECT $$it's$$; -- EXTSCHEMA\n"
+
+
+def test_skip_comments_non_ascii_identifier():
+    subst = Substitution({'x': 'y'}, skip_comments=True).encode('utf-8')
+
+    # Not an escape string because "E" is part of identifier "éE".
+    assert subst("SELECT éE'\\'; -- x\nx".encode()) == \
+        "SELECT éE'\\'; -- x\ny".encode()
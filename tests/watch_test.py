@@ -0,0 +1,148 @@
+import os
+import textwrap
+
+import pytest
+
+from pgxsq import _InotifyWatcher, _PollingWatcher, watch
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.fixture
+def project_dir(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'deploy').mkdir()
+    (tmp_path / 'deploy' / 'a@0.1.sql').write_text("SELECT 1;\n")
+    (tmp_path / 'deploy' / 'a.sql').write_text("SELECT 2;\n")
+    (tmp_path / 'deploy' / 'b.sql').write_text("SELECT 3;\n")
+    (tmp_path / 'sqitch.plan').write_text(textwrap.dedent("""
+        %project=test
+        a
+        @0.1
+        b
+        a [a@0.1]
+        """))
+    return tmp_path
+
+
+@pytest.mark.parametrize('poll', [None, 0.01])
+def test_watch(poll, project_dir):
+    dest = project_dir / 'ext'
+    messages = []
+    edits = [
+        # Rebuild affected changeset.
+        lambda: (project_dir / 'deploy' / 'b.sql').write_text("SELECT 4;\n"),
+        # Re-plan.
+        lambda: (project_dir / 'sqitch.plan').write_text(textwrap.dedent("""
+            %project=test
+            a
+            @0.1
+            b
+            """)),
+    ]
+
+    def report(msg):
+        messages.append(str(msg))
+        if not edits:
+            raise Stop
+        edits.pop(0)()
+
+    with pytest.raises(Stop):
+        watch(str(dest), None, poll=poll, report=report)
+
+    assert messages == [
+        "wrote 4 file(s)",
+        "wrote 2 file(s)",
+        "wrote 3 file(s)",
+    ]
+    assert sorted(os.listdir(dest)) == [
+        '.test.pgxsq.json',
+        'test--0.1--HEAD.sql',
+        'test--0.1.sql',
+        'test.control',
+    ]
+    assert (dest / 'test--0.1--HEAD.sql').read_text().endswith("SELECT 4;\n")
+
+
+@pytest.mark.parametrize('poll', [None, 0.01])
+def test_watch_deleted_script(poll, project_dir):
+    dest = project_dir / 'ext'
+    script = project_dir / 'deploy' / 'b.sql'
+    output = dest / 'test--0.1--HEAD.sql'
+    messages = []
+    edits = [
+        lambda: script.unlink(),
+        # Fail to replace the output file.
+        lambda: (output.unlink(), output.mkdir(), script.write_text("")),
+        lambda: (output.rmdir(), script.write_text("SELECT 4;\n")),
+    ]
+
+    def report(msg):
+        messages.append(str(msg))
+        if not edits:
+            raise Stop
+        edits.pop(0)()
+
+    with pytest.raises(Stop):
+        watch(str(dest), None, poll=poll, report=report)
+
+    assert messages[0] == "wrote 4 file(s)"
+    assert "b.sql" in messages[1]
+    assert "test--0.1--HEAD.sql" in messages[2]
+    assert messages[3:] == ["wrote 2 file(s)"]
+    assert "SELECT 4;\n" in output.read_text()
+
+
+@pytest.mark.parametrize('poll', [None, 0.01])
+def test_watch_reads_placeholders_again(poll, project_dir):
+    dest = project_dir / 'ext'
+    messages = []
+    edits = [
+        lambda: (project_dir / 'sqitch.conf').write_text(
+            "[pgxsq]\n\tplaceholder = SELECT 2=SELECT 22\n",
+        ),
+    ]
+
+    def report(msg):
+        messages.append(str(msg))
+        if not edits:
+            raise Stop
+        edits.pop(0)()
+
+    with pytest.raises(Stop):
+        watch(str(dest), None, poll=poll, report=report,
+              placeholders=['SELECT 3=SELECT 33'])
+
+    assert messages == ["wrote 4 file(s)", "wrote 3 file(s)"]
+    assert (dest / 'test--0.1--HEAD.sql').read_text() \
+        .endswith("SELECT 33;\nSELECT 22;\n")
+
+
+def test_polling_watcher(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a').write_text('')
+
+    with _PollingWatcher({str(tmp_path): True}, 0.01) as watcher:
+        (tmp_path / 'a').write_text('a')
+        (tmp_path / 'sub' / 'b').write_text('')
+
+        assert watcher.wait() == {
+            str(tmp_path / 'a'),
+            str(tmp_path / 'sub' / 'b'),
+        }
+
+
+def test_inotify_watcher(tmp_path):
+    (tmp_path / 'sub').mkdir()
+
+    try:
+        watcher = _InotifyWatcher({str(tmp_path): True})
+    except (AttributeError, OSError):
+        pytest.skip("inotify not available")
+
+    with watcher:
+        (tmp_path / 'sub' / 'b').write_text('')
+
+        assert watcher.wait() == {str(tmp_path / 'sub' / 'b')}
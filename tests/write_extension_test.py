@@ -0,0 +1,158 @@
+import os
+
+import pytest
+
+from pgxsq import BuildError, write_extension
+
+
+def build(project, dest, **kwargs):
+    """Build and return the mtimes of all generated files."""
+    write_extension(project, str(dest), None, **kwargs)
+    return {
+        fname: os.stat(dest / fname).st_mtime_ns
+        for fname in os.listdir(dest)
+    }
+
+
+def test_write_extension(project, tmp_path):
+    dest = tmp_path / 'ext'
+    write_extension(project, str(dest), 'a')
+
+    assert sorted(os.listdir(dest)) == [
+        '.test.pgxsq.json',
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--HEAD.sql',
+        'test.control',
+    ]
+    assert (dest / 'test--0.1.sql').read_text() == (
+        '\\echo Use "CREATE EXTENSION test" to load this file. \\quit\n'
+        "SELECT '@extschema@1';\n"
+    )
+    assert (dest / 'test.control').read_text() == ''
+
+
+def test_skip_unchanged(project, tmp_path):
+    dest = tmp_path / 'ext'
+    before = build(project, dest)
+    after = build(project, dest)
+
+    assert after == before
+
+
+def test_rebuild_changed_input(project, tmp_path):
+    dest = tmp_path / 'ext'
+    before = build(project, dest)
+
+    (tmp_path / 'deploy' / 'b.sql').write_text("SELECT 'b2';\n")
+    after = build(project, dest)
+
+    changed = {f for f in before if before[f] != after[f]}
+    assert changed == {'test--0.1--0.2.sql', '.test.pgxsq.json'}
+    assert "'b2'" in (dest / 'test--0.1--0.2.sql').read_text()
+
+
+def test_rebuild_touched_input(project, tmp_path):
+    dest = tmp_path / 'ext'
+    before = build(project, dest)
+
+    os.utime(tmp_path / 'deploy' / 'b.sql', ns=(0, 0))
+    after = build(project, dest)
+
+    assert after['test--0.1--0.2.sql'] == before['test--0.1--0.2.sql']
+    assert after['.test.pgxsq.json'] != before['.test.pgxsq.json']
+
+
+def test_rebuild_changed_options(project, tmp_path):
+    dest = tmp_path / 'ext'
+    build(project, dest)
+    write_extension(project, str(dest), 'a')
+
+    assert '@extschema@' in (dest / 'test--0.1.sql').read_text()
+
+
+def test_rebuild_deleted_output(project, tmp_path):
+    dest = tmp_path / 'ext'
+    build(project, dest)
+
+    os.remove(dest / 'test--0.1.sql')
+    build(project, dest)
+
+    assert os.path.exists(dest / 'test--0.1.sql')
+
+
+def test_force(project, tmp_path):
+    dest = tmp_path / 'ext'
+    before = build(project, dest)
+    after = build(project, dest, force=True)
+
+    assert all(before[f] != after[f] for f in before if f.endswith('.sql'))
+
+
+def test_remove_stale_outputs(project, tmp_path):
+    dest = tmp_path / 'ext'
+    build(project, dest)
+    (dest / 'other.sql').write_text('')
+
+    project.plan[2:] = []
+    os.rename(tmp_path / 'deploy' / 'a@0.2.sql', tmp_path / 'deploy' / 'a.sql')
+    build(project, dest)
+
+    assert sorted(os.listdir(dest)) == [
+        '.test.pgxsq.json',
+        'other.sql',
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test.control',
+    ]
+
+
+def test_jobs(project, tmp_path):
+    serial = tmp_path / 'serial'
+    parallel = tmp_path / 'parallel'
+    write_extension(project, str(serial), 'a')
+    write_extension(project, str(parallel), 'a', jobs=4)
+
+    assert sorted(os.listdir(serial)) == sorted(os.listdir(parallel))
+    for fname in os.listdir(serial):
+        if fname.endswith('.sql'):
+            assert (serial / fname).read_bytes() == \
+                (parallel / fname).read_bytes()
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_build_error(jobs, project, tmp_path):
+    os.remove(tmp_path / 'deploy' / 'b.sql')
+
+    with pytest.raises(BuildError) as excinfo:
+        write_extension(project, str(tmp_path / 'ext'), None, jobs=jobs)
+
+    assert excinfo.value.filename == 'test--0.1--0.2.sql'
+    assert isinstance(excinfo.value.cause, FileNotFoundError)
+
+
+def test_failed_build_leaves_dest_unchanged(project, tmp_path):
+    dest = tmp_path / 'ext'
+    before = build(project, dest)
+
+    (tmp_path / 'deploy' / 'a.sql').write_text("SELECT 'a3';\n")
+    os.remove(tmp_path / 'deploy' / 'b.sql')
+
+    with pytest.raises(BuildError):
+        build(project, dest, force=True)
+
+    assert sorted(os.listdir(dest)) == sorted(before)
+    assert "'a2'" in (dest / 'test--0.2--HEAD.sql').read_text()
+
+
+def test_durable(project, tmp_path):
+    dest = tmp_path / 'ext'
+    build(project, dest, durable=True)
+
+    assert sorted(os.listdir(dest)) == [
+        '.test.pgxsq.json',
+        'test--0.1--0.2.sql',
+        'test--0.1.sql',
+        'test--0.2--HEAD.sql',
+        'test.control',
+    ]
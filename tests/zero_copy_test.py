@@ -0,0 +1,207 @@
+import errno
+import os
+
+import pytest
+
+import pgxsq
+from pgxsq import (
+    Change, Project, Substitution, build, strip_transactions, write_extension,
+)
+
+
+SCRIPTS = [
+    "BEGIN;\nSELECT 'a';\nCOMMIT;\n",
+    "  BEGIN;  \n\tSELECT 1; COMMIT;\nSELECT 2;\n",
+    "SELECT $$\nBEGIN;\n$$;\n/* BEGIN; */ COMMIT; -- x\nEND;",
+    "SELECT 'größe', \"@ext\";\nSTART TRANSACTION;\nSELECT @ext;\n",
+    "CREATE FUNCTION f() RETURNS int LANGUAGE sql\n"
+    "BEGIN ATOMIC\n  SELECT 1;\nEND;\nCOMMIT;\n",
+    "COPY t FROM stdin;\n" + "1\tBEGIN;\n" * 1000 + "\\.\nCOMMIT;\n",
+]
+
+
+def project(tmp_path, script):
+    deploy = tmp_path / 'deploy'
+    deploy.mkdir(exist_ok=True)
+    (deploy / 'a.sql').write_bytes(script.encode())
+    return Project('test', [Change('a', [])], str(deploy))
+
+
+def read_parts(parts):
+    content = b''
+    for part in parts:
+        if isinstance(part, pgxsq._Extent):
+            with open(part.path, 'rb') as fp:
+                fp.seek(part.start)
+                content += fp.read(part.end - part.start)
+        else:
+            content += part
+    return content
+
+
+@pytest.fixture(autouse=True)
+def zero_copy_min(monkeypatch):
+    monkeypatch.setattr(pgxsq, '_ZERO_COPY_MIN', 0)
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_zero_copy_parts(tmp_path, script):
+    p = project(tmp_path, script)
+    placeholders = Substitution({'@ext': 'X', 'SELECT 1': 'SELECT 42'})\
+        .encode('utf-8')
+    parts = pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), placeholders,
+    )
+
+    assert parts is not None
+    assert read_parts(parts) == placeholders(p.read_deploy_script('a', ''))
+
+
+@pytest.mark.parametrize('script', [
+    b"SELECT 1;\r\nCOMMIT;\r\n",
+    b"SELECT '\xff';\n",
+    b"\xef\xbb\xbfBEGIN;\nSELECT 1;\n",
+])
+def test_zero_copy_parts_bytes(tmp_path, script):
+    p = project(tmp_path, '')
+    (tmp_path / 'deploy' / 'a.sql').write_bytes(script)
+    parts = pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), Substitution({}),
+    )
+
+    assert parts is not None
+    assert read_parts(parts) == p.read_deploy_script('a', '')
+
+
+def test_zero_copy_parts_validate(tmp_path):
+    p = project(tmp_path, '')
+    (tmp_path / 'deploy' / 'a.sql').write_bytes(b"SELECT 1;\nSELECT '\xff';\n")
+
+    with pytest.raises(ValueError, match=r"invalid utf-8 at byte 18"):
+        pgxsq._zero_copy_parts(
+            p.deploy_script_path('a', ''), Substitution({}), validate=True,
+        )
+
+
+@pytest.mark.parametrize('script', SCRIPTS)
+def test_write_extension(tmp_path, script):
+    p = project(tmp_path, script)
+    stats = pgxsq.BuildStats()
+    write_extension(p, str(tmp_path / 'ext'), '@ext', stats=stats)
+
+    assert (tmp_path / 'ext' / 'test--HEAD.sql').read_bytes() == \
+        build(p, extschema='@ext')['test--HEAD.sql']
+    assert stats.counters['scripts_zero_copy'] == 1
+
+
+@pytest.mark.parametrize('script, placeholders, skip_comments', [
+    (b"SELECT 1; -- @x\n", {'@x': 'y'}, True),
+    (b"SELECT 1;BEGIN;\nSELECT 2;\n", {';\nSEL': 'x'}, False),
+])
+def test_fallback(tmp_path, script, placeholders, skip_comments):
+    p = project(tmp_path, '')
+    (tmp_path / 'deploy' / 'a.sql').write_bytes(script)
+    placeholders = Substitution(placeholders, skip_comments).encode('utf-8')
+
+    assert pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), placeholders,
+    ) is None
+
+
+def test_zero_copy_parts_empty(tmp_path):
+    p = project(tmp_path, '')
+    stats = pgxsq.BuildStats()
+    parts = pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), Substitution({}), stats,
+    )
+
+    assert list(parts) == []
+    assert stats.counters['scripts_zero_copy'] == 1
+
+
+@pytest.mark.parametrize('size', [4, 1 << 20])
+def test_zero_copy_parts_without_keywords(monkeypatch, tmp_path, size):
+    def fail(self, chunk):
+        raise AssertionError("tokenized")
+
+    monkeypatch.setattr(pgxsq, '_BUFSIZE', size)
+    monkeypatch.setattr(pgxsq._TransactionStripper, 'feed', fail)
+    script = "SELECT 'a'; -- beginning\nSELECT $$ENDS$$;\n"
+    p = project(tmp_path, script)
+    parts = pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), Substitution({}), validate=True,
+    )
+
+    assert read_parts(parts) == script.encode()
+
+
+def test_zero_copy_parts_keyword_across_chunks(monkeypatch, tmp_path):
+    monkeypatch.setattr(pgxsq, '_BUFSIZE', 4)
+    p = project(tmp_path, "SELECT 1;\nCOMMIT;\n")
+    parts = pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), Substitution({}),
+    )
+
+    assert read_parts(parts) == b"SELECT 1;\n"
+
+
+def test_small_scripts(monkeypatch, tmp_path):
+    monkeypatch.setattr(pgxsq, '_ZERO_COPY_MIN', 1 << 20)
+    p = project(tmp_path, SCRIPTS[0])
+
+    assert pgxsq._zero_copy_parts(
+        p.deploy_script_path('a', ''), Substitution({}),
+    ) is None
+
+
+@pytest.mark.parametrize('unsupported', [
+    [],
+    ['copy_file_range'],
+    ['copy_file_range', 'sendfile'],
+])
+def test_copy_extent(monkeypatch, tmp_path, unsupported):
+    def fail(*args):
+        raise OSError(errno.EXDEV, 'unsupported')
+
+    for name in unsupported:
+        monkeypatch.setattr(os, name, fail, raising=False)
+
+    (tmp_path / 'src').write_bytes(bytes(range(256)) * 100)
+
+    with open(tmp_path / 'src', 'rb') as src, \
+            open(tmp_path / 'dst', 'wb') as dst:
+        dst.write(b'head')
+        dst.flush()
+        pgxsq._copy_extent(src.fileno(), dst.fileno(), 10, 20000)
+
+    assert (tmp_path / 'dst').read_bytes() == \
+        b'head' + (bytes(range(256)) * 100)[10:20000]
+
+
+@pytest.mark.parametrize('bufsize', [1 << 20, 7])
+def test_zero_copy_parts_random(monkeypatch, tmp_path, bufsize):
+    import random
+
+    fragments = [
+        "BEGIN;", "COMMIT;", " ", "\t", "\n", "SELECT 1;", "'", '"', "$$",
+        "--", "/*", "*/", "END", ";", "x", "E'\\'", "START TRANSACTION",
+        "COPY t FROM stdin;", "\\.\n", "$fn$",
+        "CREATE FUNCTION f() BEGIN ATOMIC", "INSERT INTO t VALUES (1, 'a');",
+    ]
+    rng = random.Random(0)
+    p = project(tmp_path, '')
+    path = p.deploy_script_path('a', '')
+    placeholders = Substitution({})
+
+    # Scan the script in small windows.
+    monkeypatch.setattr(pgxsq, '_BUFSIZE', bufsize)
+
+    for _ in range(500):
+        script = ''.join(rng.choices(fragments, k=rng.randrange(1, 30)))
+        with open(path, 'w') as fp:
+            fp.write(script)
+
+        parts = pgxsq._zero_copy_parts(path, placeholders)
+
+        assert read_parts(parts) == \
+            b''.join(strip_transactions([script.encode()])), script